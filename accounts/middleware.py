@@ -1,15 +1,15 @@
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
 
 
-class UserToMemberMiddleware(object):
+class UserToMemberMiddleware(MiddlewareMixin):
 	"""
 	This middleware filters every request, and updates the request to include
 	the Unigames member object, if there is one.
+	MiddlewareMixin runs process_request in a thread for async requests, since it queries the database.
 	"""
-
-	def __init__(self, get_response):
-		self.get_response = get_response
 	
-	def __call__(self, request):
+	def process_request(self, request):
 		if request.user.is_authenticated:
 			unigames_member = request.user.get_member
 			if unigames_member is not None:
@@ -22,5 +22,24 @@ class UserToMemberMiddleware(object):
 			request.is_unigames_member = False
 			request.unigames_member = None
 
-		response = self.get_response(request)
+
+LOGGED_IN_COOKIE_NAME = "logged_in"
+
+
+class LoggedInCookieMiddleware(MiddlewareMixin):
+	"""
+	This middleware keeps a cookie that tells JavaScript whether the user is logged in.
+	The session cookie can't be read from JavaScript, but pre-rendered pages need to know
+	whether to fetch the user's navbar. The cookie contains nothing sensitive.
+	"""
+	
+	def process_response(self, request, response):
+		has_cookie = LOGGED_IN_COOKIE_NAME in request.COOKIES
+		if request.user.is_authenticated and not has_cookie:
+			response.set_cookie(
+				LOGGED_IN_COOKIE_NAME, "1", max_age=settings.SESSION_COOKIE_AGE, samesite="Lax",
+				secure=settings.SESSION_COOKIE_SECURE
+			)
+		elif not request.user.is_authenticated and has_cookie:
+			response.delete_cookie(LOGGED_IN_COOKIE_NAME, samesite="Lax")
 		return response
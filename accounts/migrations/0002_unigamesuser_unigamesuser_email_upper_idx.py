@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-19 07:18
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='unigamesuser',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='unigamesuser_email_upper_idx'),
+        ),
+    ]
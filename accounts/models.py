@@ -1,6 +1,7 @@
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Upper
 
 
 def create_fresh_unigames_user(email_address):
@@ -17,7 +18,11 @@ def create_fresh_unigames_user(email_address):
 
 
 class UnigamesUser(AbstractUser):
-	pass
+	class Meta(AbstractUser.Meta):
+		indexes = [
+			# Email lookups ignore case (email__iexact compares UPPER(email)).
+			models.Index(Upper("email"), name="unigamesuser_email_upper_idx"),
+		]
 	
 	def __str__(self):
 		try:
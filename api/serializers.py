@@ -0,0 +1,103 @@
+from django.db.models import Count
+from django.urls import reverse
+
+from library.models import prefetch_item_types
+
+
+class Serializer:
+	"""
+	Turns model instances into JSON-friendly dicts, with only the fields that were asked for.
+	
+	fields maps each field name to a function that takes an instance and returns the value.
+	Fields that need related objects list what to prefetch (or annotate) in field_prefetches,
+	so that a whole page of results always takes the same number of queries, no matter how big it is.
+	"""
+	fields = {}
+	default_fields = []
+	field_prefetches = {}
+	field_annotations = {}
+	
+	def parse_fields(self, value):
+		"""
+		Parses the "fields" query parameter (a comma separated list of field names).
+		Raises ValueError if any of them aren't fields.
+		"""
+		if not value:
+			return list(self.default_fields)
+		fields = [field.strip() for field in value.split(",") if field.strip()]
+		unknown_fields = [field for field in fields if field not in self.fields]
+		if unknown_fields:
+			raise ValueError(
+				f"Unknown fields: {', '.join(unknown_fields)}. Available fields: {', '.join(self.fields)}."
+			)
+		return fields
+	
+	def prepare_queryset(self, queryset, fields):
+		for field in fields:
+			if field in self.field_prefetches:
+				queryset = self.field_prefetches[field](queryset)
+			if field in self.field_annotations:
+				queryset = queryset.annotate(**self.field_annotations[field])
+		return queryset
+	
+	def serialize(self, instance, fields):
+		return {field: self.fields[field](instance) for field in fields}
+
+
+def get_tag_slugs(item):
+	# base_tags and computed_tags are prefetched, so this doesn't query.
+	tags = {tag.slug: tag for tag in [*item.base_tags.all(), *item.computed_tags.all()]}
+	return sorted(
+		slug for slug, tag in tags.items()
+		if not (tag.is_item_type or tag.is_tag_category or tag.name.startswith("Item: "))
+	)
+
+
+def get_image_urls(item):
+	if not item.image:
+		return None
+	return {"original": item.image.url, "thumbnail": item.get_thumbnail_url()}
+
+
+class ItemSerializer(Serializer):
+	fields = {
+		"id": lambda item: item.pk,
+		"name": lambda item: item.name,
+		"slug": lambda item: item.slug,
+		"url": lambda item: reverse("library:item_detail", kwargs={"slug": item.slug}),
+		"type": lambda item: [tagged_item.tag.get_raw_name() for tagged_item in item.item_type_tagged_items],
+		"tags": get_tag_slugs,
+		"description": lambda item: item.description,
+		"players": lambda item: {"min": item.min_players, "max": item.max_players},
+		"play_time": lambda item: {
+			"min": item.min_play_time, "max": item.max_play_time, "average": item.average_play_time
+		},
+		"is_borrowable": lambda item: item.is_borrowable,
+		"is_high_demand": lambda item: item.is_high_demand,
+		"image": get_image_urls,
+	}
+	default_fields = ["id", "name", "slug", "url", "type", "image"]
+	field_prefetches = {
+		"type": prefetch_item_types,
+		"tags": lambda queryset: queryset.prefetch_related("base_tags", "computed_tags"),
+	}
+
+
+class TagSerializer(Serializer):
+	fields = {
+		"id": lambda tag: tag.pk,
+		"name": lambda tag: tag.get_raw_name(),
+		"slug": lambda tag: tag.slug,
+		"url": lambda tag: reverse("library:tag_detail", kwargs={"slug": tag.slug}),
+		"is_item_type": lambda tag: tag.is_item_type,
+		"is_tag_category": lambda tag: tag.is_tag_category,
+		"item_count": lambda tag: tag.item_count,
+		"parents": lambda tag: sorted(parent.slug for parent in tag.parents.all()),
+	}
+	default_fields = ["id", "name", "slug", "url", "item_count"]
+	field_prefetches = {
+		"parents": lambda queryset: queryset.prefetch_related("parents"),
+	}
+	field_annotations = {
+		"item_count": {"item_count": Count("computed_items", distinct=True)},
+	}
@@ -0,0 +1,168 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.views import APIView, KeysetListAPIView
+from library.factories import ItemFactory, LibraryTagFactory
+from library.tasks import rebuild_availability_calendars_task
+
+
+class CatalogueAPITests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.items = ItemFactory.create_batch(30, image="library/item_images/test.png")
+		self.tag = LibraryTagFactory(name="Dice")
+		self.item_type = LibraryTagFactory(name="Item Type: Board Game", is_item_type=True)
+		for item in self.items[:10]:
+			item.base_tags.add(self.tag, self.item_type)
+			# Saving works out the computed tags.
+			item.save()
+	
+	def get_json(self, url, data=None, **kwargs):
+		response = self.client.get(url, data, **kwargs)
+		self.assertEqual(response["Content-Type"], "application/json")
+		return response, response.json()
+	
+	def test_item_list_pages(self):
+		url = reverse("api:item_list")
+		names = []
+		response, data = self.get_json(url, {"limit": 7})
+		self.assertIsNone(data["previous"])
+		self.assertEqual(data["approximate_count"], 30)
+		while True:
+			self.assertEqual(response.status_code, 200)
+			self.assertLessEqual(len(data["results"]), 7)
+			names.extend(result["name"] for result in data["results"])
+			if data["next"] is None:
+				break
+			response, data = self.get_json(data["next"])
+		self.assertEqual(names, sorted(item.name for item in self.items))
+		self.assertIsNotNone(data["previous"])
+	
+	def test_query_count_does_not_depend_on_page_size(self):
+		url = reverse("api:item_list")
+		fields = "id,name,type,tags,image,players"
+		query_counts = []
+		for limit in (1, 5, 30):
+			cache.clear()
+			with CaptureQueriesContext(connection) as queries:
+				response = self.client.get(url, {"limit": limit, "fields": fields})
+			self.assertEqual(len(response.json()["results"]), limit)
+			query_counts.append(len(queries))
+		self.assertEqual(len(set(query_counts)), 1, query_counts)
+	
+	def test_sparse_fields(self):
+		item = self.items[0]
+		response, data = self.get_json(
+			reverse("api:item_detail", kwargs={"slug": item.slug}), {"fields": "name,type,tags"}
+		)
+		self.assertEqual(data, {"name": item.name, "type": ["Board Game"], "tags": ["dice"]})
+		
+		response, data = self.get_json(reverse("api:item_list"), {"fields": "name,colour"})
+		self.assertEqual(response.status_code, 400)
+		self.assertIn("colour", data["error"])
+		
+		response, data = self.get_json(reverse("api:item_list"), {"limit": 1000})
+		self.assertEqual(response.status_code, 400)
+	
+	def test_search(self):
+		response, data = self.get_json(reverse("api:item_list"), {"q": "tag:dice", "fields": "name"})
+		self.assertEqual(
+			[result["name"] for result in data["results"]], sorted(item.name for item in self.items[:10])
+		)
+		response, data = self.get_json(reverse("api:item_list"), {"q": "tag:nonexistent-tag"})
+		self.assertEqual(response.status_code, 400)
+		self.assertIn("error", data)
+	
+	def test_not_modified_with_one_query(self):
+		url = reverse("api:item_list")
+		response = self.client.get(url)
+		self.assertIn("public", response["Cache-Control"])
+		with self.assertNumQueries(1):
+			not_modified = self.client.get(url, headers={"If-None-Match": response["ETag"]})
+		self.assertEqual(not_modified.status_code, 304)
+		with self.assertNumQueries(1):
+			not_modified = self.client.get(url, headers={"If-Modified-Since": response["Last-Modified"]})
+		self.assertEqual(not_modified.status_code, 304)
+		# The ETag comes from the data, so it's the same whichever worker answers, even with an empty cache.
+		cache.clear()
+		self.assertEqual(self.client.get(url)["ETag"], response["ETag"])
+		
+		# Changing the catalogue changes the ETag.
+		self.items[0].save()
+		self.assertEqual(self.client.get(url, headers={"If-None-Match": response["ETag"]}).status_code, 200)
+		# So does asking for something else.
+		other_response = self.client.get(url, {"limit": 5})
+		self.assertNotEqual(other_response["ETag"], self.client.get(url)["ETag"])
+	
+	def test_etag_changes_with_tags(self):
+		tag_list_url = reverse("api:tag_list")
+		item_url = reverse("api:item_detail", kwargs={"slug": self.items[0].slug})
+		tag_list_etag = self.client.get(tag_list_url)["ETag"]
+		item_etag = self.client.get(item_url)["ETag"]
+		# Tags show their parents.
+		parent = LibraryTagFactory(name="Games With Dice")
+		tag_list_etag = self.client.get(tag_list_url)["ETag"]
+		self.tag.parents.add(parent)
+		self.assertNotEqual(self.client.get(tag_list_url)["ETag"], tag_list_etag)
+		# Items show their computed tags.
+		self.items[0].computed_tags.add(parent)
+		self.assertNotEqual(self.client.get(item_url)["ETag"], item_etag)
+		self.assertIn("games-with-dice", self.client.get(item_url, {"fields": "tags"}).json()["tags"])
+		
+		# Deleting a tag with nothing attached to it still changes the tag list.
+		tag_list_etag = self.client.get(tag_list_url)["ETag"]
+		LibraryTagFactory(name="Unused").delete()
+		self.assertEqual(self.client.get(tag_list_url, headers={"If-None-Match": tag_list_etag}).status_code, 304)
+		unused = LibraryTagFactory(name="Unused")
+		tag_list_etag = self.client.get(tag_list_url)["ETag"]
+		unused.delete()
+		self.assertNotEqual(self.client.get(tag_list_url)["ETag"], tag_list_etag)
+	
+	def test_tags(self):
+		response, data = self.get_json(reverse("api:tag_list"), {"fields": "slug,item_count,is_item_type"})
+		self.assertIn({"slug": "dice", "item_count": 10, "is_item_type": False}, data["results"])
+		# Each item's own tag is left out.
+		self.assertEqual(len(data["results"]), 2)
+	
+	def test_availability(self):
+		url = reverse("api:item_availability", kwargs={"slug": self.items[0].slug})
+		response, data = self.get_json(url)
+		self.assertTrue(data["available_to_borrow"])
+		self.assertEqual(self.client.get(url, headers={"If-None-Match": response["ETag"]}).status_code, 304)
+		response = self.client.get(reverse("api:item_availability", kwargs={"slug": "no-such-item"}))
+		self.assertEqual(response.status_code, 404)
+
+	def test_availability_calendars(self):
+		url = reverse("api:availability_calendar")
+		item_ids = ",".join(str(item.pk) for item in self.items[:20])
+		# The first read finds the calendars haven't been built yet, and has them stored in the background.
+		with patch.object(rebuild_availability_calendars_task, "delay", rebuild_availability_calendars_task):
+			with self.captureOnCommitCallbacks(execute=True):
+				self.get_json(url, {"items": item_ids})
+		# Once they're stored, reading them is a single query, however many items there are.
+		with self.assertNumQueries(1):
+			response, data = self.get_json(url, {"items": item_ids, "days": 14})
+		self.assertEqual(len(data["items"]), 20)
+		self.assertEqual(data["items"][str(self.items[0].pk)], "0" * 14)
+		
+		self.assertEqual(self.client.get(url, {"items": "1,x"}).status_code, 400)
+		self.assertEqual(self.client.get(url, {"items": item_ids, "days": 1000}).status_code, 400)
+
+
+class APIViewDefinitionTests(SimpleTestCase):
+	def test_missing_hooks_fail_at_definition(self):
+		with self.assertRaisesMessage(ImproperlyConfigured, "must implement get_data, get_validator_queryset"):
+			class NoHooksAPIView(APIView):
+				pass
+		with self.assertRaisesMessage(ImproperlyConfigured, "must set model"):
+			class NoModelAPIView(KeysetListAPIView):
+				pass
+		# Abstract bases leave their hooks to subclasses.
+		class AbstractAPIView(APIView):
+			abstract = True
@@ -0,0 +1,14 @@
+from django.urls import path
+
+from api.views import (
+	AvailabilityCalendarAPIView, ItemAvailabilityAPIView, ItemDetailAPIView, ItemListAPIView, TagListAPIView
+)
+
+app_name = "api"
+urlpatterns = [
+	path("items/", ItemListAPIView.as_view(), name="item_list"),
+	path("items/<slug:slug>/", ItemDetailAPIView.as_view(), name="item_detail"),
+	path("items/<slug:slug>/availability/", ItemAvailabilityAPIView.as_view(), name="item_availability"),
+	path("tags/", TagListAPIView.as_view(), name="tag_list"),
+	path("availability/", AvailabilityCalendarAPIView.as_view(), name="availability_calendar"),
+]
@@ -0,0 +1,310 @@
+"""
+	A read-only JSON API for the library catalogue. See templates/pages/api.html for the documentation.
+
+	Everything the catalogue endpoints return is covered by Item.updated_at or LibraryTag.updated_at,
+	which are kept up to date when anything shown about them changes, including their tags (see library/signals.py).
+	So the ETag and Last-Modified of a response are worked out from the newest updated_at (and the number of rows,
+	to catch deletions) of the rows it's drawn from, in a single aggregate query. A client that already has
+	the current version gets a 304 without running any of the other queries.
+"""
+import hashlib
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views import View
+
+from api.serializers import ItemSerializer, TagSerializer
+from library.availability import CALENDAR_DAYS, get_availability_calendars
+from library.models import Item, LibraryTag
+from library.search import SearchQueryManager
+from phylactery.db_routing import ReplicaReadsMixin
+from phylactery.pagination import KeysetPaginator
+
+
+API_VERSION = "v1"
+
+
+class APIError(Exception):
+	"""
+	Raised by API views to return an error response, e.g. for a bad query parameter.
+	"""
+	def __init__(self, message, status=400):
+		super().__init__(message)
+		self.message = message
+		self.status = status
+
+
+class APIView(ReplicaReadsMixin, View):
+	"""
+	Base view for the API. Only allows GET (and HEAD).
+	
+	Views implement the hooks named in required_hooks:
+		get_data(), which returns something that can be turned into JSON.
+		get_validator_queryset(), which returns the rows the data is drawn from.
+	Missing hooks are caught when the view class is defined. Base classes that leave hooks
+	to their subclasses set abstract = True.
+	"""
+	http_method_names = ["get", "head", "options"]
+	required_hooks = ("get_data", "get_validator_queryset")
+	
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		if cls.__dict__.get("abstract", False):
+			return
+		missing_hooks = [name for name in cls.required_hooks if getattr(cls, name) is getattr(APIView, name)]
+		if missing_hooks:
+			raise ImproperlyConfigured(f"{cls.__qualname__} must implement {', '.join(missing_hooks)}.")
+	
+	def get_validator_queryset(self):
+		# Abstract - see the class docstring.
+		raise NotImplementedError(f"{type(self).__qualname__} must implement get_validator_queryset().")
+	
+	def get_validators(self):
+		"""
+		Returns the ETag and Last-Modified time (a timestamp) of the response.
+		These are read before the data, from the same database, so that if the two disagree (e.g. a replica
+		catches up in between), the data is newer than the ETag - and the next request just fetches it again -
+		rather than old data being saved under a new ETag.
+		"""
+		row = self.get_validator_queryset().aggregate(updated_at=Max("updated_at"), count=Count("pk"))
+		updated_at = row["updated_at"]
+		version = updated_at.isoformat() if updated_at is not None else "empty"
+		key = f"{API_VERSION}:{self.request.get_full_path()}:{version}:{row['count']}"
+		etag = quote_etag(hashlib.sha256(key.encode()).hexdigest())
+		return etag, int(updated_at.timestamp()) if updated_at is not None else None
+	
+	def get_data(self):
+		# Abstract - see the class docstring.
+		raise NotImplementedError(f"{type(self).__qualname__} must implement get_data().")
+	
+	def get(self, request, *args, **kwargs):
+		etag, last_modified = self.get_validators()
+		response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+		if response is None:
+			try:
+				response = JsonResponse(self.get_data())
+			except APIError as error:
+				return self.error_response(error.message, error.status)
+		return self.finalise_response(response, etag, last_modified)
+	
+	@staticmethod
+	def finalise_response(response, etag, last_modified=None):
+		if etag is not None:
+			response.headers["ETag"] = etag
+		if last_modified is not None:
+			response.headers["Last-Modified"] = http_date(last_modified)
+		# Caches can keep responses, but must check they're still current (cheaply, with the ETag) before using them.
+		patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+		response.headers["Access-Control-Allow-Origin"] = "*"
+		return response
+	
+	@staticmethod
+	def error_response(message, status):
+		return JsonResponse({"error": message}, status=status)
+
+
+class SerializerMixin:
+	"""
+	Serializes objects with serializer_class, with the fields requested in the "fields" query parameter.
+	"""
+	serializer_class = None
+	fields_kwarg = "fields"
+	
+	def setup(self, request, *args, **kwargs):
+		super().setup(request, *args, **kwargs)
+		self.serializer = self.serializer_class()
+	
+	def get_fields(self):
+		try:
+			return self.serializer.parse_fields(self.request.GET.get(self.fields_kwarg))
+		except ValueError as error:
+			raise APIError(str(error))
+
+
+class KeysetListAPIView(SerializerMixin, APIView):
+	"""
+	Lists objects, a page at a time, with cursor pagination.
+	The number of queries doesn't depend on the page size.
+	
+	Lists every object of model, unless get_queryset() is overridden. The ETag covers the same objects.
+	"""
+	abstract = True
+	model = None
+	keyset_ordering = ["name", "id"]
+	cursor_kwarg = "cursor"
+	limit_kwarg = "limit"
+	default_limit = 24
+	max_limit = 100
+	
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		if cls.model is None and cls.get_queryset is KeysetListAPIView.get_queryset:
+			raise ImproperlyConfigured(f"{cls.__qualname__} must set model, or implement get_queryset().")
+	
+	def get_queryset(self):
+		return self.model._default_manager.all()
+	
+	def get_validator_queryset(self):
+		return self.get_queryset()
+	
+	def get_limit(self):
+		value = self.request.GET.get(self.limit_kwarg)
+		if value is None:
+			return self.default_limit
+		try:
+			limit = int(value)
+		except ValueError:
+			raise APIError(f"limit must be a whole number between 1 and {self.max_limit}.")
+		if not 1 <= limit <= self.max_limit:
+			raise APIError(f"limit must be a whole number between 1 and {self.max_limit}.")
+		return limit
+	
+	def get_page_url(self, cursor):
+		if cursor is None:
+			return None
+		params = self.request.GET.copy()
+		params[self.cursor_kwarg] = cursor
+		return self.request.build_absolute_uri(f"{self.request.path}?{params.urlencode()}")
+	
+	def get_data(self):
+		fields = self.get_fields()
+		queryset = self.serializer.prepare_queryset(self.get_queryset(), fields)
+		paginator = KeysetPaginator(queryset, self.get_limit(), self.keyset_ordering, approximate_count=True)
+		page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+		return {
+			"results": [self.serializer.serialize(obj, fields) for obj in page],
+			"next": self.get_page_url(page.next_cursor),
+			"previous": self.get_page_url(page.previous_cursor),
+			"approximate_count": paginator.approximate_count,
+		}
+
+
+class ItemListAPIView(KeysetListAPIView):
+	"""
+	Lists library items. Takes an optional search query in "q", with the same syntax as the library search.
+	"""
+	model = Item
+	serializer_class = ItemSerializer
+	
+	def get_validator_queryset(self):
+		# Searches can match any item.
+		return Item.objects.all()
+	
+	def get_queryset(self):
+		query = self.request.GET.get("q")
+		if not query:
+			return super().get_queryset()
+		manager = SearchQueryManager(query=query)
+		manager.evaluate()
+		if manager.has_errors():
+			raise APIError(" ".join(str(error) for error in manager.errors))
+		return manager.get_results()
+
+
+class TagListAPIView(KeysetListAPIView):
+	"""
+	Lists library tags, apart from each item's own tag.
+	"""
+	serializer_class = TagSerializer
+	
+	def get_queryset(self):
+		return LibraryTag.objects.exclude(name__startswith="Item: ")
+
+
+class ItemDetailAPIView(SerializerMixin, APIView):
+	"""
+	A single library item.
+	"""
+	serializer_class = ItemSerializer
+	
+	def get_validator_queryset(self):
+		return Item.objects.filter(slug=self.kwargs["slug"])
+	
+	def get_data(self):
+		fields = self.get_fields()
+		queryset = self.serializer.prepare_queryset(self.get_validator_queryset(), fields)
+		item = queryset.first()
+		if item is None:
+			raise APIError("No item found matching the query.", status=404)
+		return self.serializer.serialize(item, fields)
+
+
+class ContentETagAPIView(APIView):
+	"""
+	Base view for endpoints that change when items are borrowed and returned, not just when the catalogue changes.
+	The ETag is a hash of the response itself, so a 304 still saves sending the body, just not the queries.
+	"""
+	abstract = True
+	required_hooks = ("get_data",)
+	
+	def get(self, request, *args, **kwargs):
+		try:
+			data = self.get_data()
+		except APIError as error:
+			return self.error_response(error.message, error.status)
+		content = json.dumps(data, cls=DjangoJSONEncoder)
+		etag = quote_etag(hashlib.sha256(content.encode()).hexdigest())
+		response = get_conditional_response(request, etag=etag)
+		if response is None:
+			response = HttpResponse(content, content_type="application/json")
+		return self.finalise_response(response, etag)
+
+
+class ItemAvailabilityAPIView(ContentETagAPIView):
+	"""
+	Whether a library item can be borrowed right now, and if not, when it should be able to.
+	"""
+	
+	def get_data(self):
+		item = Item.objects.filter(slug=self.kwargs["slug"]).first()
+		if item is None:
+			raise APIError("No item found matching the query.", status=404)
+		return {"slug": item.slug, **item.get_availability_info()}
+
+
+class AvailabilityCalendarAPIView(ContentETagAPIView):
+	"""
+	Which days each of a batch of items is booked on, for showing availability grids.
+	Takes a comma separated list of item ids in "items", and the number of days from today in "days".
+	
+	Each item's calendar is a string with a character per day, starting today: "1" if it's booked, "0" if not.
+	"""
+	max_items = 100
+	default_days = 60
+	
+	def get_item_ids(self):
+		try:
+			item_ids = [int(item_id) for item_id in self.request.GET.get("items", "").split(",") if item_id]
+		except ValueError:
+			raise APIError("items must be a comma separated list of item ids.")
+		if not 1 <= len(item_ids) <= self.max_items:
+			raise APIError(f"Between 1 and {self.max_items} items must be given.")
+		return item_ids
+	
+	def get_days(self):
+		try:
+			days = int(self.request.GET.get("days", self.default_days))
+		except ValueError:
+			days = 0
+		if not 1 <= days <= CALENDAR_DAYS:
+			raise APIError(f"days must be a whole number between 1 and {CALENDAR_DAYS}.")
+		return days
+	
+	def get_data(self):
+		item_ids = self.get_item_ids()
+		days = self.get_days()
+		calendars = get_availability_calendars(item_ids, days)
+		return {
+			"start": timezone.localdate(),
+			"days": days,
+			"items": {
+				str(item_id): "".join("1" if booked else "0" for booked in calendar)
+				for item_id, calendar in calendars.items()
+			},
+		}
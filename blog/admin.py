@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.db import models
 from django.forms.widgets import Textarea
-from .models import MailingList, BlogPost, EmailOrder
+from .models import MailingList, BlogPost, EmailOrder, EmailDelivery
 
 
 class MarkdownWidget(Textarea):
@@ -32,6 +32,21 @@ class BlogPostAdmin(admin.ModelAdmin):
 	}
 
 
+class EmailDeliveryAdmin(admin.ModelAdmin):
+	"""
+	Read-only view of who each EmailOrder has been sent to.
+	"""
+	model = EmailDelivery
+	list_display = ["email_order", "email_address", "status", "attempts", "sent_datetime"]
+	list_filter = ["status", "email_order"]
+	readonly_fields = [
+		"email_order", "member", "email_address", "status", "attempts", "claimed_datetime", "sent_datetime"
+	]
+	
+	def has_add_permission(self, request):
+		return False
+
+
 class MailingListAdmin(admin.ModelAdmin):
 	model = MailingList
 	exclude = ["members"]
@@ -39,4 +54,5 @@ class MailingListAdmin(admin.ModelAdmin):
 
 
 admin.site.register(MailingList, MailingListAdmin)
-admin.site.register(BlogPost, BlogPostAdmin)
\ No newline at end of file
+admin.site.register(BlogPost, BlogPostAdmin)
+admin.site.register(EmailDelivery, EmailDeliveryAdmin)
\ No newline at end of file
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-19 07:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_emailorder'),
+        ('members', '0010_alter_member_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailorder',
+            name='deliveries_created',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='EmailDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email_address', models.EmailField(max_length=254)),
+                ('status', models.CharField(choices=[('?', 'Pending'), ('S', 'Sent'), ('X', 'Failed')], default='?', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('sent_datetime', models.DateTimeField(blank=True, default=None, null=True)),
+                ('email_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='blog.emailorder')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='email_deliveries', to='members.member')),
+            ],
+            options={
+                'verbose_name_plural': 'Email Deliveries',
+                'constraints': [models.UniqueConstraint(fields=('email_order', 'member'), name='unique_email_delivery_per_member')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-19 07:07
+
+from django.db import migrations, models
+from markdown2 import Markdown
+
+
+def render_existing_posts(apps, schema_editor):
+    # A frozen copy of how bodies were rendered when this migration was written,
+    # so later changes to phylactery.markdown_renderer don't change what it does.
+    renderer = Markdown(safe_mode="escape")
+    BlogPost = apps.get_model("blog", "BlogPost")
+    posts = list(BlogPost.objects.only("pk", "body"))
+    for post in posts:
+        post.body_html = str(renderer.convert(post.body)) if post.body else ""
+    BlogPost.objects.bulk_update(posts, ["body_html"], batch_size=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_emailorder_deliveries_created_emaildelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='body_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_existing_posts, migrations.RunPython.noop),
+    ]
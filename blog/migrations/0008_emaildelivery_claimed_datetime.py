@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_blogpost_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emaildelivery',
+            name='claimed_datetime',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AlterField(
+            model_name='emaildelivery',
+            name='status',
+            field=models.CharField(choices=[('?', 'Pending'), ('>', 'Sending'), ('S', 'Sent'), ('X', 'Failed')], default='?', max_length=1),
+        ),
+    ]
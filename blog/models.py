@@ -1,10 +1,12 @@
-from django.db import models
-from django.db.models import Case, When, Value
+from django.db import models, transaction
+from django.db.models import Case, When, Value, Min, Q
 from django.db.models.functions import Now
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.safestring import mark_safe
 
 from members.models import Member
+from phylactery.markdown_renderer import render_markdown_to_html
 
 
 class BlogPostManager(models.Manager):
@@ -25,6 +27,14 @@ class BlogPostManager(models.Manager):
 				output_field=models.BooleanField()
 			)
 		)
+	
+	def get_next_publish_on(self):
+		"""
+		Returns the time that the next scheduled post will be published, or None if there isn't one.
+		"""
+		return super().get_queryset().filter(
+			publish_on__gt=Now()
+		).aggregate(next_publish_on=Min("publish_on"))["next_publish_on"]
 
 
 class BlogPost(models.Model):
@@ -64,10 +74,34 @@ class BlogPost(models.Model):
 		blank=True,
 		help_text="The body of the post. Markdown enabled."
 	)
+	# The body, pre-rendered from Markdown into HTML whenever the post is saved.
+	body_html = models.TextField(
+		blank=True,
+		editable=False,
+	)
+	# When the post was last edited. Used for conditional GETs of the post's page.
+	updated_at = models.DateTimeField(auto_now=True)
 	
 	# Apply custom manager above
 	objects = BlogPostManager()
 	
+	def save(self, *args, **kwargs):
+		# Re-render the body every time the post is saved, so that viewing the post doesn't have to.
+		self.body_html = render_markdown_to_html(self.body)
+		if "update_fields" in kwargs and kwargs["update_fields"] is not None and "body" in kwargs["update_fields"]:
+			kwargs["update_fields"] = {*kwargs["update_fields"], "body_html"}
+		super().save(*args, **kwargs)
+	
+	@property
+	def rendered_body(self):
+		"""
+		Returns the body of the post as HTML.
+		Falls back to rendering it now, if it hasn't been pre-rendered.
+		"""
+		if self.body and not self.body_html:
+			return mark_safe(render_markdown_to_html(self.body))
+		return mark_safe(self.body_html)
+	
 	@property
 	def is_published(self) -> bool:
 		"""
@@ -153,7 +187,8 @@ class EmailOrder(models.Model):
 	If it finds any EmailOrders that:
 		- aren't completed
 		- are linked to a BlogPost that is published
-	Then it will send out that post as an Email to all selecting MailingLists.
+	Then it will create an EmailDelivery for each Member it should go to,
+	and send them out in batches.
 	"""
 	
 	# The BlogPost to email
@@ -163,28 +198,133 @@ class EmailOrder(models.Model):
 	# If no lists are sent, then it will send to all members.
 	mailing_lists = models.ManyToManyField(MailingList, related_name="email_orders")
 	
+	# Have the EmailDeliveries for this order been created?
+	deliveries_created = models.BooleanField(default=False)
+	
 	# Has this been done?
 	email_sent = models.BooleanField(default=False)
 	
 	@property
 	def is_ready(self):
 		# Returns True if the linked BlogPost is published,
-		# there are members to send it to, and we haven't
-		# done this already.
-		return (
-			self.email_sent is False
-			and self.blog_post.is_published is True
-			and self.get_members_to_send_to().count() != 0
-		)
+		# and we haven't done this already.
+		# Whether there is anyone left to send it to is up to its EmailDeliveries.
+		return self.email_sent is False and self.blog_post.is_published is True
+	
+	def finalise(self):
+		"""
+		Marks the order as sent if none of its EmailDeliveries are still pending or being sent -
+		including when it never had anyone to send to.
+		Returns True if it was marked as sent.
+		"""
+		if self.deliveries.filter(status__in=[EmailDeliveryStatus.PENDING, EmailDeliveryStatus.SENDING]).exists():
+			return False
+		EmailOrder.objects.filter(pk=self.pk).update(email_sent=True)
+		self.email_sent = True
+		return True
 	
 	def get_members_to_send_to(self):
 		# Returns a QuerySet of Members that emails should be sent to.
-		if self.mailing_lists.count() == 0:
+		if not self.mailing_lists.exists():
 			# Send this email to all Members that have opted in to emails.
 			qs = Member.objects.filter(optional_emails=True)
 		else:
-			qs = Member.objects.filter(mailing_lists__email_orders=self, optional_emails=True)
+			# Members can be in more than one of the mailing lists, but should only get one email.
+			qs = Member.objects.filter(mailing_lists__email_orders=self, optional_emails=True).distinct()
 		return qs
 	
+	def create_deliveries(self):
+		"""
+		Creates an EmailDelivery for each Member that this order should be sent to, in bulk.
+		Members without a linked user have no email address, and are skipped.
+		This is safe to call more than once - existing deliveries are left alone.
+		"""
+		recipients = self.get_members_to_send_to().filter(user__isnull=False).values_list("pk", "user__email")
+		EmailDelivery.objects.bulk_create(
+			[
+				EmailDelivery(email_order=self, member_id=member_pk, email_address=email_address)
+				for member_pk, email_address in recipients
+			],
+			batch_size=1000,
+			ignore_conflicts=True,
+		)
+		self.deliveries_created = True
+		self.save(update_fields=["deliveries_created"])
+	
 	def __str__(self):
 		return f"Email Order for {self.blog_post.title}"
+
+
+class EmailDeliveryStatus(models.TextChoices):
+	PENDING = "?", "Pending"
+	SENDING = ">", "Sending"
+	SENT = "S", "Sent"
+	FAILED = "X", "Failed"
+
+
+class EmailDeliveryManager(models.Manager):
+	"""
+	Custom manager for EmailDeliveries.
+	"""
+	def claim_batch(self, email_order, batch_size, claim_timeout, max_attempts, after_pk=0):
+		"""
+		Claims up to batch_size deliveries of the given EmailOrder for sending, with primary keys greater than after_pk.
+		They are marked as sending, in a short transaction of their own, so no locks are held while they are sent.
+		Deliveries already being claimed by another worker are skipped, so several workers
+		can send the same order without sending anyone a duplicate.
+		
+		Deliveries that have been sending for longer than claim_timeout (a timedelta) belonged to a worker
+		that died part-way, and are claimed again - unless they've already been claimed max_attempts times,
+		in which case they're marked as failed.
+		Returns the claimed deliveries, which all have the same claimed_datetime.
+		"""
+		now = timezone.now()
+		expired = Q(status=EmailDeliveryStatus.SENDING, claimed_datetime__lt=now - claim_timeout)
+		with transaction.atomic():
+			self.filter(expired, email_order=email_order, attempts__gte=max_attempts).update(
+				status=EmailDeliveryStatus.FAILED
+			)
+			deliveries = list(
+				self.filter(
+					Q(status=EmailDeliveryStatus.PENDING) | expired,
+					email_order=email_order,
+					pk__gt=after_pk,
+				).select_for_update(skip_locked=True).order_by("pk")[:batch_size]
+			)
+			for delivery in deliveries:
+				delivery.status = EmailDeliveryStatus.SENDING
+				delivery.claimed_datetime = now
+				delivery.attempts += 1
+			self.bulk_update(deliveries, ["status", "claimed_datetime", "attempts"])
+		return deliveries
+
+
+class EmailDelivery(models.Model):
+	"""
+	Tracks the sending of one EmailOrder to one Member.
+	Lets a send that was interrupted part-way pick up where it left off.
+	"""
+	email_order = models.ForeignKey(EmailOrder, on_delete=models.CASCADE, related_name="deliveries")
+	member = models.ForeignKey("members.Member", on_delete=models.CASCADE, related_name="email_deliveries")
+	
+	# The email address at the time the delivery was created.
+	email_address = models.EmailField()
+	
+	status = models.CharField(
+		max_length=1, choices=EmailDeliveryStatus.choices, default=EmailDeliveryStatus.PENDING
+	)
+	attempts = models.PositiveSmallIntegerField(default=0)
+	# When a worker last claimed it for sending.
+	claimed_datetime = models.DateTimeField(blank=True, null=True, default=None)
+	sent_datetime = models.DateTimeField(blank=True, null=True, default=None)
+	
+	objects = EmailDeliveryManager()
+	
+	class Meta:
+		verbose_name_plural = "Email Deliveries"
+		constraints = [
+			models.UniqueConstraint(fields=["email_order", "member"], name="unique_email_delivery_per_member"),
+		]
+	
+	def __str__(self):
+		return f"{self.email_order} to {self.email_address} ({self.get_status_display()})"
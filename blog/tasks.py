@@ -1,60 +1,175 @@
+import time
+from datetime import timedelta
+
 from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.utils import timezone
+
+from blog.models import EmailOrder, EmailDelivery, EmailDeliveryStatus
+from phylactery.communication.email import render_html_email, send_email_batch, send_single_email_task
+
+logger = get_task_logger(__name__)
 
-from blog.models import EmailOrder
-from phylactery.communication.email import render_html_email, send_single_email_task
+
+def render_email_order(order):
+	"""
+	Renders the email for an EmailOrder once, so that it can be sent to all of its recipients.
+	Returns the subject, plaintext message, and html message.
+	"""
+	subject = f"{order.blog_post.title} - Unigames News"
+	
+	# Make a nice string to tell the members why they are receiving the email.
+	list_names = list(order.mailing_lists.values_list("name", flat=True))
+	if len(list_names) == 0:
+		reason = "This message was sent to all Unigames members \nthat have 'Optional Emails' turned on."
+	elif len(list_names) == 1:
+		reason = (
+			f"This message was sent to you because you are subscribed \nto the '{list_names[0]}' mailing list, "
+			f"and have 'Optional Emails' turned on."
+		)
+	else:
+		reason = (
+			f"This message was sent to you because you have 'Optional Emails' turned on, \n"
+			f"and are subscribed to one or more of these mailing lists: \n{', '.join(list_names)}"
+		)
+	
+	context = {
+		"blogpost": order.blog_post,
+		"reason": reason,
+	}
+	
+	plaintext_message, html_message = render_html_email(
+		template_name="blog/email/blog_post.html",
+		context=context,
+	)
+	return subject, plaintext_message, html_message
 
 
 @shared_task(name="send_pending_email_orders_task")
 def send_pending_email_orders_task():
 	"""
 	Scheduled task - every 15 minutes.
-	Checks the list of EmailOrders, and sends any that:
+	Checks the list of EmailOrders, and for any that:
 		a) Haven't been sent, and
 		b) Their BlogPost is published.
+	Creates their EmailDeliveries (if that hasn't happened yet), and dispatches them.
+	Orders that were interrupted part-way are picked up again here.
 	TODO: Send via Discord as well.
 	"""
 	
-	email_orders = EmailOrder.objects.filter(email_sent=False)
-	if email_orders.count() == 0:
+	email_orders = EmailOrder.objects.filter(email_sent=False).select_related("blog_post")
+	if not email_orders.exists():
 		# Nothing to do - stop now
 		return False
 	
 	for order in email_orders:
 		if order.is_ready:
-			subject = f"{order.blog_post.title} - Unigames News"
-			members_to_email_to = order.get_members_to_send_to()
-			
-			# Make a nice string to tell the members why they are receiving the email.
-			if order.mailing_lists.count() == 0:
-				reason = "This message was sent to all Unigames members \nthat have 'Optional Emails' turned on."
-			elif order.mailing_lists.count() == 1:
-				list_name = order.mailing_lists.first().name
-				reason = (
-					f"This message was sent to you because you are subscribed \nto the '{list_name}' mailing list, "
-					f"and have 'Optional Emails' turned on."
-				)
-			else:
-				list_names = ", ".join(order.mailing_lists.values_list("name", flat=True))
-				reason = (
-					f"This message was sent to you because you have 'Optional Emails' turned on, \n"
-					f"and are subscribed to one or more of these mailing lists: \n{list_names}"
-				)
-			
-			context = {
-				"blogpost": order.blog_post,
-				"reason": reason,
-			}
-			
-			plaintext_message, html_message = render_html_email(
-				template_name="blog/email/blog_post.html",
-				context=context,
+			if not order.deliveries_created:
+				order.create_deliveries()
+			# Orders with nobody left to send to are finished here, rather than checked again forever.
+			if not order.finalise():
+				dispatch_email_order_task.delay(email_order_pk=order.pk)
+
+
+@shared_task(name="dispatch_email_order_task", bind=True)
+def dispatch_email_order_task(self, email_order_pk):
+	"""
+	Sends the pending EmailDeliveries of an EmailOrder, in batches.
+	Each batch is claimed (marked as sending) in a short transaction before it is sent, and marked as sent
+	afterwards, so no row locks are held while talking to the mail server.
+	More than one of these tasks can work through the same order at once.
+	
+	Recipients that fail are retried individually with send_single_email_task,
+	which records how it went with record_email_delivery_task.
+	If a worker dies mid-batch, its batch stays marked as sending until EMAIL_DELIVERY_CLAIM_TIMEOUT runs out,
+	and is then sent again by a later run, until EMAIL_DELIVERY_MAX_ATTEMPTS is reached.
+	
+	Progress is reported through the task's state, so it can be checked from
+	the result backend while a large send is still in progress.
+	"""
+	order = EmailOrder.objects.select_related("blog_post").get(pk=email_order_pk)
+	if order.email_sent:
+		return False
+	subject, plaintext_message, html_message = render_email_order(order)
+	claim_timeout = timedelta(seconds=settings.EMAIL_DELIVERY_CLAIM_TIMEOUT)
+	
+	total = order.deliveries.count()
+	sent = 0
+	retried = 0
+	last_claimed_pk = 0
+	while True:
+		deliveries = EmailDelivery.objects.claim_batch(
+			email_order=order,
+			batch_size=settings.EMAIL_BATCH_SIZE,
+			claim_timeout=claim_timeout,
+			max_attempts=settings.EMAIL_DELIVERY_MAX_ATTEMPTS,
+			after_pk=last_claimed_pk,
+		)
+		if not deliveries:
+			break
+		last_claimed_pk = deliveries[-1].pk
+		
+		failed_email_addresses = set(send_email_batch(
+			[delivery.email_address for delivery in deliveries],
+			subject=subject,
+			message=plaintext_message,
+			html_message=html_message,
+		))
+		sent_pks = []
+		for delivery in deliveries:
+			if delivery.email_address not in failed_email_addresses:
+				sent_pks.append(delivery.pk)
+				continue
+			# The delivery stays claimed while it is retried, so no other run sends it as well.
+			send_single_email_task.apply_async(
+				kwargs={
+					"email_address": delivery.email_address,
+					"subject": subject,
+					"message": plaintext_message,
+					"html_message": html_message,
+				},
+				link=record_email_delivery_task.si(email_delivery_pk=delivery.pk, sent=True),
+				link_error=record_email_delivery_task.si(email_delivery_pk=delivery.pk, sent=False),
 			)
-			for member in members_to_email_to:
-				send_single_email_task.delay(
-					email_address=member.email,
-					subject=subject,
-					message=plaintext_message,
-					html_message=html_message
-				)
-			order.email_sent = True
-			order.save()
+		# Only deliveries still claimed by this run are marked,
+		# in case this run took so long that another has claimed them since.
+		EmailDelivery.objects.filter(
+			pk__in=sent_pks,
+			status=EmailDeliveryStatus.SENDING,
+			claimed_datetime=deliveries[0].claimed_datetime,
+		).update(status=EmailDeliveryStatus.SENT, sent_datetime=timezone.now())
+		sent += len(sent_pks)
+		retried += len(failed_email_addresses)
+		self.update_state(state="PROGRESS", meta={"sent": sent, "retried": retried, "total": total})
+		logger.info(f"{order}: sent {sent}/{total} emails, {retried} being retried.")
+		if len(deliveries) < settings.EMAIL_BATCH_SIZE:
+			# That was the last batch.
+			break
+		if settings.EMAIL_BATCH_DELAY:
+			time.sleep(settings.EMAIL_BATCH_DELAY)
+	
+	order.finalise()
+	return {"sent": sent, "retried": retried, "total": total}
+
+
+@shared_task(name="record_email_delivery_task")
+def record_email_delivery_task(email_delivery_pk, sent):
+	"""
+	Records whether an EmailDelivery that failed in its batch, and was retried with send_single_email_task,
+	was sent in the end - and finishes its EmailOrder if that was the last one outstanding.
+	Run once send_single_email_task has succeeded, or has run out of retries.
+	"""
+	delivery = EmailDelivery.objects.select_related("email_order").filter(
+		pk=email_delivery_pk, status=EmailDeliveryStatus.SENDING
+	).first()
+	if delivery is None:
+		return False
+	if sent:
+		delivery.status = EmailDeliveryStatus.SENT
+		delivery.sent_datetime = timezone.now()
+	else:
+		delivery.status = EmailDeliveryStatus.FAILED
+	delivery.save(update_fields=["status", "sent_datetime"])
+	delivery.email_order.finalise()
+	return True
@@ -1,3 +1,211 @@
-from django.test import TestCase
+from datetime import timedelta
+from smtplib import SMTPRecipientsRefused
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import create_fresh_unigames_user
+from members.models import Member
+from .models import BlogPost, MailingList, EmailOrder, EmailDelivery, EmailDeliveryStatus
+from .tasks import dispatch_email_order_task, record_email_delivery_task, send_pending_email_orders_task
+
+
+@override_settings(EMAIL_BATCH_SIZE=2, EMAIL_BATCH_DELAY=0)
+class EmailOrderTests(TestCase):
+	def setUp(self):
+		self.blog_post = BlogPost.objects.create(
+			title="Test Post",
+			slug_title="test-post",
+			author="Unigames Committee",
+			publish_on=timezone.now(),
+			body="Hello!",
+		)
+		self.members = [
+			Member.objects.create(
+				short_name=f"Member {n}",
+				long_name=f"Member {n}",
+				pronouns="they/them",
+				join_date=timezone.now().date(),
+				user=create_fresh_unigames_user(f"member{n}@example.com"),
+			)
+			for n in range(5)
+		]
+		# This member has no user, so no email address.
+		Member.objects.create(
+			short_name="No User",
+			long_name="No User",
+			pronouns="they/them",
+			join_date=timezone.now().date(),
+		)
+		self.list_one = MailingList.objects.create(name="One", description="", verbose_description="")
+		self.list_two = MailingList.objects.create(name="Two", description="", verbose_description="")
+		self.list_one.members.set(self.members[:3])
+		self.list_two.members.set(self.members[1:4])
+		self.order = EmailOrder.objects.create(blog_post=self.blog_post)
+		self.order.mailing_lists.set([self.list_one, self.list_two])
+
+	def test_create_deliveries_once_per_member(self):
+		self.order.create_deliveries()
+		self.order.create_deliveries()
+		self.assertTrue(self.order.deliveries_created)
+		self.assertEqual(
+			set(self.order.deliveries.values_list("email_address", flat=True)),
+			{f"member{n}@example.com" for n in range(4)}
+		)
+
+	@patch.object(dispatch_email_order_task, "update_state")
+	def test_dispatch_resumes_from_pending_deliveries(self, update_state):
+		self.order.create_deliveries()
+		# Pretend a previous run was interrupted after sending the first delivery.
+		first_delivery = self.order.deliveries.order_by("pk").first()
+		first_delivery.status = EmailDeliveryStatus.SENT
+		first_delivery.save()
+
+		result = dispatch_email_order_task(email_order_pk=self.order.pk)
+		self.assertEqual(result, {"sent": 3, "retried": 0, "total": 4})
+		self.assertEqual(len(mail.outbox), 3)
+		# One progress update per batch of 2
+		self.assertEqual(update_state.call_count, 2)
+		self.assertEqual(update_state.call_args.kwargs["meta"], {"sent": 3, "retried": 0, "total": 4})
+		self.assertNotIn([first_delivery.email_address], [message.to for message in mail.outbox])
+		self.assertFalse(EmailDelivery.objects.filter(status=EmailDeliveryStatus.PENDING).exists())
+		self.order.refresh_from_db()
+		self.assertTrue(self.order.email_sent)
+
+		# Running it again doesn't send anything.
+		self.assertFalse(dispatch_email_order_task(email_order_pk=self.order.pk))
+		self.assertEqual(len(mail.outbox), 3)
+	
+	@patch.object(dispatch_email_order_task, "update_state")
+	def test_dispatch_leaves_claimed_deliveries_until_their_claim_runs_out(self, update_state):
+		self.order.create_deliveries()
+		deliveries = list(self.order.deliveries.order_by("pk"))
+		# A worker claimed these and died before marking them - one just now, the others an hour and a half ago.
+		EmailDelivery.objects.filter(pk=deliveries[0].pk).update(
+			status=EmailDeliveryStatus.SENDING, claimed_datetime=timezone.now(), attempts=1
+		)
+		EmailDelivery.objects.filter(pk=deliveries[1].pk).update(
+			status=EmailDeliveryStatus.SENDING, claimed_datetime=timezone.now() - timedelta(minutes=90), attempts=1
+		)
+		EmailDelivery.objects.filter(pk=deliveries[2].pk).update(
+			status=EmailDeliveryStatus.SENDING, claimed_datetime=timezone.now() - timedelta(minutes=90), attempts=3
+		)
+		
+		with override_settings(EMAIL_DELIVERY_CLAIM_TIMEOUT=60 * 60, EMAIL_DELIVERY_MAX_ATTEMPTS=3):
+			result = dispatch_email_order_task(email_order_pk=self.order.pk)
+		self.assertEqual(result, {"sent": 2, "retried": 0, "total": 4})
+		self.assertEqual(
+			sorted(message.to[0] for message in mail.outbox),
+			sorted([deliveries[1].email_address, deliveries[3].email_address])
+		)
+		statuses = dict(EmailDelivery.objects.values_list("pk", "status"))
+		self.assertEqual(statuses[deliveries[0].pk], EmailDeliveryStatus.SENDING)
+		self.assertEqual(statuses[deliveries[1].pk], EmailDeliveryStatus.SENT)
+		self.assertEqual(statuses[deliveries[2].pk], EmailDeliveryStatus.FAILED)
+		# The order isn't finished while a delivery might still be on its way.
+		self.order.refresh_from_db()
+		self.assertFalse(self.order.email_sent)
+	
+	@patch.object(dispatch_email_order_task, "update_state")
+	@patch("blog.tasks.send_single_email_task.apply_async")
+	def test_failed_recipients_are_retried_individually(self, single_email_apply_async, update_state):
+		self.order.create_deliveries()
+		refused = self.order.deliveries.order_by("pk")[1]
+		original_send_messages = EmailBackend.send_messages
+		
+		def refusing_send_messages(backend, messages):
+			if messages[0].to == [refused.email_address]:
+				raise SMTPRecipientsRefused({refused.email_address: (550, b"No such user")})
+			return original_send_messages(backend, messages)
+		
+		with patch.object(EmailBackend, "send_messages", refusing_send_messages):
+			result = dispatch_email_order_task(email_order_pk=self.order.pk)
+		self.assertEqual(result, {"sent": 3, "retried": 1, "total": 4})
+		self.assertEqual(len(mail.outbox), 3)
+		single_email_apply_async.assert_called_once()
+		call_kwargs = single_email_apply_async.call_args.kwargs
+		self.assertEqual(call_kwargs["kwargs"]["email_address"], refused.email_address)
+		self.assertEqual(call_kwargs["link"], record_email_delivery_task.si(email_delivery_pk=refused.pk, sent=True))
+		self.assertEqual(call_kwargs["link_error"], record_email_delivery_task.si(email_delivery_pk=refused.pk, sent=False))
+		# The order isn't finished until the retry has finished.
+		refused.refresh_from_db()
+		self.assertEqual(refused.status, EmailDeliveryStatus.SENDING)
+		self.order.refresh_from_db()
+		self.assertFalse(self.order.email_sent)
+		
+		self.assertTrue(record_email_delivery_task(email_delivery_pk=refused.pk, sent=False))
+		refused.refresh_from_db()
+		self.assertEqual(refused.status, EmailDeliveryStatus.FAILED)
+		self.order.refresh_from_db()
+		self.assertTrue(self.order.email_sent)
+		# It's only recorded once.
+		self.assertFalse(record_email_delivery_task(email_delivery_pk=refused.pk, sent=True))
+
+	def test_order_finished_when_nobody_is_left_to_send_to(self):
+		self.order.create_deliveries()
+		# Every delivery went out, but the order wasn't marked as sent before everyone opted out of emails.
+		EmailDelivery.objects.update(status=EmailDeliveryStatus.SENT)
+		Member.objects.update(optional_emails=False)
+		self.assertTrue(self.order.is_ready)
+		with patch.object(dispatch_email_order_task, "delay") as dispatch_delay:
+			send_pending_email_orders_task()
+		dispatch_delay.assert_not_called()
+		self.order.refresh_from_db()
+		self.assertTrue(self.order.email_sent)
+	
+	def test_order_with_no_recipients_is_finished(self):
+		empty_list = MailingList.objects.create(name="Empty", description="", verbose_description="")
+		order = EmailOrder.objects.create(blog_post=self.blog_post)
+		order.mailing_lists.set([empty_list])
+		with patch.object(dispatch_email_order_task, "delay"):
+			send_pending_email_orders_task()
+		order.refresh_from_db()
+		self.assertTrue(order.deliveries_created)
+		self.assertTrue(order.email_sent)
+
+
+class BlogPostRenderingTests(TestCase):
+	def test_body_rendered_on_save(self):
+		post = BlogPost.objects.create(
+			title="Markdown Post",
+			slug_title="markdown-post",
+			author="Unigames Committee",
+			body="Some **bold** text <script>alert('hi')</script>",
+		)
+		self.assertIn("<strong>bold</strong>", post.body_html)
+		self.assertNotIn("<script>", post.body_html)
+		
+		post.body = "Now *emphasised*"
+		post.save(update_fields=["body"])
+		post.refresh_from_db()
+		self.assertIn("<em>emphasised</em>", post.body_html)
+		self.assertEqual(post.rendered_body, post.body_html)
+
+
+class BlogPostConditionalGetTests(TestCase):
+	def test_not_modified_until_edited(self):
+		post = BlogPost.objects.create(
+			title="Post",
+			slug_title="post",
+			author="Unigames Committee",
+			publish_on=timezone.now() - timedelta(days=1),
+			body="Hello!",
+		)
+		url = reverse("blog:detail", kwargs={"slug": post.slug_title})
+		response = self.client.get(url)
+		with self.assertNumQueries(1):
+			self.assertEqual(self.client.get(url, headers={"If-None-Match": response["ETag"]}).status_code, 304)
+		
+		post.body = "Hello again!"
+		post.save()
+		self.assertContains(self.client.get(url, headers={"If-None-Match": response["ETag"]}), "Hello again!")
+	
+	def test_unpublished_posts_are_not_conditional(self):
+		BlogPost.objects.create(title="Draft", slug_title="draft", author="Unigames Committee", body="Secret")
+		response = self.client.get(reverse("blog:detail", kwargs={"slug": "draft"}))
+		self.assertEqual(response.status_code, 404)
+		self.assertFalse(response.has_header("ETag"))
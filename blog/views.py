@@ -1,12 +1,25 @@
 from django.http import Http404
+from django.utils import timezone
 from django.views.generic import ListView, DetailView
 
+from phylactery.caching import AnonymousCachedViewMixin, ConditionalGetMixin
 from .models import BlogPost
 
 
-class AllBlogPostsView(ListView):
+class ExpireAtNextBlogPostMixin:
+	"""
+	Mixin for views cached with AnonymousCachedViewMixin that show the latest blog posts.
+	Expires the cached page exactly when the next scheduled post is published.
+	"""
+	
+	def get_cache_expires_at(self):
+		return BlogPost.objects.get_next_publish_on()
+
+
+class AllBlogPostsView(ExpireAtNextBlogPostMixin, AnonymousCachedViewMixin, ListView):
 	"""
 	View that shows a list of all BlogPosts.
+	Cached for anonymous users.
 	"""
 	
 	template_name = "blog/blog_list_view.html"
@@ -21,10 +34,10 @@ class AllBlogPostsView(ListView):
 		"""
 		return BlogPost.objects.filter(
 			published=True,
-		).order_by("-publish_on")
+		).defer("body", "body_html").order_by("-publish_on")
 
 
-class BlogPostDetailView(DetailView):
+class BlogPostDetailView(ConditionalGetMixin, DetailView):
 	"""
 	View to show one specific BlogPost.
 	Doesn't allow non-Committee members to see non-published posts.
@@ -33,6 +46,20 @@ class BlogPostDetailView(DetailView):
 	template_name = "blog/blog_detail_view.html"
 	slug_field = "slug_title"
 	context_object_name = "post"
+	# The post shows when it was published relative to today (e.g. "Yesterday").
+	pages_change_daily = True
+	
+	def get_last_modified(self):
+		row = BlogPost.objects.filter(slug_title=self.kwargs[self.slug_url_kwarg]).values_list(
+			"updated_at", "publish_on"
+		).first()
+		if row is None:
+			return None
+		updated_at, publish_on = row
+		if publish_on is None or publish_on > timezone.now():
+			# Unpublished posts are only shown to the committee, so don't bother.
+			return None
+		return max(updated_at, publish_on)
 	
 	def get_object(self, queryset=None):
 		# If the post that's going to be viewed isn't published yet,
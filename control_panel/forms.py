@@ -1,12 +1,17 @@
+import csv
 import datetime
+import zlib
 from dal import autocomplete
 from django import forms
 from django.contrib import messages
+from django.db import DEFAULT_DB_ALIAS
+from django.http import StreamingHttpResponse
 from django.utils.text import slugify
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Field
 from crispy_forms.bootstrap import Accordion, AccordionGroup
-from members.models import Member, Rank, RankChoices, Membership
+from members.models import Member, Rank, RankChoices, Membership, expire_ranks
+from phylactery.db_routing import get_replica_database
 from phylactery.form_fields import HTML5DateInput
 
 
@@ -19,8 +24,7 @@ def expire_active_ranks(rank_to_expire, rank_to_exclude):
 	members_to_exclude = Rank.objects.all_active().filter(rank_name=rank_to_exclude).values_list("member", flat=True)
 	ranks_to_expire = Rank.objects.all_active().filter(rank_name=rank_to_expire).exclude(member__in=members_to_exclude)
 	expired_members = list(ranks_to_expire.values_list("member__long_name", flat=True))
-	for rank in ranks_to_expire:
-		rank.set_expired()
+	expire_ranks(ranks_to_expire)
 	return expired_members
 
 
@@ -49,6 +53,7 @@ class ControlPanelForm(forms.Form):
 				Returns the Crispy layout used for the form.
 			submit(self, request):
 				Processes the form.
+				May return a HttpResponse (e.g. a file download), which is sent instead of redirecting.
 	"""
 	
 	form_name: str | None = None
@@ -191,11 +196,9 @@ class ExpireMembershipsForm(ControlPanelForm):
 				date_purchased__lt=self.cleaned_data["cut_off_date"],
 				expired=False
 			)
-			if memberships_to_expire.exists():
-				number_of_expired_memberships = memberships_to_expire.count()
-				for membership in memberships_to_expire:
-					membership.expired = True
-					membership.save()
+			# A single UPDATE, rather than saving each membership.
+			number_of_expired_memberships = memberships_to_expire.update(expired=True)
+			if number_of_expired_memberships > 0:
 				messages.success(
 					request,
 					f"Successfully invalidated {number_of_expired_memberships} membership{'s' if number_of_expired_memberships > 1 else ''}."
@@ -380,9 +383,7 @@ class AddRemoveRanksForm(ControlPanelForm):
 					member=cleaned_member,
 					rank_name=cleaned_rank,
 				)
-				if ranks_to_expire.count() > 0:
-					for rank in ranks_to_expire:
-						rank.set_expired()
+				if expire_ranks(ranks_to_expire):
 					messages.success(
 						request,
 						f"Successfully expired all {cleaned_rank_label} ranks from {cleaned_member.long_name}."
@@ -613,19 +614,127 @@ class CommitteeTransferForm(ControlPanelForm):
 
 class GetMembershipInfoForm(ControlPanelForm):
 	form_name = "Get Membership CSV"
-	form_short_description = "Get a CSV of membership data for a particular date. Useful for O-Day information."
+	form_short_description = "Get a CSV of membership data for a range of dates. Useful for O-Day information."
 	form_long_description = (
-		"This will output a CSV containing the name, student number, and guild status "
-		"of each membership purchased on the selected date."
+		"This will output a CSV containing the name, student number, guild status, amount paid and date "
+		"of each membership purchased between the selected dates. It can optionally be compressed."
 	)
 	form_allowed_ranks = [
 		RankChoices.COMMITTEE,
 		RankChoices.WEBKEEPER,
 	]
 	
+	OUTPUT_CHOICES = (
+		("csv", "CSV"),
+		("gzip", "Compressed CSV (.csv.gz)"),
+	)
+	CSV_HEADER = ["Name", "Student Number", "Guild Member", "Amount Paid", "Date Purchased"]
+	# How many memberships are fetched from the database at a time.
+	chunk_size = 2000
+	# The database the memberships are read from - the replica, if it's safe to (see submit).
+	database = DEFAULT_DB_ALIAS
+	
+	start_date = forms.DateField(
+		label="Memberships purchased from:",
+		required=True,
+		widget=HTML5DateInput(),
+		initial=datetime.date.today,
+	)
+	end_date = forms.DateField(
+		label="Up to and including:",
+		required=True,
+		widget=HTML5DateInput(),
+		initial=datetime.date.today,
+	)
+	output_format = forms.ChoiceField(
+		choices=OUTPUT_CHOICES,
+		label="Output format:",
+		widget=forms.RadioSelect(),
+		initial="csv",
+		required=True,
+	)
+	
 	def get_layout(self):
-		return Layout()
+		return Layout(
+			Field("start_date"),
+			Field("end_date"),
+			Field("output_format"),
+		)
+	
+	def clean(self):
+		cleaned_data = super().clean()
+		start_date = cleaned_data.get("start_date")
+		end_date = cleaned_data.get("end_date")
+		if start_date is not None and end_date is not None and start_date > end_date:
+			self.add_error("end_date", "End date can't be before the start date.")
+		return cleaned_data
+	
+	def get_membership_rows(self):
+		"""
+		Yields the membership data one row at a time, fetching it from the database in chunks.
+		"""
+		memberships = Membership.objects.using(self.database).filter(
+			date_purchased__range=(self.cleaned_data["start_date"], self.cleaned_data["end_date"])
+		).order_by("date_purchased", "pk").values_list(
+			"member__long_name", "member__student_number", "guild_member", "amount_paid", "date_purchased"
+		)
+		yield self.CSV_HEADER
+		for long_name, student_number, guild_member, amount_paid, date_purchased in memberships.iterator(
+				chunk_size=self.chunk_size
+		):
+			yield [
+				long_name or "<deleted member>",
+				student_number or "",
+				"Yes" if guild_member else "No",
+				amount_paid,
+				date_purchased.isoformat(),
+			]
+	
+	def stream_csv(self):
+		"""
+		Yields the CSV one line at a time, so the whole file is never held in memory.
+		"""
+		writer = csv.writer(PseudoBuffer())
+		for row in self.get_membership_rows():
+			yield writer.writerow(row).encode()
 	
+	def stream_gzip(self):
+		"""
+		Yields the CSV compressed with gzip, a chunk at a time.
+		"""
+		# wbits=31 gives a gzip header and trailer, rather than a raw zlib stream.
+		compressor = zlib.compressobj(wbits=31)
+		for line in self.stream_csv():
+			compressed = compressor.compress(line)
+			if compressed:
+				yield compressed
+		yield compressor.flush()
+	
+	def submit(self, request):
+		if self.is_valid():
+			# The rows are streamed after the view returns, so pick the database now, while we know
+			# whether this session is pinned to the primary.
+			self.database = get_replica_database()
+			filename = (
+				f"memberships_{self.cleaned_data['start_date'].isoformat()}"
+				f"_{self.cleaned_data['end_date'].isoformat()}.csv"
+			)
+			if self.cleaned_data["output_format"] == "gzip":
+				response = StreamingHttpResponse(self.stream_gzip(), content_type="application/gzip")
+				filename += ".gz"
+			else:
+				response = StreamingHttpResponse(self.stream_csv(), content_type="text/csv")
+			response["Content-Disposition"] = f'attachment; filename="{filename}"'
+			return response
+
+
+class PseudoBuffer:
+	"""
+	A file-like object for csv.writer that returns each line rather than storing it.
+	"""
+	def write(self, value):
+		return value
+
 
 FORM_CLASSES = {}
 for form_class in (
@@ -635,6 +744,6 @@ for form_class in (
 	MakeWebkeepersForm,
 	AddRemoveRanksForm,
 	CommitteeTransferForm,
-	# GetMembershipInfoForm,
+	GetMembershipInfoForm,
 ):
 	FORM_CLASSES[slugify(form_class.form_name)] = form_class
@@ -1,3 +1,73 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
 
-# Create your tests here.
+from django.test import TestCase, RequestFactory
+
+from members.models import Member, Membership
+from .forms import GetMembershipInfoForm
+
+
+class GetMembershipInfoFormTests(TestCase):
+	def setUp(self):
+		for n in range(5):
+			member = Member.objects.create(
+				short_name=f"Member {n}",
+				long_name=f"Member Number {n}",
+				pronouns="they/them",
+				student_number=f"2000000{n}",
+				join_date=datetime.date(2024, 2, 20),
+			)
+			Membership.objects.create(
+				member=member,
+				date_purchased=datetime.date(2024, 2, 20 + n),
+				guild_member=n % 2 == 0,
+				amount_paid=5,
+			)
+		self.request = RequestFactory().post("/")
+	
+	def get_form(self, output_format):
+		prefix = "get-membership-csv"
+		form = GetMembershipInfoForm(data={
+			f"{prefix}-start_date": "2024-02-21",
+			f"{prefix}-end_date": "2024-02-23",
+			f"{prefix}-output_format": output_format,
+			f"{prefix}-form_confirm_field": "on",
+		})
+		# Make sure the rows really are fetched in more than one chunk.
+		form.chunk_size = 2
+		return form
+	
+	def test_csv_export(self):
+		response = self.get_form("csv").submit(self.request)
+		self.assertTrue(response.streaming)
+		self.assertEqual(
+			response["Content-Disposition"], 'attachment; filename="memberships_2024-02-21_2024-02-23.csv"'
+		)
+		rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+		self.assertEqual(rows[0], GetMembershipInfoForm.CSV_HEADER)
+		self.assertEqual(
+			[row[0] for row in rows[1:]],
+			["Member Number 1", "Member Number 2", "Member Number 3"]
+		)
+		self.assertEqual(rows[2], ["Member Number 2", "20000002", "Yes", "5", "2024-02-22"])
+	
+	def test_gzip_export(self):
+		csv_response = self.get_form("csv").submit(self.request)
+		gzip_response = self.get_form("gzip").submit(self.request)
+		self.assertEqual(gzip_response["Content-Type"], "application/gzip")
+		self.assertEqual(
+			gzip.decompress(b"".join(gzip_response.streaming_content)),
+			b"".join(csv_response.streaming_content)
+		)
+	
+	def test_end_date_before_start_date(self):
+		form = GetMembershipInfoForm(data={
+			"get-membership-csv-start_date": "2024-02-23",
+			"get-membership-csv-end_date": "2024-02-21",
+			"get-membership-csv-output_format": "csv",
+			"get-membership-csv-form_confirm_field": "on",
+		})
+		self.assertFalse(form.is_valid())
+		self.assertIn("end_date", form.errors)
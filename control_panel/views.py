@@ -50,7 +50,10 @@ class ControlPanelFormView(FormView):
 		return FORM_CLASSES.get(self.kwargs["slug"])
 	
 	def form_valid(self, form):
-		form.submit(self.request)
+		response = form.submit(self.request)
+		if response is not None:
+			# Some forms produce their own response, like a file download.
+			return response
 		return super().form_valid(form)
 	
 	def get_success_url(self):
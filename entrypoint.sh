@@ -15,6 +15,8 @@ NGINX_WORKER_CONNECTIONS=${NGINX_WORKER_CONNECTIONS:-1024}
 USE_MEDIA_URL=${MEDIA_URL:-'/media'}
 # Get the absolute path of the media files from the environment variable
 USE_MEDIA_PATH=${MEDIA_PATH:-'/app/media'}
+# Get the absolute path of the pre-rendered pages (see "manage.py prerender_pages")
+USE_PRERENDERED_PATH=${PRERENDERED_PAGES_ROOT:-'/app/prerendered'}
 # Get the listen port for Nginx, default to 80
 USE_LISTEN_PORT=${LISTEN_PORT:-80}
 
@@ -51,7 +53,9 @@ else
     content_server='server {\n'
     content_server=$content_server"    listen ${USE_LISTEN_PORT};\n"
     content_server=$content_server'    location / {\n'
-    content_server=$content_server'        try_files $uri @app;\n'
+    # Serve the pre-rendered pages straight from disk, falling back to the app
+    content_server=$content_server"        root $USE_PRERENDERED_PATH;\n"
+    content_server=$content_server'        try_files $uri/index.html @app;\n'
     content_server=$content_server'    }\n'
     content_server=$content_server'    location @app {\n'
     content_server=$content_server'        include uwsgi_params;\n'
@@ -59,6 +63,8 @@ else
     content_server=$content_server'    }\n'
     content_server=$content_server"    location $USE_MEDIA_URL {\n"
     content_server=$content_server"        alias $USE_MEDIA_PATH;\n"
+    # Media files are named by their content (see phylactery/storage.py), so they never change
+    content_server=$content_server'        add_header Cache-Control "public, max-age=31536000, immutable";\n'
     content_server=$content_server'    }\n'
     content_server=$content_server'}\n'
     # Save generated server /etc/nginx/conf.d/nginx.conf
@@ -0,0 +1,208 @@
+"""
+	Async versions of the read-only library catalogue views.
+
+	These are used instead of the regular views when ASYNC_CATALOGUE_VIEWS is set,
+	and the site is served over ASGI (see the README). While a query is running, the worker
+	can get on with other requests, rather than tying up a whole sync worker per request.
+
+	The main queries are run with the async ORM. Templates can't run queries in an async context,
+	so rendering (and the odd query the templates make, like the navbar's user) happens in a thread.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.views import View
+from library.models import Item, LibraryTag, get_item_type_tagged_items, prefetch_item_types
+from library.search import SearchQueryManager
+from library.views import (
+	ItemDetailView, get_item_last_modified, get_tag_context, get_tag_items_queryset, get_tag_last_modified,
+	get_tag_list_queryset
+)
+from phylactery.caching import ConditionalGetMixin
+from phylactery.db_routing import ReplicaReadsMixin
+from phylactery.pagination import KeysetPaginator
+
+
+async def render_async(request, template_name, context):
+	return await sync_to_async(render)(request, template_name, context)
+
+
+class AsyncItemListMixin:
+	"""
+	Lists items a page at a time, like KeysetPaginationMixin does for ListView.
+	"""
+	template_name = "library/item_list_view.html"
+	paginate_by = 24
+	keyset_ordering = ["name", "id"]
+	cursor_kwarg = "cursor"
+
+	async def get_queryset(self):
+		return Item.objects.all()
+
+	async def get_context_data(self, **kwargs):
+		queryset = prefetch_item_types(await self.get_queryset())
+		paginator = KeysetPaginator(queryset, self.paginate_by, self.keyset_ordering, approximate_count=True)
+		page = await paginator.aget_page(self.request.GET.get(self.cursor_kwarg))
+		await paginator.aget_approximate_count()
+		return {
+			"view": self,
+			"paginator": paginator,
+			"page_obj": page,
+			"is_paginated": page.has_other_pages(),
+			"items_list": page.object_list,
+			**kwargs
+		}
+
+	async def get(self, request, *args, **kwargs):
+		context = await self.get_context_data()
+		return await render_async(request, self.template_name, context)
+
+
+class AsyncItemListView(ReplicaReadsMixin, AsyncItemListMixin, View):
+	"""
+	Async version of ItemListView.
+	"""
+
+
+class AsyncItemSearchView(AsyncItemListView):
+	"""
+	Async version of ItemSearchView.
+	"""
+	template_name = "library/item_search_view.html"
+
+	def setup(self, request, *args, **kwargs):
+		super().setup(request, *args, **kwargs)
+		self.query = self.request.GET.get("q", "")
+		self.manager = None
+
+	async def get_queryset(self):
+		if self.query:
+			# Parsing the query can look up tags.
+			self.manager = SearchQueryManager(query=self.query)
+			await sync_to_async(self.manager.evaluate)()
+			return self.manager.get_results()
+		else:
+			return Item.objects.none()
+
+	async def get_context_data(self, **kwargs):
+		context = await super().get_context_data(**kwargs)
+		if self.manager:
+			context["search_warnings"] = self.manager.warnings
+			context["search_errors"] = self.manager.errors
+		if self.query:
+			context["query"] = self.query
+		return context
+
+
+class AsyncItemDetailView(ReplicaReadsMixin, ConditionalGetMixin, View):
+	"""
+	Async version of ItemDetailView.
+	"""
+	template_name = "library/item_detail_view.html"
+	pages_change_daily = ItemDetailView.pages_change_daily
+	
+	def get_last_modified(self):
+		return get_item_last_modified(self.kwargs["slug"])
+
+	async def get(self, request, *args, **kwargs):
+		try:
+			item = await Item.objects.aget(slug=kwargs["slug"])
+		except Item.DoesNotExist:
+			raise Http404("No item found matching the query")
+		item_info = await sync_to_async(item.get_availability_info)()
+		item.item_type_tagged_items = [
+			tagged_item async for tagged_item in get_item_type_tagged_items().filter(content_object=item)
+		]
+		context = {
+			"view": self,
+			"object": item,
+			"item": item,
+			"item_info": item_info,
+			"item_types": [tagged_item.tag for tagged_item in item.item_type_tagged_items],
+			**ItemDetailView.get_available_str_context(item_info),
+		}
+		return await render_async(request, self.template_name, context)
+
+
+class AsyncTagListView(ReplicaReadsMixin, View):
+	"""
+	Async version of TagListView.
+	"""
+	template_name = "library/tag_list_view.html"
+
+	async def get(self, request, *args, **kwargs):
+		tags_list = [tag async for tag in get_tag_list_queryset()]
+		context = {
+			"view": self,
+			"object_list": tags_list,
+			"tags_list": tags_list,
+		}
+		return await render_async(request, self.template_name, context)
+
+
+class AsyncTagDetailView(ReplicaReadsMixin, ConditionalGetMixin, AsyncItemListMixin, View):
+	"""
+	Async version of TagDetailView.
+	"""
+	
+	def get_last_modified(self):
+		return get_tag_last_modified(self.kwargs["slug"])
+	
+	async def get_queryset(self):
+		self.tag = await aget_object_or_404(LibraryTag, slug=self.kwargs["slug"])
+		return get_tag_items_queryset(self.tag)
+	
+	async def get_context_data(self, **kwargs):
+		context = await super().get_context_data(**kwargs)
+		context.update(get_tag_context(self.tag))
+		return context
+
+
+class AsyncAutocompleteView(ReplicaReadsMixin, View):
+	"""
+	Async replacement for the django-autocomplete-light Select2QuerySetView,
+	for the read-only autocompletes. Returns the same JSON format that Select2 expects.
+	By default, lists the objects of model whose search_field starts with the query.
+	"""
+	model = None
+	search_field = "name"
+	paginate_by = 10
+
+	def get_queryset(self, q):
+		qs = self.model.objects.all()
+		if q:
+			qs = qs.filter(**{f"{self.search_field}__istartswith": q})
+		return qs
+
+	async def get(self, request, *args, **kwargs):
+		q = request.GET.get("q", "")
+		try:
+			page = max(int(request.GET.get("page", 1)), 1)
+		except ValueError:
+			page = 1
+		start = (page - 1) * self.paginate_by
+		# Fetch one more than needed, to tell whether there are more results.
+		results = [
+			obj async for obj in self.get_queryset(q)[start:start + self.paginate_by + 1]
+		]
+		return JsonResponse({
+			"results": [
+				{"id": str(obj.pk), "text": str(obj), "selected_text": str(obj)}
+				for obj in results[:self.paginate_by]
+			],
+			"pagination": {"more": len(results) > self.paginate_by},
+		})
+
+
+class AsyncItemAutocomplete(AsyncAutocompleteView):
+	"""
+	Async version of ItemAutocomplete.
+	"""
+	model = Item
+
+
+class AsyncLibraryTagAutocomplete(AsyncAutocompleteView):
+	"""
+	Async version of LibraryTagAutocomplete.
+	"""
+	model = LibraryTag
@@ -1,8 +1,9 @@
 from dal import autocomplete
 from library.models import Item, LibraryTag
+from phylactery.db_routing import ReplicaReadsMixin
 
 
-class ItemAutocomplete(autocomplete.Select2QuerySetView):
+class ItemAutocomplete(ReplicaReadsMixin, autocomplete.Select2QuerySetView):
 	"""
 	Simple view for handling the Item selection box autocompletes.
 	See the django-autocomplete-light documentation for more info.
@@ -15,7 +16,7 @@ class ItemAutocomplete(autocomplete.Select2QuerySetView):
 		return qs
 
 
-class LibraryTagAutocomplete(autocomplete.Select2QuerySetView):
+class LibraryTagAutocomplete(ReplicaReadsMixin, autocomplete.Select2QuerySetView):
 	"""
 	Simple view for handling the Tag selection box autocompletes.
 	See the django-autocomplete-light documentation for more info.
@@ -0,0 +1,130 @@
+"""
+Precomputed availability calendars for library items.
+
+Each item stores a bitmap of which of the next CALENDAR_DAYS days it is booked on (borrowed, or reserved),
+in Item.availability_calendar, starting from Item.availability_calendar_start. Bit i (most significant bit first)
+is set if the item is booked on availability_calendar_start + i days.
+The booked days mostly follow the same rules as get_invalid_dates (used by Item.get_availability_info),
+with two differences:
+	- Days are local dates. get_invalid_dates takes the date of borrowed_datetime in UTC, so an item borrowed
+	  early in the morning (local time) is booked from the day before there.
+	- An overdue item is booked until today, since it still isn't back. get_invalid_dates stops at the due date,
+	  which makes get_availability_info expect an overdue item to be available today.
+
+Calendars are rebuilt for an item whenever its borrow records or reservations change (see library/signals.py),
+and for every item once a day by the rebuild_availability_calendars task, which moves them along to start today.
+A calendar that has fallen too far behind (or was never built) is worked out from the primary database
+when it's read, so they never give wrong answers. It's stored by a background task rather than during the read.
+"""
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from library.models import BorrowRecord, Item, Reservation
+from library.tasks import rebuild_availability_calendars_task
+from phylactery.db_routing import pin_to_primary
+
+
+CALENDAR_DAYS = 180
+# How many items to rebuild at once.
+BATCH_SIZE = 500
+
+
+def encode_calendar(booked_days: set[int], days: int = CALENDAR_DAYS) -> bytes:
+	"""
+	Turns a set of day offsets into a bitmap.
+	"""
+	bitmap = bytearray((days + 7) // 8)
+	for day in booked_days:
+		if 0 <= day < days:
+			bitmap[day // 8] |= 0x80 >> (day % 8)
+	return bytes(bitmap)
+
+
+def decode_calendar(bitmap: bytes, offset: int, days: int) -> list[bool]:
+	"""
+	Returns whether each of the given days of the bitmap is booked, starting from the given offset.
+	"""
+	return [bool(bitmap[day // 8] & (0x80 >> (day % 8))) for day in range(offset, offset + days)]
+
+
+def build_calendars(item_ids, start: date) -> dict[int, bytes]:
+	"""
+	Works out the calendars of the given items, starting from start, in two queries.
+	"""
+	booked = {item_id: set() for item_id in item_ids}
+
+	def book(item_id, from_date, to_date):
+		booked[item_id].update(range((from_date - start).days, (to_date - start).days + 1))
+
+	for item_id, borrowed_datetime, due_date in BorrowRecord.objects.filter(
+		item__in=item_ids, returned=False
+	).values_list("item", "borrowed_datetime", "due_date"):
+		# An overdue item still isn't in the clubroom, so it's booked until at least today.
+		book(item_id, timezone.localtime(borrowed_datetime).date(), max(due_date, start))
+
+	for item_id, date_to_borrow, date_to_return in Reservation.reserved_items.through.objects.filter(
+		item__in=item_ids, reservation__is_active=True, reservation__requested_date_to_return__gte=start
+	).values_list("item", "reservation__requested_date_to_borrow", "reservation__requested_date_to_return"):
+		# The day before a reservation is booked too, so the item is back in time for it.
+		book(item_id, date_to_borrow - timedelta(days=1), date_to_return)
+
+	return {item_id: encode_calendar(days) for item_id, days in booked.items()}
+
+
+def rebuild_availability_calendars(item_ids=None) -> dict[int, bytes]:
+	"""
+	Rebuilds the calendars of the given items (or every item), starting from today.
+	Returns the new calendars, by item id.
+	"""
+	today = timezone.localdate()
+	if item_ids is None:
+		item_ids = Item.objects.values_list("pk", flat=True).order_by("pk")
+	item_ids = list(item_ids)
+	calendars = {}
+	for batch_start in range(0, len(item_ids), BATCH_SIZE):
+		batch = build_calendars(item_ids[batch_start:batch_start + BATCH_SIZE], today)
+		Item.objects.bulk_update(
+			[
+				Item(pk=item_id, availability_calendar=calendar, availability_calendar_start=today)
+				for item_id, calendar in batch.items()
+			],
+			["availability_calendar", "availability_calendar_start"],
+		)
+		calendars.update(batch)
+	return calendars
+
+
+def availability_changed(item_ids):
+	"""
+	Rebuilds the calendars of the given items, once the current transaction (if any) has committed.
+	"""
+	item_ids = list(item_ids)
+	if item_ids:
+		transaction.on_commit(lambda: rebuild_availability_calendars(item_ids))
+
+
+def get_availability_calendars(item_ids, days: int = CALENDAR_DAYS) -> dict[int, list[bool]]:
+	"""
+	Returns whether each of the given items is booked on each of the next given number of days, starting today.
+	Items that don't exist are left out.
+	"""
+	today = timezone.localdate()
+	rows = Item.objects.filter(pk__in=item_ids).values_list(
+		"pk", "availability_calendar", "availability_calendar_start"
+	)
+	calendars = {}
+	stale_item_ids = []
+	for item_id, bitmap, start in rows:
+		if start is None or start > today or (today - start).days + days > CALENDAR_DAYS:
+			stale_item_ids.append(item_id)
+		else:
+			calendars[item_id] = decode_calendar(bytes(bitmap), (today - start).days, days)
+	if stale_item_ids:
+		# Reads may be going to a replica that is missing the latest borrow records and reservations.
+		with pin_to_primary():
+			for item_id, bitmap in build_calendars(stale_item_ids, today).items():
+				calendars[item_id] = decode_calendar(bitmap, 0, days)
+		rebuild_availability_calendars_task.delay_on_commit(item_ids=stale_item_ids)
+	return calendars
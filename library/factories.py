@@ -40,7 +40,8 @@ class BorrowerDetailsFactory(factory.django.DjangoModelFactory):
 	borrower_name = factory.Faker("name")
 	
 	borrower_address = factory.Faker("address")
-	borrower_phone = factory.Faker("phone_number")
+	# Faker's phone numbers can be longer than the 20 characters the field allows.
+	borrower_phone = factory.Faker("numerify", text="04## ### ###")
 	
 	borrow_authorised_by = factory.Faker("name")
 
@@ -63,7 +64,7 @@ class ReservationFactory(factory.django.DjangoModelFactory):
 	internal_member = None
 	requestor_name = factory.Faker("name")
 	requestor_email = factory.Faker("email")
-	requestor_phone = factory.Faker("phone_number")
+	requestor_phone = factory.Faker("numerify", text="04## ### ###")
 	
 	@factory.post_generation
 	def reserved_items(self, create, extracted, **kwargs):
@@ -92,7 +92,7 @@ class ItemDueDateForm(forms.Form):
 		else:
 			row_class = ""
 		item_name = self.initial["item"].name
-		item_img = self.initial["item"].image.url
+		item_img = self.initial["item"].get_thumbnail_url()
 		self.helper.layout = Layout(
 			HTML(
 				f"""
@@ -571,7 +571,7 @@ class ReturnItemForm(forms.Form):
 		self.helper = FormHelper()
 		self.helper.form_tag = False
 		item_name = self.initial["borrow_record"].item.name
-		item_img = self.initial["borrow_record"].item.image.url
+		item_img = self.initial["borrow_record"].item.get_thumbnail_url()
 		self.helper.layout = Layout(
 			HTML(
 				f"""
@@ -644,7 +644,7 @@ class VerifyReturnForm(forms.Form):
 				Div(
 					Div(
 						HTML(
-							"""<img class="borrow-form-img" src="{{ sub_form.initial.borrow_record.item.image.url }}">"""
+							"""<img class="borrow-form-img" src="{{ sub_form.initial.borrow_record.item.get_thumbnail_url }}">"""
 						),
 						css_class="col-md-2 mb-1",
 					),
@@ -764,7 +764,7 @@ class ReservationSelectItemForm(forms.Form):
 				"""
 				<tr>
 					<td class="d-none d-md-table-cell">
-						<img class="borrow-form-img" src="{{ sub_form.initial.item.image.url }}">
+						<img class="borrow-form-img" src="{{ sub_form.initial.item.get_thumbnail_url }}">
 					</td>
 					<td>
 						{{ sub_form.initial.item.name }}
@@ -0,0 +1,87 @@
+"""
+Resized copies ("derivatives") of the library item images.
+
+Item images are usually full size photos, which are far bigger than they ever appear on the site.
+For each image, we make a copy at each of DERIVATIVE_WIDTHS (as long as it isn't bigger than the original),
+in WebP, and in JPEG (or PNG, for images with transparency) for browsers that can't show WebP.
+They're stored next to the original, as <original name>_<width>w.<extension> (plus the content hash that
+the storage adds - see phylactery/storage.py), and their actual names are kept in Item.image_derivatives.
+"""
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+# Widths, in pixels, of the copies made of each image.
+DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def get_derivative_name(name, width, extension):
+	root, _, _ = name.rpartition(".")
+	return f"{root}_{width}w.{extension}"
+
+
+def get_derivative_widths(original_width):
+	"""
+	Returns the widths to make copies at. Images are never scaled up -
+	if the original is smaller than all of them, it's just converted at its original size.
+	"""
+	return [width for width in DERIVATIVE_WIDTHS if width < original_width] or [original_width]
+
+
+def generate_image_derivatives(name, storage=None):
+	"""
+	Makes the resized copies of the image with the given name.
+	Returns a description of them, to store in Item.image_derivatives:
+		{
+			"source": name,
+			"widths": [...],
+			"format": "jpg" or "png",
+			"files": {"webp": {"<width>": <name>, ...}, "jpg" or "png": {...}},
+		}
+	"""
+	storage = storage or default_storage
+	with storage.open(name, "rb") as file, Image.open(file) as original:
+		# Photos from phones are often stored sideways, with a tag saying which way is up.
+		image = ImageOps.exif_transpose(original)
+		has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+		image = image.convert("RGBA" if has_alpha else "RGB")
+
+	if has_alpha:
+		fallback_extension, fallback_options = "png", {"format": "PNG", "optimize": True}
+	else:
+		fallback_extension, fallback_options = "jpg", {
+			"format": "JPEG", "quality": JPEG_QUALITY, "optimize": True, "progressive": True
+		}
+	widths = get_derivative_widths(image.width)
+	files = {"webp": {}, fallback_extension: {}}
+	for width in widths:
+		height = max(round(image.height * width / image.width), 1)
+		resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+		files["webp"][str(width)] = save_derivative(
+			storage, get_derivative_name(name, width, "webp"), resized, format="WEBP", quality=WEBP_QUALITY, method=4
+		)
+		files[fallback_extension][str(width)] = save_derivative(
+			storage, get_derivative_name(name, width, fallback_extension), resized, **fallback_options
+		)
+	return {"source": name, "widths": widths, "format": fallback_extension, "files": files}
+
+
+def save_derivative(storage, name, image, **save_options):
+	"""
+	Saves the image, and returns the name it was saved under.
+	"""
+	buffer = BytesIO()
+	image.save(buffer, **save_options)
+	return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def get_derivative_names(derivatives):
+	"""
+	Returns the names of all the copies described by derivatives (see generate_image_derivatives).
+	"""
+	return [name for names in derivatives.get("files", {}).values() for name in names.values()]
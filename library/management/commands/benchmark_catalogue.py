@@ -0,0 +1,76 @@
+"""
+A simple load test for the library catalogue pages.
+
+Fires requests at a running server from a pool of threads, and reports throughput and latency.
+Run it against the site served with sync workers, then again with ASYNC_CATALOGUE_VIEWS over ASGI
+(with the same number of database connections), to compare the two. For example:
+	python manage.py benchmark_catalogue http://localhost:8000 --concurrency 50 --requests 2000
+"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+	help = "Load tests the library catalogue pages of a running server."
+	
+	def add_arguments(self, parser):
+		parser.add_argument("base_url", help="The URL of the running server, e.g. http://localhost:8000")
+		parser.add_argument(
+			"--paths", nargs="*",
+			help="Paths to request, in turn. Defaults to the item list, tag list, search and autocomplete."
+		)
+		parser.add_argument("--concurrency", type=int, default=20, help="How many requests to have in flight at once.")
+		parser.add_argument("--requests", type=int, default=500, help="How many requests to make in total.")
+		parser.add_argument("--timeout", type=float, default=30, help="Timeout for each request, in seconds.")
+	
+	def handle(self, *args, **options):
+		paths = options["paths"] or [
+			reverse("library:item_list"),
+			reverse("library:tag_list"),
+			reverse("library:search") + "?q=is:boardgame",
+			reverse("library:autocomplete_item") + "?q=a",
+		]
+		urls = [urljoin(options["base_url"], path) for path in paths]
+		timeout = options["timeout"]
+		
+		def fetch(index):
+			url = urls[index % len(urls)]
+			start = time.perf_counter()
+			try:
+				with urlopen(url, timeout=timeout) as response:
+					response.read()
+					status = response.status
+			except HTTPError as e:
+				status = e.code
+			except (URLError, TimeoutError):
+				status = None
+			return url, status, time.perf_counter() - start
+		
+		start = time.perf_counter()
+		with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+			results = list(executor.map(fetch, range(options["requests"])))
+		elapsed = time.perf_counter() - start
+		
+		succeeded = [latency for url, status, latency in results if status == 200]
+		failed = len(results) - len(succeeded)
+		if not succeeded:
+			raise CommandError(f"All {len(results)} requests failed - is the server running at {options['base_url']}?")
+		
+		percentiles = statistics.quantiles(succeeded, n=100) if len(succeeded) > 1 else succeeded * 99
+		self.stdout.write(f"Requests:    {len(results)} ({failed} failed), {options['concurrency']} at a time")
+		self.stdout.write(f"Throughput:  {len(results) / elapsed:.1f} requests/second")
+		self.stdout.write(
+			f"Latency:     p50 {percentiles[49] * 1000:.0f}ms, p95 {percentiles[94] * 1000:.0f}ms, "
+			f"p99 {percentiles[98] * 1000:.0f}ms, max {max(succeeded) * 1000:.0f}ms"
+		)
+		for url in urls:
+			url_latencies = [latency for result_url, status, latency in results if result_url == url and status == 200]
+			if url_latencies:
+				self.stdout.write(f"  {url}: mean {statistics.mean(url_latencies) * 1000:.0f}ms")
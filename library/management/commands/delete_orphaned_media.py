@@ -0,0 +1,80 @@
+"""
+Deletes media files that nothing in the database refers to any more.
+
+Uploaded files are never overwritten or deleted when they're replaced (see phylactery/storage.py),
+so that their URLs can be cached forever. This cleans up the old versions in bulk, afterwards.
+Only files older than --min-age are deleted, so that files being uploaded (or resized) right now are left alone.
+"""
+import posixpath
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+
+from library.images import get_derivative_names
+from library.models import Item
+
+
+def get_referenced_names():
+	"""
+	Returns the names of every file that a row in the database refers to.
+	"""
+	referenced = set()
+	for model in apps.get_models():
+		for field in model._meta.concrete_fields:
+			if isinstance(field, models.FileField):
+				referenced.update(
+					model._default_manager.exclude(**{field.name: ""}).exclude(**{f"{field.name}__isnull": True})
+					.values_list(field.name, flat=True).iterator()
+				)
+	# The resized copies of item images are stored in a JSONField, rather than a FileField.
+	for derivatives in Item.objects.exclude(image_derivatives={}).values_list("image_derivatives", flat=True).iterator():
+		referenced.update(get_derivative_names(derivatives))
+	return referenced
+
+
+def walk_storage(storage, directory):
+	directories, files = storage.listdir(directory)
+	for file in files:
+		yield posixpath.join(directory, file)
+	for subdirectory in directories:
+		yield from walk_storage(storage, posixpath.join(directory, subdirectory))
+
+
+class Command(BaseCommand):
+	help = "Deletes media files that nothing in the database refers to any more."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"directories", nargs="*", default=["library/item_images"],
+			help="Media directories to clean up. Defaults to the item images."
+		)
+		parser.add_argument(
+			"--min-age", type=float, default=24,
+			help="Only delete files last modified at least this many hours ago. Defaults to 24."
+		)
+		parser.add_argument("--dry-run", action="store_true", help="Only list the files that would be deleted.")
+	
+	def handle(self, *args, **options):
+		storage = default_storage
+		referenced = get_referenced_names()
+		cutoff = timezone.now() - timedelta(hours=options["min_age"])
+		
+		orphans = []
+		for directory in options["directories"]:
+			if not storage.exists(directory):
+				continue
+			for name in walk_storage(storage, directory):
+				if name not in referenced and storage.get_modified_time(name) < cutoff:
+					orphans.append(name)
+		
+		for name in orphans:
+			if options["dry_run"]:
+				self.stdout.write(f"Would delete {name}")
+			else:
+				storage.delete(name)
+		verb = "Would delete" if options["dry_run"] else "Deleted"
+		self.stdout.write(self.style.SUCCESS(f"{verb} {len(orphans)} orphaned files."))
@@ -0,0 +1,71 @@
+"""
+Makes the resized copies of the item images (see library/images.py) that don't have them yet.
+New uploads get theirs from a Celery task, so this is for backfilling existing images.
+
+Resizing is CPU-bound, so the images are processed in parallel by a pool of processes.
+The results are saved to the database in batches, from this process.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library.images import generate_image_derivatives
+from library.models import Item
+from phylactery.caching import invalidate_public_pages
+
+
+def process_image(name):
+	try:
+		return name, generate_image_derivatives(name), None
+	except Exception as e:
+		return name, None, str(e)
+
+
+class Command(BaseCommand):
+	help = "Makes the resized copies of item images that don't have them yet."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--workers", type=int, default=None,
+			help="How many processes to use. Defaults to the number of CPUs."
+		)
+		parser.add_argument(
+			"--force", action="store_true",
+			help="Remake the copies of every image, even if they've already been made."
+		)
+		parser.add_argument("--batch-size", type=int, default=100, help="How many items to save at a time.")
+	
+	def handle(self, *args, **options):
+		items = {}
+		for item in Item.objects.exclude(image="").exclude(image=None).only("pk", "image", "image_derivatives"):
+			if options["force"] or not item.has_image_derivatives:
+				items.setdefault(item.image.name, []).append(item)
+		if not items:
+			self.stdout.write(self.style.SUCCESS("All item images already have their resized copies."))
+			return
+		self.stdout.write(f"Processing {len(items)} images...")
+		
+		# The worker processes only read and write the image files - all the database access happens here.
+		done = []
+		failed = 0
+		with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as executor:
+			futures = [executor.submit(process_image, name) for name in items]
+			for future in as_completed(futures):
+				name, derivatives, error = future.result()
+				if error is not None:
+					failed += 1
+					self.stderr.write(f"Couldn't process {name}: {error}")
+					continue
+				for item in items[name]:
+					item.image_derivatives = derivatives
+					item.updated_at = timezone.now()
+					done.append(item)
+				if len(done) >= options["batch_size"]:
+					Item.objects.bulk_update(done, ["image_derivatives", "updated_at"])
+					done = []
+		Item.objects.bulk_update(done, ["image_derivatives", "updated_at"])
+		invalidate_public_pages()
+		
+		self.stdout.write(self.style.SUCCESS(f"Processed {len(items) - failed} images, {failed} failed."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0024_trigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
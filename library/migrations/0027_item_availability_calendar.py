@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0026_item_updated_at_librarytag_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='availability_calendar',
+            field=models.BinaryField(default=bytes, editable=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='availability_calendar_start',
+            field=models.DateField(blank=True, default=None, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0027_item_availability_calendar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowrecord',
+            name='last_reminder_date',
+            field=models.DateField(blank=True, default=None, editable=False, null=True),
+        ),
+    ]
@@ -4,11 +4,12 @@ from typing import Any
 from django.core.exceptions import ValidationError
 from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
-from django.db.models import Q, Case, When, Value, Count
+from django.db.models import Q, Case, When, Value, Count, Prefetch
 from django.db.models.functions import Now
 from django.utils import timezone
 from taggit.managers import TaggableManager, _TaggableManager
 from taggit.models import TagBase, TaggedItemBase
+from library.tasks import generate_item_image_derivatives_task
 
 
 # Misc functions to help with date-related functions
@@ -84,6 +85,10 @@ class LibraryTag(TagBase):
 		"(e.g. Board Game, Book, Card Game, etc.)"
 	)
 	
+	# When the tag, or anything shown on its page (its items, parents and children), last changed.
+	# Used for conditional GETs of the tag's page.
+	updated_at = models.DateTimeField(auto_now=True)
+	
 	class Meta:
 		verbose_name = "Tag"
 		verbose_name_plural = "Tags"
@@ -110,10 +115,15 @@ class LibraryTag(TagBase):
 		Called when a Tag object is saved.
 		Find any Items that have this tag in their base_tags or computed_tags, and re-save them.
 		"""
-		for item in Item.objects.filter(
+		items = Item.objects.filter(
 				Q(base_tags__in=[self]) | Q(computed_tags__in=[self])
-		):
+		)
+		for item in items:
 			item.compute_tags(recursion=False)
+		# Their pages show this tag, so they've changed too. So have the pages of the tags next to it.
+		now = timezone.now()
+		Item.objects.filter(pk__in=items.values("pk")).update(updated_at=now)
+		LibraryTag.objects.filter(Q(parents=self) | Q(children=self)).update(updated_at=now)
 	
 	def save(self, *args, **kwargs):
 		super().save(*args, **kwargs)
@@ -144,6 +154,25 @@ class ComputedTaggedLibraryItem(TaggedItemBase):
 	content_object = models.ForeignKey("Item", on_delete=models.CASCADE)
 
 
+def prefetch_item_types(queryset):
+	"""
+	Prefetches each item's item type tags into item_type_tagged_items, for Item.get_type_display.
+	Saves a query per item when listing lots of items.
+	(taggit doesn't allow prefetching base_tags with a filter, so this goes through the tagged items instead.)
+	"""
+	return queryset.prefetch_related(
+		Prefetch(
+			"basetaggedlibraryitem_set",
+			queryset=get_item_type_tagged_items(),
+			to_attr="item_type_tagged_items"
+		)
+	)
+
+
+def get_item_type_tagged_items():
+	return BaseTaggedLibraryItem.objects.filter(tag__is_item_type=True).select_related("tag").order_by("pk")
+
+
 class Item(models.Model):
 	"""
 	Stores all the data related to a single library item.
@@ -186,6 +215,15 @@ class Item(models.Model):
 	is_borrowable = models.BooleanField(default=True)
 	is_high_demand = models.BooleanField(default=False)
 	
+	# Which of the next 180 days the item is booked on, as a bitmap, starting from availability_calendar_start.
+	# See library/availability.py.
+	availability_calendar = models.BinaryField(default=bytes, editable=False)
+	availability_calendar_start = models.DateField(blank=True, null=True, default=None, editable=False)
+	
+	# When the item, or anything shown on its page (its tags, or its availability), last changed.
+	# Used for conditional GETs of the item's page.
+	updated_at = models.DateTimeField(auto_now=True)
+	
 	# These are columns generated by the database,
 	# for searching purposes.
 	search_name = models.GeneratedField(
@@ -212,6 +250,8 @@ class Item(models.Model):
 		return f"library/item_images/{self.slug}.{extension}"
 	
 	image = models.ImageField(upload_to=get_image_filename, null=True)
+	# Describes the resized copies of the image, once they've been made (see library/images.py).
+	image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 	
 	class Meta:
 		ordering = ['name']
@@ -274,12 +314,55 @@ class Item(models.Model):
 				avg_time = convert_minutes_to_hours(self.average_play_time)
 				return f"~<i>{avg_time}</i>"
 	
+	@property
+	def has_image_derivatives(self):
+		# The copies are only useful if they were made from the current image.
+		return (
+			bool(self.image)
+			and self.image_derivatives.get("source") == self.image.name
+			and "files" in self.image_derivatives
+		)
+	
+	def get_image_derivative_url(self, width, extension):
+		return self.image.storage.url(self.image_derivatives["files"][extension][str(width)])
+	
+	def get_image_srcset(self, extension):
+		return ", ".join(
+			f"{self.get_image_derivative_url(width, extension)} {width}w"
+			for width in self.image_derivatives["widths"]
+		)
+	
+	@property
+	def image_webp_srcset(self):
+		return self.get_image_srcset("webp")
+	
+	@property
+	def image_fallback_srcset(self):
+		return self.get_image_srcset(self.image_derivatives["format"])
+	
+	def get_thumbnail_url(self, width=320):
+		"""
+		Returns the URL of the smallest copy of the image that is at least the given width
+		(or the biggest one there is), in JPEG or PNG. Falls back to the original image.
+		"""
+		if not self.has_image_derivatives:
+			return self.image.url
+		widths = self.image_derivatives["widths"]
+		thumbnail_width = min((w for w in widths if w >= width), default=max(widths))
+		return self.get_image_derivative_url(thumbnail_width, self.image_derivatives["format"])
+	
 	def get_type_display(self):
 		"""
 		Returns a string representation of the Item's types.
 		"""
 		item_types = []
-		for tag in self.base_tags.filter(is_item_type=True):
+		# The item type tags may have been prefetched (see prefetch_item_types).
+		tagged_items = getattr(self, "item_type_tagged_items", None)
+		if tagged_items is not None:
+			item_type_tags = [tagged_item.tag for tagged_item in tagged_items]
+		else:
+			item_type_tags = self.base_tags.filter(is_item_type=True)
+		for tag in item_type_tags:
 			item_types.append(tag.get_raw_name())
 		return ", ".join(item_types)
 		
@@ -294,6 +377,9 @@ class Item(models.Model):
 			self.item_tag, _ = LibraryTag.objects.get_or_create(name=f"Item: {self.name}")
 		super().save(*args, **kwargs)  # This actually does the saving.
 		self.compute_tags()
+		if self.image and not self.has_image_derivatives:
+			# The image is new or has changed, so make the resized copies of it, in the background.
+			generate_item_image_derivatives_task.delay_on_commit(item_pk=self.pk)
 	
 	def compute_play_time(self):
 		# Calculates and sets the average play time of the Item.
@@ -530,6 +616,9 @@ class BorrowRecord(models.Model):
 	# Finally, the Librarian verifies that it is returned.
 	verified_returned = models.BooleanField(default=False)
 	
+	# When the borrower was last sent an overdue reminder about this item (see send_overdue_reminders_task).
+	last_reminder_date = models.DateField(blank=True, null=True, default=None, editable=False)
+	
 	# This is the above custom manager to help with Quality of Life.
 	objects = BorrowRecordManager()
 	
@@ -0,0 +1,118 @@
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.utils import timezone
+
+from library.availability import availability_changed
+from library.models import BorrowRecord, Item, LibraryTag, Reservation
+
+
+def touch_items(item_ids):
+	"""
+	Marks the items as changed, so that conditional GETs of their pages get the new version.
+	"""
+	Item.objects.filter(pk__in=item_ids).update(updated_at=timezone.now())
+
+
+def touch_tags(tag_ids):
+	"""
+	Marks the tags as changed, so that conditional GETs of their pages get the new version.
+	"""
+	LibraryTag.objects.filter(pk__in=tag_ids).update(updated_at=timezone.now())
+
+
+def touch_items_and_tags_for_tagging(sender, instance, action, reverse, pk_set, **kwargs):
+	# An item's tags changed. Both the item's page and the pages of the tags added or removed show this.
+	if action not in ("post_add", "post_remove", "pre_clear"):
+		return
+	if action == "pre_clear":
+		# Everything currently tagged is about to be removed.
+		if reverse:
+			pk_set = set(sender.objects.filter(tag=instance).values_list("content_object", flat=True))
+		else:
+			pk_set = set(sender.objects.filter(content_object=instance).values_list("tag", flat=True))
+	if not pk_set:
+		return
+	if reverse:
+		touch_tags([instance.pk])
+		touch_items(pk_set)
+	else:
+		touch_items([instance.pk])
+		touch_tags(pk_set)
+
+
+def touch_tags_for_parents(sender, instance, action, pk_set, **kwargs):
+	# Tag pages show their parents and children, so both sides have changed.
+	if action in ("post_add", "post_remove", "post_clear"):
+		touch_tags([instance.pk, *(pk_set or [])])
+
+
+def touch_tags_for_deleted_item(sender, instance, **kwargs):
+	# The item is about to disappear from its tags' pages.
+	touch_tags(LibraryTag.objects.filter(
+		Q(base_items=instance) | Q(computed_items=instance)
+	).values("pk"))
+
+
+def touch_items_for_deleted_tag(sender, instance, **kwargs):
+	# The tag is about to disappear from its items' pages.
+	touch_items(Item.objects.filter(
+		Q(base_tags__in=[instance]) | Q(computed_tags__in=[instance])
+	).values("pk"))
+	touch_tags(LibraryTag.objects.filter(Q(parents=instance) | Q(children=instance)).values("pk"))
+
+
+def update_availability(item_ids):
+	"""
+	The items' availability has changed, so their pages and their availability calendars have too.
+	"""
+	item_ids = list(item_ids)
+	touch_items(item_ids)
+	availability_changed(item_ids)
+
+
+def update_availability_for_borrow_record(sender, instance, **kwargs):
+	# Borrowing or returning an item changes its availability.
+	update_availability([instance.item_id])
+
+
+def update_availability_for_reservation(sender, instance, **kwargs):
+	# Reservations change the availability of the reserved items.
+	update_availability(instance.reserved_items.values_list("pk", flat=True))
+
+
+def update_availability_for_reserved_items(sender, instance, action, reverse, pk_set, **kwargs):
+	if action in ("post_add", "post_remove"):
+		update_availability([instance.pk] if reverse else pk_set)
+	elif action == "pre_clear":
+		update_availability([instance.pk] if reverse else instance.reserved_items.values_list("pk", flat=True))
+
+
+def connect_signals():
+	"""
+	Keeps Item.updated_at and LibraryTag.updated_at up to date when something shown on their pages changes,
+	other than the item or tag itself (which is handled by auto_now).
+	Also keeps the items' availability calendars up to date.
+	"""
+	for through in (Item.base_tags.through, Item.computed_tags.through):
+		m2m_changed.connect(
+			touch_items_and_tags_for_tagging, sender=through, dispatch_uid=f"touch_items_and_tags_{through.__name__}"
+		)
+	m2m_changed.connect(touch_tags_for_parents, sender=LibraryTag.parents.through, dispatch_uid="touch_tags_parents")
+	pre_delete.connect(touch_tags_for_deleted_item, sender=Item, dispatch_uid="touch_tags_item_delete")
+	pre_delete.connect(touch_items_for_deleted_tag, sender=LibraryTag, dispatch_uid="touch_items_tag_delete")
+	post_save.connect(
+		update_availability_for_borrow_record, sender=BorrowRecord, dispatch_uid="update_availability_borrow_record_save"
+	)
+	post_delete.connect(
+		update_availability_for_borrow_record, sender=BorrowRecord, dispatch_uid="update_availability_borrow_record_delete"
+	)
+	post_save.connect(
+		update_availability_for_reservation, sender=Reservation, dispatch_uid="update_availability_reservation_save"
+	)
+	pre_delete.connect(
+		update_availability_for_reservation, sender=Reservation, dispatch_uid="update_availability_reservation_delete"
+	)
+	m2m_changed.connect(
+		update_availability_for_reserved_items, sender=Reservation.reserved_items.through,
+		dispatch_uid="update_availability_reserved_items"
+	)
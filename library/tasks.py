@@ -1,21 +1,38 @@
+import datetime
+import time
+from itertools import groupby
+
 from celery import shared_task
-from phylactery.communication.email import render_html_email, send_single_email_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from library.images import generate_image_derivatives
+from phylactery.caching import invalidate_public_pages
+from phylactery.communication.email import render_html_email, send_personalised_email_batch, send_single_email_task
 from django.utils import timezone
 
+logger = get_task_logger(__name__)
 
-def send_borrow_receipt(email_address, borrower_name, items, authorised_by):
+
+@shared_task(name="send_borrow_receipt_task")
+def send_borrow_receipt_task(email_address, borrower_name, items, authorised_by, today):
+	"""
+		Renders and sends a borrowing receipt.
+		The rendering happens here in the worker, rather than in the borrowing request.
+		Items are passed as (item name, due date ISO string) pairs, since they have to be JSON serialisable.
+	"""
 	context = {
 		"borrower_name": borrower_name,
-		"items": items,
+		"items": [(item_name, datetime.date.fromisoformat(due_date)) for item_name, due_date in items],
 		"gatekeeper": authorised_by,
-		"today": timezone.now(),
+		"today": datetime.datetime.fromisoformat(today),
 	}
 	subject = "Unigames Library Borrowing Receipt"
 	plaintext_message, html_message = render_html_email(
 		template_name="library/email/borrow_receipt.html",
 		context=context,
 	)
-	send_single_email_task.delay_on_commit(
+	send_single_email_task.delay(
 		email_address=email_address,
 		subject=subject,
 		message=plaintext_message,
@@ -23,21 +40,162 @@ def send_borrow_receipt(email_address, borrower_name, items, authorised_by):
 	)
 
 
-def send_return_receipt(email_address, borrower_name, items, authorised_by):
+@shared_task(name="send_return_receipt_task")
+def send_return_receipt_task(email_address, borrower_name, items, authorised_by, today):
+	"""
+		Renders and sends a return receipt.
+		Items are passed as a list of item names.
+	"""
 	context = {
 		"borrower_name": borrower_name,
 		"items": items,
 		"gatekeeper": authorised_by,
-		"today": timezone.now(),
+		"today": datetime.datetime.fromisoformat(today),
 	}
 	subject = "Unigames Library Return Receipt"
 	plaintext_message, html_message = render_html_email(
 		template_name="library/email/return_receipt.html",
 		context=context,
 	)
-	send_single_email_task.delay_on_commit(
+	send_single_email_task.delay(
 		email_address=email_address,
 		subject=subject,
 		message=plaintext_message,
 		html_message=html_message
 	)
+
+
+def send_borrow_receipt(email_address, borrower_name, items, authorised_by):
+	"""
+		Queues a borrowing receipt to be rendered and sent once the current transaction commits.
+		items is a list of (Item, due_date) pairs.
+	"""
+	send_borrow_receipt_task.delay_on_commit(
+		email_address=email_address,
+		borrower_name=borrower_name,
+		items=[(str(item), due_date.isoformat()) for item, due_date in items],
+		authorised_by=authorised_by,
+		today=timezone.now().isoformat(),
+	)
+
+
+def send_return_receipt(email_address, borrower_name, items, authorised_by):
+	"""
+		Queues a return receipt to be rendered and sent once the current transaction commits.
+		items is a list of Items.
+	"""
+	send_return_receipt_task.delay_on_commit(
+		email_address=email_address,
+		borrower_name=borrower_name,
+		items=[str(item) for item in items],
+		authorised_by=authorised_by,
+		today=timezone.now().isoformat(),
+	)
+
+
+@shared_task(name="generate_item_image_derivatives_task")
+def generate_item_image_derivatives_task(item_pk):
+	"""
+		Makes the resized copies of an item's image (see library/images.py).
+		Does nothing if they've already been made for the current image.
+	"""
+	from library.models import Item
+	item = Item.objects.filter(pk=item_pk).only("image", "image_derivatives").first()
+	if item is None or not item.image or item.has_image_derivatives:
+		return False
+	derivatives = generate_image_derivatives(item.image.name, item.image.storage)
+	# Only save them if the image hasn't changed again in the meantime.
+	if Item.objects.filter(pk=item_pk, image=item.image.name).update(
+		image_derivatives=derivatives, updated_at=timezone.now()
+	):
+		# The cached pages that show the image should use the copies now.
+		invalidate_public_pages()
+	return True
+
+
+@shared_task(name="rebuild_availability_calendars")
+def rebuild_availability_calendars_task(item_ids=None):
+	"""
+		Scheduled task. (Once a day, just after midnight.)
+		Rebuilds every item's availability calendar, so that they start from today (see library/availability.py).
+		Also used to store the calendars of the given items, when they were found to be stale while reading them.
+	"""
+	from library.availability import rebuild_availability_calendars
+	return len(rebuild_availability_calendars(item_ids))
+
+
+def render_overdue_reminder(email_address, records):
+	"""
+		Renders the overdue reminder for one borrower, about the given BorrowRecords.
+		Returns it as an (email address, subject, message, html message) tuple, for send_personalised_email_batch.
+	"""
+	plaintext_message, html_message = render_html_email(
+		template_name="library/email/reminder_overdue.html",
+		context={
+			"borrower_name": records[0].borrower.internal_member.short_name,
+			"record_list": records,
+		},
+	)
+	return email_address, "Reminder - Overdue Library Items", plaintext_message, html_message
+
+
+@shared_task(name="send_overdue_reminders_task")
+def send_overdue_reminders_task():
+	"""
+		Scheduled task. (Once a day.)
+		Sends each borrower one email listing all of their overdue items.
+		Borrowers who have already been reminded about all of them in the last
+		OVERDUE_REMINDER_INTERVAL_DAYS days are skipped, so running this again on the same day does nothing.
+		
+		The overdue records of the borrowers who are due a reminder are fetched in one query,
+		along with the borrowers' email addresses.
+		The emails are sent in batches of EMAIL_BATCH_SIZE, each over a single connection.
+		Emails that fail aren't recorded as sent, so they're tried again on the next run.
+		External borrowers don't have an email address on record, so they aren't reminded.
+	"""
+	from library.models import BorrowRecord
+	today = timezone.localdate()
+	remind_before = today - datetime.timedelta(days=settings.OVERDUE_REMINDER_INTERVAL_DAYS)
+	overdue_records = BorrowRecord.objects.filter(
+		returned=False,
+		due_date__lt=today,
+		borrower__is_external=False,
+		borrower__internal_member__user__isnull=False,
+	).exclude(
+		borrower__internal_member__user__email="",
+	)
+	# A borrower is due a reminder if any of their overdue records hasn't been reminded about lately.
+	due_a_reminder = overdue_records.filter(
+		Q(last_reminder_date__isnull=True) | Q(last_reminder_date__lte=remind_before),
+		borrower__internal_member__user__email=OuterRef("borrower__internal_member__user__email"),
+	)
+	records = overdue_records.filter(Exists(due_a_reminder)).select_related(
+		"item", "borrower__internal_member__user",
+	).order_by("borrower__internal_member__user__email", "due_date", "item__name")
+	
+	# A member who borrowed more than once gets one email about all of it.
+	reminders = [
+		(email_address, list(borrower_records))
+		for email_address, borrower_records in groupby(
+			records, key=lambda record: record.borrower.internal_member.user.email
+		)
+	]
+	
+	sent = 0
+	failed = 0
+	for batch_start in range(0, len(reminders), settings.EMAIL_BATCH_SIZE):
+		if batch_start > 0 and settings.EMAIL_BATCH_DELAY:
+			time.sleep(settings.EMAIL_BATCH_DELAY)
+		batch = reminders[batch_start:batch_start + settings.EMAIL_BATCH_SIZE]
+		failed_email_addresses = set(send_personalised_email_batch([
+			render_overdue_reminder(email_address, borrower_records) for email_address, borrower_records in batch
+		]))
+		BorrowRecord.objects.filter(pk__in=[
+			record.pk
+			for email_address, borrower_records in batch if email_address not in failed_email_addresses
+			for record in borrower_records
+		]).update(last_reminder_date=today)
+		failed += len(failed_email_addresses)
+		sent += len(batch) - len(failed_email_addresses)
+	logger.info(f"Sent {sent} overdue reminders, {failed} failed.")
+	return {"sent": sent, "failed": failed}
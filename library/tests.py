@@ -1,6 +1,30 @@
-from django.test import TestCase
+import json
+from asgiref.sync import sync_to_async
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+from django.test import TestCase, AsyncRequestFactory, override_settings
+from PIL import Image
+from django.urls import reverse
+from .async_views import (
+	AsyncItemListView, AsyncItemDetailView, AsyncItemSearchView, AsyncItemAutocomplete, AsyncTagDetailView
+)
 from .factories import ItemFactory, LibraryTagFactory, BorrowerDetailsFactory, BorrowRecordFactory, ReservationFactory
-from .models import default_due_date, ReservationStatus
+from .models import default_due_date, ReservationStatus, Item, BorrowRecord, LibraryTag
+from accounts.models import create_fresh_unigames_user
+from members.models import Member, RankChoices
+from .availability import get_availability_calendars
+from .tasks import (
+	send_borrow_receipt_task, generate_item_image_derivatives_task, rebuild_availability_calendars_task,
+	send_overdue_reminders_task,
+)
 import factory.random
 from django.utils import timezone
 from datetime import date, timedelta
@@ -214,5 +238,416 @@ class LibraryModelTests(TestCase):
 		self.assertEquals(availability["available_to_borrow"], False)
 		self.assertEquals(availability["in_clubroom"], True)
 		self.assertEquals(availability["expected_available_date"], timezone.now().date() + timedelta(days=15))
+
+
+class LibraryTaskTests(TestCase):
+	@patch("library.tasks.send_single_email_task.delay")
+	def test_borrow_receipt_rendered_from_serialised_items(self, single_email_delay):
+		send_borrow_receipt_task(
+			email_address="borrower@example.com",
+			borrower_name="Test Borrower",
+			items=[("Star Wars RPG", "2024-03-05")],
+			authorised_by="Test Gatekeeper",
+			today=timezone.now().isoformat(),
+		)
+		single_email_delay.assert_called_once()
+		email_kwargs = single_email_delay.call_args.kwargs
+		self.assertEqual(email_kwargs["email_address"], "borrower@example.com")
+		self.assertIn("Star Wars RPG (due back Tuesday 5th March 2024)", email_kwargs["message"])
+		self.assertIn("Test Gatekeeper", email_kwargs["html_message"])
+	
+	@override_settings(EMAIL_BATCH_SIZE=1, EMAIL_BATCH_DELAY=0)
+	def test_overdue_reminders(self):
+		today = timezone.localdate()
+		members = [
+			Member.objects.create(
+				short_name=f"Member {n}",
+				long_name=f"Member {n}",
+				pronouns="they/them",
+				join_date=today,
+				user=create_fresh_unigames_user(f"member{n}@example.com"),
+			)
+			for n in range(3)
+		]
+		
+		def borrow(member, item_name, due_date):
+			borrower = BorrowerDetailsFactory(is_external=member is None, internal_member=member)
+			return BorrowRecordFactory(borrower=borrower, item__name=item_name, due_date=due_date)
+		
+		# Member 0 borrowed twice, and has two overdue items.
+		borrow(members[0], "Catan", today - timedelta(days=3))
+		borrow(members[0], "Carcassonne", today - timedelta(days=1))
+		borrow(members[0], "Not Overdue", today)
+		borrow(members[1], "Pandemic", today - timedelta(days=10))
+		returned = borrow(members[2], "Returned", today - timedelta(days=10))
+		returned.returned_datetime = timezone.now()
+		returned.save()
+		borrow(None, "External", today - timedelta(days=10))
+		
+		self.assertEqual(send_overdue_reminders_task(), {"sent": 2, "failed": 0})
+		self.assertEqual(len(mail.outbox), 2)
+		digest = next(message for message in mail.outbox if message.to == ["member0@example.com"])
+		self.assertIn("Catan", digest.body)
+		self.assertIn("Carcassonne", digest.body)
+		self.assertNotIn("Not Overdue", digest.body)
+		
+		# Running it again is a single query, and sends nothing.
+		with self.assertNumQueries(1):
+			self.assertEqual(send_overdue_reminders_task(), {"sent": 0, "failed": 0})
+		self.assertEqual(len(mail.outbox), 2)
+		
+		# Something newly overdue gets a reminder, about everything they have overdue.
+		mail.outbox.clear()
+		borrow(members[1], "Ticket to Ride", today - timedelta(days=1))
+		with self.assertNumQueries(2):
+			self.assertEqual(send_overdue_reminders_task(), {"sent": 1, "failed": 0})
+		self.assertEqual(mail.outbox[0].to, ["member1@example.com"])
+		self.assertIn("Pandemic", mail.outbox[0].body)
+		self.assertIn("Ticket to Ride", mail.outbox[0].body)
 		
+		# A week later, they're reminded again.
+		BorrowRecord.objects.update(last_reminder_date=today - timedelta(days=7))
+		self.assertEqual(send_overdue_reminders_task(), {"sent": 2, "failed": 0})
+
+
+class LibraryPaginationTests(TestCase):
+	def setUp(self):
+		self.items = ItemFactory.create_batch(30, image="library/item_images/test.png")
+		self.tag = LibraryTagFactory(name="Dice")
+		for item in self.items[:26]:
+			item.base_tags.add(self.tag)
+	
+	def collect_pages(self, url):
+		names = []
+		response = self.client.get(url)
+		while True:
+			page = response.context["page_obj"]
+			names.extend(item.name for item in page)
+			if not page.has_next():
+				return names, response
+			response = self.client.get(url, {"cursor": page.next_cursor})
+	
+	def test_item_list_pages(self):
+		names, last_response = self.collect_pages(reverse("library:item_list"))
+		self.assertEqual(names, sorted(item.name for item in self.items))
+		self.assertContains(last_response, "Previous")
+	
+	def test_tag_detail_pages(self):
+		names, _ = self.collect_pages(reverse("library:tag_detail", kwargs={"slug": self.tag.slug}))
+		self.assertEqual(names, sorted(item.name for item in self.items[:26]))
+	
+	def test_approximate_count_and_invalid_cursor(self):
+		response = self.client.get(reverse("library:tag_detail", kwargs={"slug": self.tag.slug}), {"cursor": "eyJ2IjpbMSwieCJdLCJkIjoibmV4dCJ9"})
+		self.assertFalse(response.context["page_obj"].has_previous())
+		self.assertEqual(response.context["paginator"].approximate_count, 26)
+		self.assertContains(response, "About 26 results")
+
+
+class AsyncCatalogueViewTests(TestCase):
+	def setUp(self):
+		self.items = ItemFactory.create_batch(30, image="library/item_images/test.png")
+		self.item_type = LibraryTagFactory(name="Item: Board Game", is_item_type=True)
+		self.items[0].base_tags.add(self.item_type)
+		self.factory = AsyncRequestFactory()
+	
+	def get_request(self, path="/", data=None):
+		request = self.factory.get(path, data)
+		request.user = AnonymousUser()
+		return request
+	
+	async def test_item_list_pages(self):
+		view = AsyncItemListView.as_view()
+		response = await view(self.get_request())
+		self.assertContains(response, "card-title", count=24)
+		self.assertContains(response, "About 30 results")
+		self.assertContains(response, "Board Game")
+		next_cursor = response.content.decode().partition("?cursor=")[2].partition('"')[0]
+		response = await view(self.get_request(data={"cursor": next_cursor}))
+		self.assertContains(response, "card-title", count=6)
+		self.assertContains(response, "Previous")
+	
+	async def test_aget_page_matches_get_page(self):
+		from phylactery.pagination import KeysetPaginator
+		paginator = KeysetPaginator(Item.objects.all(), 7, ["name", "id"])
+		page = await paginator.aget_page()
+		self.assertEqual(
+			[item.pk for item in page],
+			[item.pk for item in sorted(self.items, key=lambda item: (item.name, item.pk))[:7]]
+		)
+		next_page = await paginator.aget_page(page.next_cursor)
+		previous_page = await paginator.aget_page(next_page.previous_cursor)
+		self.assertEqual([item.pk for item in previous_page], [item.pk for item in page])
+	
+	async def test_item_detail(self):
+		item = self.items[0]
+		response = await AsyncItemDetailView.as_view()(self.get_request(), slug=item.slug)
+		self.assertContains(response, item.name)
+		self.assertContains(response, "Board Game")
+		with self.assertRaises(Http404):
+			await AsyncItemDetailView.as_view()(self.get_request(), slug="not-an-item")
+	
+	async def test_item_detail_conditional_get(self):
+		item = self.items[0]
+		view = AsyncItemDetailView.as_view()
+		response = await view(self.get_request(), slug=item.slug)
+		self.assertEqual(response.status_code, 200)
+		self.assertIn("no-cache", response["Cache-Control"])
+		request = self.get_request()
+		request.META["HTTP_IF_NONE_MATCH"] = response["ETag"]
+		response = await view(request, slug=item.slug)
+		self.assertEqual(response.status_code, 304)
+	
+	async def test_tag_detail(self):
+		tag = await LibraryTag.objects.acreate(name="Strategy")
+		await sync_to_async(self.items[1].base_tags.add)(tag)
+		view = AsyncTagDetailView.as_view()
+		response = await view(self.get_request(), slug=tag.slug)
+		self.assertContains(response, self.items[1].name)
+		self.assertContains(response, "All items tagged with")
+		self.assertContains(response, "card-title", count=1)
+		request = self.get_request()
+		request.META["HTTP_IF_NONE_MATCH"] = response["ETag"]
+		response = await view(request, slug=tag.slug)
+		self.assertEqual(response.status_code, 304)
+		with self.assertRaises(Http404):
+			await view(self.get_request(), slug="not-a-tag")
+	
+	async def test_search(self):
+		item = self.items[0]
+		response = await AsyncItemSearchView.as_view()(self.get_request(data={"q": f'name:"{item.name}"'}))
+		self.assertContains(response, item.name)
+	
+	async def test_autocomplete(self):
+		response = await AsyncItemAutocomplete.as_view()(self.get_request(data={"page": 2}))
+		data = json.loads(response.content)
+		self.assertEqual(len(data["results"]), 10)
+		self.assertTrue(data["pagination"]["more"])
+		expected = sorted(self.items, key=lambda item: item.name)[10]
+		self.assertEqual(data["results"][0], {"id": str(expected.pk), "text": expected.name, "selected_text": expected.name})
+
 
+class ItemImageDerivativeTests(TestCase):
+	def setUp(self):
+		media_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, media_root)
+		settings_override = override_settings(MEDIA_ROOT=media_root)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+		
+		buffer = BytesIO()
+		Image.new("RGB", (800, 600), "red").save(buffer, format="JPEG")
+		self.image_name = default_storage.save("library/item_images/photo.jpg", ContentFile(buffer.getvalue()))
+		with patch.object(generate_item_image_derivatives_task, "delay"):
+			self.item = ItemFactory(image=self.image_name)
+	
+	def test_derivatives_queued_on_save(self):
+		with (
+			patch.object(generate_item_image_derivatives_task, "delay") as task_delay,
+			self.captureOnCommitCallbacks(execute=True),
+		):
+			self.item.save()
+		task_delay.assert_called_once_with(item_pk=self.item.pk)
+	
+	def test_generate_derivatives(self):
+		self.assertEqual(self.item.get_thumbnail_url(), self.item.image.url)
+		self.assertTrue(generate_item_image_derivatives_task(self.item.pk))
+		self.item.refresh_from_db()
+		self.assertTrue(self.item.has_image_derivatives)
+		self.assertEqual(self.item.image_derivatives["widths"], [160, 320, 640])
+		self.assertEqual(self.item.image_derivatives["format"], "jpg")
+		webp_320 = self.item.image_derivatives["files"]["webp"]["320"]
+		self.assertRegex(webp_320, r"^library/item_images/photo\.[0-9a-f]{16}_320w\.[0-9a-f]{16}\.webp$")
+		with default_storage.open(webp_320) as file, Image.open(file) as image:
+			self.assertEqual((image.format, image.size), ("WEBP", (320, 240)))
+		self.assertTrue(default_storage.exists(self.item.image_derivatives["files"]["jpg"]["640"]))
+		self.assertEqual(self.item.get_thumbnail_url(), f"/media/{self.item.image_derivatives['files']['jpg']['320']}")
+		self.assertIn(f"/media/{self.item.image_derivatives['files']['webp']['160']} 160w", self.item.image_webp_srcset)
+		# Nothing to do the second time.
+		self.assertFalse(generate_item_image_derivatives_task(self.item.pk))
+		
+		response = self.client.get(reverse("library:item_detail", kwargs={"slug": self.item.slug}))
+		self.assertContains(response, 'type="image/webp"')
+	
+	def test_backfill_command(self):
+		call_command("generate_image_derivatives", workers=1, stdout=StringIO())
+		self.item.refresh_from_db()
+		self.assertTrue(self.item.has_image_derivatives)
+	
+	def test_delete_orphaned_media(self):
+		generate_item_image_derivatives_task(self.item.pk)
+		self.item.refresh_from_db()
+		old_image_name = self.item.image.name
+		old_files = [old_image_name] + [
+			name for names in self.item.image_derivatives["files"].values() for name in names.values()
+		]
+		
+		buffer = BytesIO()
+		Image.new("RGB", (100, 100), "blue").save(buffer, format="PNG")
+		self.item.image.save("new.png", ContentFile(buffer.getvalue()), save=False)
+		Item.objects.filter(pk=self.item.pk).update(image=self.item.image.name, image_derivatives={})
+		self.assertNotEqual(self.item.image.name, old_image_name)
+		
+		# Nothing is old enough yet.
+		call_command("delete_orphaned_media", stdout=StringIO())
+		self.assertTrue(all(default_storage.exists(name) for name in old_files))
+		
+		call_command("delete_orphaned_media", min_age=0, stdout=StringIO())
+		self.assertFalse(any(default_storage.exists(name) for name in old_files))
+		self.assertTrue(default_storage.exists(self.item.image.name))
+
+
+class ConditionalGetTests(TestCase):
+	def setUp(self):
+		self.items = ItemFactory.create_batch(3, image="library/item_images/test.png")
+		self.tag = LibraryTagFactory(name="Dice")
+		self.parent_tag = LibraryTagFactory(name="Games")
+		self.items[0].base_tags.add(self.tag)
+		self.items[0].save()
+	
+	def assertNotModified(self, url, response, num_queries=1):
+		# Only the single row for the Last-Modified date is fetched.
+		with self.assertNumQueries(num_queries):
+			repeat_response = self.client.get(url, headers={"If-None-Match": response["ETag"]})
+		self.assertEqual(repeat_response.status_code, 304)
+	
+	def assertModified(self, url, response):
+		self.assertEqual(self.client.get(url, headers={"If-None-Match": response["ETag"]}).status_code, 200)
+	
+	def test_item_detail(self):
+		item = self.items[0]
+		url = reverse("library:item_detail", kwargs={"slug": item.slug})
+		response = self.client.get(url)
+		self.assertIn("no-cache", response["Cache-Control"])
+		self.assertNotModified(url, response)
+		self.assertEqual(
+			self.client.get(url, headers={"If-Modified-Since": response["Last-Modified"]}).status_code, 304
+		)
+		
+		# Renaming one of its tags changes the page.
+		self.tag.name = "Dice (d6)"
+		self.tag.save()
+		self.assertModified(url, response)
+		
+		# So does borrowing it.
+		response = self.client.get(url)
+		BorrowRecordFactory(item=item, borrower=BorrowerDetailsFactory())
+		self.assertModified(url, response)
+		
+		# So does reserving it.
+		response = self.client.get(url)
+		ReservationFactory(
+			reserved_items=[item],
+			requested_date_to_borrow=timezone.now() + timedelta(days=2),
+			requested_date_to_return=timezone.now() + timedelta(days=3),
+		)
+		self.assertModified(url, response)
+		
+		self.assertEqual(self.client.get(reverse("library:item_detail", kwargs={"slug": "missing"})).status_code, 404)
+	
+	def test_tag_detail(self):
+		url = reverse("library:tag_detail", kwargs={"slug": self.tag.slug})
+		response = self.client.get(url)
+		self.assertNotModified(url, response)
+		
+		# Renaming an item with the tag changes the page.
+		self.items[0].name = "Renamed"
+		self.items[0].save()
+		self.assertModified(url, response)
+		
+		# So does adding a parent tag.
+		response = self.client.get(url)
+		self.tag.parents.add(self.parent_tag)
+		self.assertModified(url, response)
+		
+		# So does removing an item from it.
+		response = self.client.get(url)
+		self.items[0].base_tags.remove(self.tag)
+		self.assertModified(url, response)
+		
+		# But not changing an item without the tag.
+		response = self.client.get(url)
+		self.items[1].save()
+		self.assertNotModified(url, response)
+	
+	def test_viewer_changes_the_page(self):
+		member = Member.objects.create(
+			short_name="Viewer",
+			long_name="Viewer",
+			pronouns="they/them",
+			join_date=timezone.now().date(),
+			user=create_fresh_unigames_user("viewer@example.com"),
+		)
+		member.add_rank(RankChoices.LIFEMEMBER)
+		self.client.force_login(member.user)
+		url = reverse("library:item_detail", kwargs={"slug": self.items[0].slug})
+		response = self.client.get(url)
+		self.assertNotContains(response, "Library Dashboard")
+		# The session, user and member, the Last-Modified date, and the member's ranks and membership.
+		self.assertNotModified(url, response, num_queries=6)
+		
+		# Being promoted changes the navbar.
+		member.add_rank(RankChoices.GATEKEEPER)
+		self.assertModified(url, response)
+		response = self.client.get(url)
+		self.assertContains(response, "Library Dashboard")
+		
+		# So does a change of name.
+		member.short_name = "Renamed Viewer"
+		member.save()
+		self.assertModified(url, response)
+
+
+class AvailabilityCalendarTests(TestCase):
+	def setUp(self):
+		self.item = ItemFactory()
+		self.today = timezone.localdate()
+	
+	def get_booked_days(self, days=20):
+		calendar = get_availability_calendars([self.item.pk], days)[self.item.pk]
+		return {day for day, booked in enumerate(calendar) if booked}
+	
+	def test_calendar_follows_borrowing_and_reservations(self):
+		self.assertEqual(self.get_booked_days(), set())
+		
+		with self.captureOnCommitCallbacks(execute=True):
+			record = BorrowRecordFactory(item=self.item, due_date=self.today + timedelta(days=3))
+			ReservationFactory(
+				reserved_items=[self.item],
+				requested_date_to_borrow=self.today + timedelta(days=10),
+				requested_date_to_return=self.today + timedelta(days=12),
+				is_active=True,
+			)
+		self.item.refresh_from_db()
+		self.assertEqual(self.item.availability_calendar_start, self.today)
+		self.assertEqual(self.get_booked_days(), {0, 1, 2, 3, 9, 10, 11, 12})
+		# The calendar agrees with get_availability_info.
+		self.assertEqual(self.item.get_availability_info()["expected_available_date"], self.today + timedelta(days=4))
+		
+		with self.captureOnCommitCallbacks(execute=True):
+			record.returned_datetime = timezone.now()
+			record.save()
+		self.assertEqual(self.get_booked_days(), {9, 10, 11, 12})
+	
+	def test_stale_calendars_are_rebuilt(self):
+		BorrowRecordFactory(item=self.item, due_date=self.today + timedelta(days=1))
+		stale_start = self.today - timedelta(days=170)
+		Item.objects.filter(pk=self.item.pk).update(availability_calendar=b"", availability_calendar_start=stale_start)
+		with patch.object(rebuild_availability_calendars_task, "delay") as delay:
+			with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(3):
+				self.assertEqual(self.get_booked_days(), {0, 1})
+		# Nothing is written while reading. The calendar is stored in the background instead.
+		self.item.refresh_from_db()
+		self.assertEqual(self.item.availability_calendar_start, stale_start)
+		delay.assert_called_once_with(item_ids=[self.item.pk])
+		rebuild_availability_calendars_task(item_ids=[self.item.pk])
+		self.item.refresh_from_db()
+		self.assertEqual(self.item.availability_calendar_start, self.today)
+		self.assertEqual(self.get_booked_days(), {0, 1})
+		self.item.refresh_from_db()
+		self.assertEqual(self.item.availability_calendar_start, self.today)
+		
+		# The nightly rebuild moves every calendar along to today.
+		Item.objects.update(availability_calendar_start=self.today - timedelta(days=1))
+		self.assertEqual(rebuild_availability_calendars_task(), 1)
+		self.item.refresh_from_db()
+		self.assertEqual(self.item.availability_calendar_start, self.today)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from library.autocompletes import ItemAutocomplete, LibraryTagAutocomplete
 from library.wizards import (
@@ -22,6 +23,17 @@ from library.views import (
 	SearchSyntaxView,
 )
 
+if settings.ASYNC_CATALOGUE_VIEWS:
+	from library.async_views import (
+		AsyncItemAutocomplete as ItemAutocomplete,
+		AsyncLibraryTagAutocomplete as LibraryTagAutocomplete,
+		AsyncItemDetailView as ItemDetailView,
+		AsyncItemListView as ItemListView,
+		AsyncItemSearchView as ItemSearchView,
+		AsyncTagDetailView as TagDetailView,
+		AsyncTagListView as TagListView,
+	)
+
 
 app_name = 'library'
 urlpatterns = [
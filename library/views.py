@@ -1,7 +1,7 @@
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
-from django.db.models import Count, Q
+from django.db.models import Count, OuterRef, Q, Subquery
 from django.db.models.functions import Now
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect
@@ -9,14 +9,20 @@ from django.views.generic import DetailView, ListView, TemplateView, FormView, U
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from datetime import timedelta
-from library.models import Item, LibraryTag, BorrowerDetails, Reservation, ReservationStatus, BorrowRecord
+from library.models import (
+	Item, LibraryTag, BorrowerDetails, Reservation, ReservationStatus, BorrowRecord,
+	BaseTaggedLibraryItem, ComputedTaggedLibraryItem, prefetch_item_types
+)
 from library.forms import ExternalReservationRequestForm, InternalReservationRequestForm, ReservationModelForm, ReturnItemFormset, VerifyReturnFormset
 from library.search import SearchQueryManager
 from members.decorators import gatekeeper_required, committee_required
+from phylactery.caching import ConditionalGetMixin
+from phylactery.db_routing import ReplicaReadsMixin
+from phylactery.pagination import KeysetPaginationMixin
 
 
 @method_decorator(gatekeeper_required, name="dispatch")
-class DashboardView(TemplateView):
+class DashboardView(ReplicaReadsMixin, TemplateView):
 	template_name = "library/dashboard_view.html"
 	
 	def get_context_data(self, **kwargs):
@@ -66,35 +72,56 @@ class DashboardView(TemplateView):
 		return context
 
 
-class ItemDetailView(DetailView):
+class ItemDetailView(ReplicaReadsMixin, ConditionalGetMixin, DetailView):
 	model = Item
 	template_name = "library/item_detail_view.html"
 	slug_field = "slug"
+	# The item's availability depends on today's date.
+	pages_change_daily = True
+	
+	def get_last_modified(self):
+		return get_item_last_modified(self.kwargs[self.slug_url_kwarg])
 	
 	def get_context_data(self, **kwargs):
 		context = super().get_context_data(**kwargs)
 		context["item_info"] = self.object.get_availability_info()
-		if context["item_info"]["in_clubroom"] is False:
-			today = timezone.now().date()
-			tomorrow = today + timedelta(days=1)
-			if context["item_info"]["expected_available_date"] not in [today, tomorrow]:
-				context["available_str"] = ""
-			elif context["item_info"]["expected_available_date"] == today:
-				context["available_str"] = "today"
-			elif context["item_info"]["expected_available_date"] == tomorrow:
-				context["available_str"] = "tomorrow"
+		context.update(self.get_available_str_context(context["item_info"]))
 		context["item_types"] = self.object.base_tags.filter(is_item_type=True)
 		return context
+	
+	@staticmethod
+	def get_available_str_context(item_info):
+		# Describes when an item that isn't in the clubroom is due back, if it's soon.
+		if item_info["in_clubroom"] is False:
+			today = timezone.now().date()
+			tomorrow = today + timedelta(days=1)
+			if item_info["expected_available_date"] not in [today, tomorrow]:
+				return {"available_str": ""}
+			elif item_info["expected_available_date"] == today:
+				return {"available_str": "today"}
+			elif item_info["expected_available_date"] == tomorrow:
+				return {"available_str": "tomorrow"}
+		return {}
 
 
-class ItemListView(ListView):
+def get_item_last_modified(slug):
+	return Item.objects.filter(slug=slug).values_list("updated_at", flat=True).first()
+
+
+class ItemListView(ReplicaReadsMixin, KeysetPaginationMixin, ListView):
 	model = Item
 	template_name = "library/item_list_view.html"
 	context_object_name = "items_list"
 	paginate_by = 24
+	# Same as Item.Meta.ordering, with the id to break ties.
+	keyset_ordering = ["name", "id"]
+	keyset_approximate_count = True
+	
+	def get_queryset(self):
+		return prefetch_item_types(super().get_queryset())
 
 
-class ItemSearchView(ListView):
+class ItemSearchView(ReplicaReadsMixin, KeysetPaginationMixin, ListView):
 	"""
 	Identical to the ItemListView above,
 	except we also handle simple searches.
@@ -103,6 +130,8 @@ class ItemSearchView(ListView):
 	template_name = "library/item_search_view.html"
 	context_object_name = "items_list"
 	paginate_by = 24
+	keyset_ordering = ["name", "id"]
+	keyset_approximate_count = True
 	
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
@@ -118,7 +147,7 @@ class ItemSearchView(ListView):
 	
 	def get_queryset(self):
 		if self.manager:
-			return self.manager.get_results()
+			return prefetch_item_types(self.manager.get_results())
 		else:
 			return Item.objects.none()
 	
@@ -136,43 +165,77 @@ class SearchSyntaxView(TemplateView):
 	template_name = "library/search_syntax.html"
 
 
-class TagListView(ListView):
+class TagListView(ReplicaReadsMixin, ListView):
 	model = LibraryTag
 	template_name = "library/tag_list_view.html"
 	context_object_name = "tags_list"
 	
 	def get_queryset(self):
-		qs = (
-			LibraryTag.objects.exclude(name__startswith="Item: ")
-			.annotate(num_items=Count('computed_items'))
-			.filter(num_items__gt=0, is_item_type=False, is_tag_category=False)
-			.order_by('-num_items', 'name')
-		)
-		return qs
+		return get_tag_list_queryset()
+
 
+def get_tag_list_queryset():
+	return (
+		LibraryTag.objects.exclude(name__startswith="Item: ")
+		.annotate(num_items=Count('computed_items'))
+		.filter(num_items__gt=0, is_item_type=False, is_tag_category=False)
+		.order_by('-num_items', 'name')
+	)
 
-class TagDetailView(ListView):
+
+class TagDetailView(ReplicaReadsMixin, ConditionalGetMixin, KeysetPaginationMixin, ListView):
 	model = Item
 	template_name = "library/item_list_view.html"
 	context_object_name = "items_list"
+	paginate_by = 24
+	keyset_ordering = ["name", "id"]
+	keyset_approximate_count = True
+	
+	def get_last_modified(self):
+		return get_tag_last_modified(self.kwargs["slug"])
 	
 	def get_queryset(self):
 		self.tag = get_object_or_404(LibraryTag, slug=self.kwargs["slug"])
-		qs = (
-			Item.objects.filter(
-				Q(base_tags__in=[self.tag]) | Q(computed_tags__in=[self.tag])
-			).distinct()
-		)
-		return qs
+		return prefetch_item_types(get_tag_items_queryset(self.tag))
 
 	def get_context_data(self, *args, **kwargs):
 		context = super().get_context_data(*args, **kwargs)
-		context["page_title"] = f"All items tagged with '{self.tag}'"
-		context["parent_tags"] = self.tag.parents.exclude(name__startswith="Item: ")
-		context["child_tags"] = self.tag.children.exclude(name__startswith="Item: ")
+		context.update(get_tag_context(self.tag))
 		return context
 
 
+def get_tag_last_modified(slug):
+	# The tag's updated_at covers items being added to or removed from it, and its parents and children.
+	# Changes to the items themselves come from the most recently updated item.
+	tag_items = BaseTaggedLibraryItem.objects.filter(tag=OuterRef(OuterRef("pk"))).values("content_object")
+	computed_tag_items = ComputedTaggedLibraryItem.objects.filter(tag=OuterRef(OuterRef("pk"))).values("content_object")
+	row = LibraryTag.objects.filter(slug=slug).annotate(
+		items_updated_at=Subquery(
+			Item.objects.filter(Q(pk__in=tag_items) | Q(pk__in=computed_tag_items))
+			.order_by("-updated_at").values("updated_at")[:1]
+		)
+	).values_list("updated_at", "items_updated_at").first()
+	if row is None:
+		return None
+	return max(timestamp for timestamp in row if timestamp is not None)
+
+
+def get_tag_items_queryset(tag):
+	# Subqueries rather than joins, so that no DISTINCT is needed.
+	return Item.objects.filter(
+		Q(pk__in=BaseTaggedLibraryItem.objects.filter(tag=tag).values("content_object"))
+		| Q(pk__in=ComputedTaggedLibraryItem.objects.filter(tag=tag).values("content_object"))
+	)
+
+
+def get_tag_context(tag):
+	return {
+		"page_title": f"All items tagged with '{tag}'",
+		"parent_tags": tag.parents.exclude(name__startswith="Item: "),
+		"child_tags": tag.children.exclude(name__startswith="Item: "),
+	}
+
+
 class ExternalReservationRequestView(FormView):
 	"""
 	Renders the External Reservation Request form.
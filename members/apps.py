@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MembersConfig(AppConfig):
 	default_auto_field = 'django.db.models.BigAutoField'
 	name = 'members'
+	
+	def ready(self):
+		from .models import sync_permission_groups
+		post_migrate.connect(sync_permission_groups, sender=self, dispatch_uid="members_sync_permission_groups")
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-19 07:15
+
+from django.db import migrations
+from django.db.models import Q
+
+# A copy of members.models.ADVANCED_MODELS at the time of this migration.
+ADVANCED_MODELS = [
+    "logentry", "permission", "group", "contenttype", "session", "site",
+    "emailaddress", "emailconfirmation", "socialaccount", "socialapp", "socialtoken",
+    "unigamesuser"
+]
+
+
+def move_staff_permissions_to_groups(apps, schema_editor):
+    # Staff users get their permissions from groups now, so drop the copies on each user that the groups cover.
+    # Anything else was granted by hand, so it's kept.
+    # The groups' permissions are filled in by members.models.sync_permission_groups after migrating.
+    db_alias = schema_editor.connection.alias
+    Group = apps.get_model("auth", "Group")
+    UnigamesUser = apps.get_model("accounts", "UnigamesUser")
+    UserPermission = UnigamesUser.user_permissions.through
+    committee_staff_group, _ = Group.objects.using(db_alias).get_or_create(name="Committee staff")
+    webkeeper_group, _ = Group.objects.using(db_alias).get_or_create(name="Webkeeper")
+    committee_staff_group.user_set.add(*UnigamesUser.objects.using(db_alias).filter(is_staff=True))
+    webkeeper_group.user_set.add(*UnigamesUser.objects.using(db_alias).filter(is_superuser=True))
+    # Webkeepers get every permission.
+    UserPermission.objects.using(db_alias).filter(unigamesuser__is_superuser=True).delete()
+    # Committee staff get everything except changes to advanced models.
+    UserPermission.objects.using(db_alias).filter(unigamesuser__is_staff=True).filter(
+        Q(permission__content_type__model__in=ADVANCED_MODELS, permission__codename__startswith="view_") |
+        ~Q(permission__content_type__model__in=ADVANCED_MODELS)
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0010_alter_member_options'),
+        ('accounts', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_staff_permissions_to_groups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-19 07:18
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0011_move_staff_permissions_to_groups'),
+        # The trigram indexes need the pg_trgm extension.
+        ('library', '0024_trigram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['long_name', 'id'], name='member_long_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['student_number'], name='member_student_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['short_name'], name='member_short_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['long_name'], name='member_long_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-19 08:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0012_member_member_long_name_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PermissionSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('synced_on', models.DateField()),
+                ('full_sync', models.BooleanField(default=False)),
+                ('members_synced', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-synced_on', '-pk'],
+            },
+        ),
+    ]
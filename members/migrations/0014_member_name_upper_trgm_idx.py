@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-19 11:40
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0013_permissionsync'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='member',
+            name='member_short_name_trgm_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='member',
+            name='member_long_name_trgm_idx',
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('short_name'), name='gin_trgm_ops'), name='member_short_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('long_name'), name='gin_trgm_ops'), name='member_long_name_trgm_idx'),
+        ),
+    ]
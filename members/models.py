@@ -1,13 +1,18 @@
 import datetime
-from django.contrib.auth.models import Permission
+from django.apps import apps as global_apps
+from django.contrib.auth.management import create_permissions
+from django.contrib.auth.models import Group, Permission
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from collections import defaultdict
+from django.db import DEFAULT_DB_ALIAS, models, transaction
 from django.db.models import Case, When, Value, Q
-from django.db.models.functions import Now
+from django.db.models.functions import Now, Upper
 from django.utils import timezone
 
 from accounts.models import UnigamesUser
 from library.models import BorrowRecord
+from phylactery.caching import invalidate_public_pages
 
 # Advanced models are models we shouldn't let anyone but Webkeepers touch.
 # For permission syncing.
@@ -17,6 +22,11 @@ ADVANCED_MODELS = [
 	"unigamesuser"
 ]
 
+# Staff get their admin site permissions through these groups, rather than having them copied onto each user.
+# The groups' permissions are kept up-to-date by sync_permission_groups, after every migrate.
+COMMITTEE_STAFF_GROUP_NAME = "Committee staff"
+WEBKEEPER_GROUP_NAME = "Webkeeper"
+
 
 class Member(models.Model):
 	"""
@@ -46,6 +56,14 @@ class Member(models.Model):
 	
 	class Meta:
 		ordering = ["long_name"]
+		indexes = [
+			# For the member list, which is ordered and paginated by (long_name, id).
+			models.Index(fields=["long_name", "id"], name="member_long_name_id_idx"),
+			models.Index(fields=["student_number"], name="member_student_number_idx"),
+			# Trigram indexes, for name searches. icontains compares UPPER(name), so that's what gets indexed.
+			GinIndex(OpClass(Upper("short_name"), name="gin_trgm_ops"), name="member_short_name_trgm_idx"),
+			GinIndex(OpClass(Upper("long_name"), name="gin_trgm_ops"), name="member_long_name_trgm_idx"),
+		]
 	
 	# Methods
 	def __str__(self):
@@ -83,9 +101,7 @@ class Member(models.Model):
 		"""
 		Expires all active ranks of the chosen type from this member.
 		"""
-		ranks_to_expire = self.ranks.filter(expired=False, rank_name=rank_name)
-		for rank in ranks_to_expire:
-			rank.set_expired()
+		expire_ranks(self.ranks.filter(rank_name=rank_name))
 	
 	def has_active_membership(self):
 		# Returns True if the member has a valid membership.
@@ -147,30 +163,8 @@ class Member(models.Model):
 			# Can't do anything.
 			return False
 		
-		# is_staff controls whether the user can log into the admin site.
-		# Only committee and webkeepers get to do that.
-		is_staff = False
-		if self.is_committee():
-			is_staff = True
-		
-		is_superuser = False
-		if self.has_rank(RankChoices.WEBKEEPER) and self.is_valid_member():
-			is_superuser = True
-		
-		if not is_staff:
-			# If they can't log in to the admin site,
-			# might as well remove all permissions.
-			self.user.user_permissions.clear()
-		else:
-			# This should get fetch all permissions, except for those that add, change, or delete advanced models.
-			permissions_to_set = Permission.objects.filter(
-				Q(content_type__model__in=ADVANCED_MODELS, codename__startswith="view_") |
-				~Q(content_type__model__in=ADVANCED_MODELS)
-			)
-			self.user.user_permissions.set(permissions_to_set)
-		self.user.is_staff = is_staff
-		self.user.is_superuser = is_superuser
-		self.user.save()
+		sync_member_permissions([self.pk])
+		self.user.refresh_from_db(fields=["is_staff", "is_superuser"])
 		return True
 	
 	def get_borrow_records(self):
@@ -225,6 +219,168 @@ class RankChoices(models.TextChoices):
 	IPP = 'IPP', 'IPP (Immediate Past President)'
 
 
+def get_staff_permission_ids(using=DEFAULT_DB_ALIAS):
+	"""
+	Returns the ids of the permissions that staff users should have.
+	This should be all permissions, except for those that add, change, or delete advanced models.
+	"""
+	return set(Permission.objects.using(using).filter(
+		Q(content_type__model__in=ADVANCED_MODELS, codename__startswith="view_") |
+		~Q(content_type__model__in=ADVANCED_MODELS)
+	).values_list("pk", flat=True))
+
+
+def get_permission_groups(using=DEFAULT_DB_ALIAS):
+	"""
+	Returns the Committee staff and Webkeeper groups, creating them if they don't exist yet.
+	"""
+	committee_staff_group, _ = Group.objects.using(using).get_or_create(name=COMMITTEE_STAFF_GROUP_NAME)
+	webkeeper_group, _ = Group.objects.using(using).get_or_create(name=WEBKEEPER_GROUP_NAME)
+	return committee_staff_group, webkeeper_group
+
+
+def sync_permission_groups(using=DEFAULT_DB_ALIAS, verbosity=1, apps=global_apps, **kwargs):
+	"""
+	Gives the Committee staff and Webkeeper groups their permissions.
+	Connected to post_migrate for this app, so that permissions for new models are picked up.
+	Apps installed after this one haven't had their permissions created yet when it runs, so create them first.
+	"""
+	for app_config in global_apps.get_app_configs():
+		create_permissions(app_config, verbosity=verbosity, using=using, apps=apps)
+	committee_staff_group, webkeeper_group = get_permission_groups(using)
+	committee_staff_group.permissions.set(get_staff_permission_ids(using))
+	webkeeper_group.permissions.set(Permission.objects.using(using).all())
+
+
+def sync_member_permissions(member_ids, groups=None):
+	"""
+	Syncs the admin site permissions of the given members, based on the ranks that they have.
+	This does the same work as Member.sync_permissions, but with a fixed number of queries
+	no matter how many members there are. Only group memberships and users that need to change are written.
+	groups can be passed in, if they have already been fetched with get_permission_groups().
+	Returns the number of users that were synced.
+	"""
+	members = list(Member.objects.filter(pk__in=member_ids, user__isnull=False).select_related("user"))
+	if not members:
+		return 0
+	member_ids = [member.pk for member in members]
+	committee_staff_group, webkeeper_group = groups or get_permission_groups()
+	
+	active_ranks = defaultdict(set)
+	for member_id, rank_name in Rank.objects.all_active().filter(member__in=member_ids).values_list(
+			"member", "rank_name"
+	):
+		active_ranks[member_id].add(rank_name)
+	has_active_membership = set(
+		Membership.objects.filter(member__in=member_ids, expired=False).values_list("member", flat=True)
+	)
+	
+	changed_users = []
+	desired_user_groups = set()
+	for member in members:
+		ranks = active_ranks[member.pk]
+		# Same rules as Member.is_valid_member, is_committee and is_webkeeper.
+		is_valid_member = (
+			(member.pk in has_active_membership or RankChoices.LIFEMEMBER in ranks)
+			and RankChoices.EXCLUDED not in ranks
+		)
+		# is_staff controls whether the user can log into the admin site.
+		# Only committee and webkeepers get to do that.
+		is_staff = is_valid_member and bool(ranks & {RankChoices.COMMITTEE, RankChoices.WEBKEEPER})
+		is_superuser = is_valid_member and RankChoices.WEBKEEPER in ranks
+		if is_staff:
+			desired_user_groups.add((member.user.pk, committee_staff_group.pk))
+		if is_superuser:
+			desired_user_groups.add((member.user.pk, webkeeper_group.pk))
+		if (member.user.is_staff, member.user.is_superuser) != (is_staff, is_superuser):
+			member.user.is_staff = is_staff
+			member.user.is_superuser = is_superuser
+			changed_users.append(member.user)
+	
+	# Work out the difference between the groups users are in, and the ones they should be in.
+	UserGroup = UnigamesUser.groups.through
+	existing_user_groups = {}
+	for user_group_id, user_id, group_id in UserGroup.objects.filter(
+			unigamesuser__in=[member.user.pk for member in members],
+			group__in=[committee_staff_group.pk, webkeeper_group.pk],
+	).values_list("pk", "unigamesuser", "group"):
+		existing_user_groups[(user_id, group_id)] = user_group_id
+	user_groups_to_delete = [
+		user_group_id for user_group, user_group_id in existing_user_groups.items()
+		if user_group not in desired_user_groups
+	]
+	user_groups_to_create = [
+		UserGroup(unigamesuser_id=user_id, group_id=group_id)
+		for user_id, group_id in desired_user_groups - existing_user_groups.keys()
+	]
+	
+	with transaction.atomic():
+		if user_groups_to_delete:
+			UserGroup.objects.filter(pk__in=user_groups_to_delete).delete()
+		if user_groups_to_create:
+			UserGroup.objects.bulk_create(user_groups_to_create)
+		if changed_users:
+			UnigamesUser.objects.bulk_update(changed_users, ["is_staff", "is_superuser"], batch_size=500)
+	return len(members)
+
+
+def get_member_ids_to_sync(since=None):
+	"""
+	Returns the ids of the members whose permissions might be out of date.
+	
+	Staff status can only be gained through a new rank, a new membership, or a rank (e.g. Excluded) expiring,
+	so only members with one of those since the given date need checking. Any other change can only take
+	staff status away, so every current staff user is checked as well.
+	If since is None, returns every member with a user.
+	"""
+	members_with_users = Member.objects.filter(user__isnull=False)
+	if since is None:
+		return set(members_with_users.values_list("pk", flat=True))
+	member_ids = set(members_with_users.filter(user__is_staff=True).values_list("pk", flat=True))
+	member_ids.update(Rank.objects.filter(
+		Q(assigned_date__gte=since) | Q(expired_date__gte=since, expired_date__lte=datetime.date.today())
+	).values_list("member", flat=True))
+	member_ids.update(Membership.objects.filter(date_purchased__gte=since).values_list("member", flat=True))
+	member_ids.discard(None)
+	return member_ids
+
+
+def expire_ranks(ranks):
+	"""
+	Expires all the active ranks in the given queryset with a single UPDATE,
+	then syncs the permissions of each affected member once.
+	(Rank.set_expired would sync the permissions once per rank.)
+	Returns the ids of the affected members.
+	"""
+	rank_ids = []
+	member_ids = set()
+	expires_committee_position = False
+	for rank_id, member_id, rank_name in ranks.filter(expired=False).values_list("pk", "member", "rank_name"):
+		rank_ids.append(rank_id)
+		member_ids.add(member_id)
+		expires_committee_position = expires_committee_position or rank_name in COMMITTEE_POSITIONS
+	with transaction.atomic():
+		Rank.objects.filter(pk__in=rank_ids).update(expired_date=datetime.date.today())
+		sync_member_permissions(member_ids)
+	if expires_committee_position:
+		# update() doesn't send post_save, so the committee page needs to be invalidated here.
+		invalidate_public_pages()
+	return member_ids
+
+
+# The positions shown on the committee page, in order.
+COMMITTEE_POSITIONS = [
+	RankChoices.PRESIDENT,
+	RankChoices.VICEPRESIDENT,
+	RankChoices.TREASURER,
+	RankChoices.SECRETARY,
+	RankChoices.LIBRARIAN,
+	RankChoices.FRESHERREP,
+	RankChoices.OCM,
+	RankChoices.IPP,
+]
+
+
 class RankManager(models.Manager):
 	"""
 	Custom manager for ranks - this will annotate all Ranks with an easy to use "expired" field.
@@ -246,20 +402,14 @@ class RankManager(models.Manager):
 	
 	def get_committee(self):
 		"""
-		Returns a dictionary that maps the committee ranks into QuerySets of the members that have them.
+		Returns a dictionary that maps the committee ranks into lists of the active Ranks for them.
+		Every position is included, even if nobody holds it. The members are fetched in the same query.
 		"""
-		committee_data = {}
-		for committee_rank in [
-			RankChoices.PRESIDENT,
-			RankChoices.VICEPRESIDENT,
-			RankChoices.TREASURER,
-			RankChoices.SECRETARY,
-			RankChoices.LIBRARIAN,
-			RankChoices.FRESHERREP,
-			RankChoices.OCM,
-			RankChoices.IPP,
-		]:
-			committee_data[committee_rank] = self.all_active().filter(rank_name=committee_rank).order_by("pk")
+		committee_data = {committee_rank: [] for committee_rank in COMMITTEE_POSITIONS}
+		for rank in self.all_active().filter(
+				rank_name__in=COMMITTEE_POSITIONS
+		).select_related("member").order_by("pk"):
+			committee_data[rank.rank_name].append(rank)
 		return committee_data
 
 
@@ -303,3 +453,19 @@ class Rank(models.Model):
 		# Set the expiry date to today.
 		self.expired_date = datetime.date.today()
 		self.save()
+
+
+class PermissionSync(models.Model):
+	"""
+	Records each run of the cleanup_permissions task,
+	so that the next run only needs to check the members that have changed since.
+	"""
+	synced_on = models.DateField()
+	full_sync = models.BooleanField(default=False)
+	members_synced = models.PositiveIntegerField(default=0)
+	
+	class Meta:
+		ordering = ["-synced_on", "-pk"]
+	
+	def __str__(self):
+		return f"Permission sync on {self.synced_on} ({self.members_synced} members)"
@@ -0,0 +1,49 @@
+"""
+	Member search:
+		A student number (digits only) matches that exact student number.
+		An email address matches that exact email address (ignoring case).
+		Anything else matches members with it anywhere in either name (ignoring case).
+	
+	Every result is annotated with a match_rank between 0 and 1, with 1 being the best match.
+	All of these lookups are backed by indexes on Member and UnigamesUser.
+"""
+import re
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Q, Value, FloatField
+from django.db.models.functions import Cast, Greatest
+from members.models import Member
+
+
+STUDENT_NUMBER_PATTERN = re.compile(r"^\d{1,10}$")
+
+
+def search_members(search_query, queryset=None):
+	"""
+	Returns a queryset of the members matching the search query, annotated with a match_rank.
+	"""
+	if queryset is None:
+		queryset = Member.objects.all()
+	search_query = search_query.strip()
+	
+	if STUDENT_NUMBER_PATTERN.match(search_query):
+		return queryset.filter(student_number=search_query).annotate(match_rank=Value(1.0, output_field=FloatField()))
+	if "@" in search_query:
+		return queryset.filter(user__email__iexact=search_query).annotate(
+			match_rank=Value(1.0, output_field=FloatField())
+		)
+	
+	# The icontains lookups use the trigram indexes on UPPER(name).
+	# Word similarity scores how well the query matches the best part of each name,
+	# so "john" is a perfect match for "John Smith".
+	# The rank is cast to double precision so that it survives round trips through a pagination cursor.
+	return queryset.filter(
+		Q(short_name__icontains=search_query) | Q(long_name__icontains=search_query)
+	).annotate(
+		match_rank=Cast(
+			Greatest(
+				TrigramWordSimilarity(search_query, "short_name"),
+				TrigramWordSimilarity(search_query, "long_name"),
+			),
+			output_field=FloatField()
+		)
+	)
@@ -1,3 +1,4 @@
+import datetime
 from celery import shared_task
 from celery.utils.log import get_task_logger
 
@@ -5,15 +6,23 @@ logger = get_task_logger(__name__)
 
 
 @shared_task(name="cleanup_permissions")
-def cleanup_permissions():
+def cleanup_permissions(full_sync=False):
 	"""
 		Scheduled task. (Once a day.)
-		Syncs the permissions of every user,
+		Syncs the permissions of users whose ranks or memberships have changed
+		since the last run, as well as every staff user,
 		so that permissions are removed when ranks expire.
+		If full_sync is True, every user is synced instead.
 	"""
-	from members.models import Member
-	successful = 0
-	for member in Member.objects.all():
-		if member.sync_permissions():
-			successful += 1
+	from members.models import (
+		PermissionSync, get_member_ids_to_sync, get_permission_groups, sync_member_permissions
+	)
+	today = datetime.date.today()
+	# The date of the last run is kept in the database, so that every worker process sees it.
+	# If there isn't one, every member is checked.
+	last_sync = None if full_sync else PermissionSync.objects.values_list("synced_on", flat=True).first()
+	member_ids = get_member_ids_to_sync(since=last_sync)
+	successful = sync_member_permissions(member_ids, groups=get_permission_groups())
+	PermissionSync.objects.create(synced_on=today, full_sync=last_sync is None, members_synced=successful)
 	logger.info(f"Synced permissions of {successful} members.")
+	return successful
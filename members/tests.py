@@ -1,3 +1,213 @@
+import datetime
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.apps import apps as global_apps
+from django.contrib.auth.models import Permission
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import UnigamesUser, create_fresh_unigames_user
+from control_panel.forms import expire_active_ranks
+from phylactery.pagination import KeysetPaginator
+from .models import (
+	Member, Membership, PermissionSync, Rank, RankChoices, sync_member_permissions,
+	COMMITTEE_STAFF_GROUP_NAME, WEBKEEPER_GROUP_NAME
+)
+from .search import search_members
+from .tasks import cleanup_permissions
+
+
+class RankExpiryTests(TestCase):
+	def create_member(self, n, *rank_names):
+		member = Member.objects.create(
+			short_name=f"Member {n}",
+			long_name=f"Member Number {n}",
+			pronouns="they/them",
+			join_date=datetime.date.today(),
+			user=create_fresh_unigames_user(f"member{n}@example.com"),
+		)
+		Membership.objects.create(member=member, guild_member=True, amount_paid=5)
+		for rank_name in rank_names:
+			member.add_rank(rank_name)
+		return member
+	
+	def test_expire_active_ranks_in_bulk(self):
+		gatekeepers = [self.create_member(n, RankChoices.GATEKEEPER) for n in range(10)]
+		committee = self.create_member(10, RankChoices.GATEKEEPER, RankChoices.COMMITTEE)
+		self.assertTrue(committee.user.is_staff)
+		
+		with CaptureQueriesContext(connection) as queries:
+			expired_members = expire_active_ranks(RankChoices.GATEKEEPER, RankChoices.COMMITTEE)
+		# The number of queries shouldn't depend on the number of ranks expired.
+		self.assertLess(len(queries), 15)
+		self.assertEqual(set(expired_members), {member.long_name for member in gatekeepers})
+		self.assertFalse(any(member.has_rank(RankChoices.GATEKEEPER) for member in gatekeepers))
+		self.assertTrue(committee.has_rank(RankChoices.GATEKEEPER))
+		self.assertEqual(Rank.objects.all_expired().count(), 10)
+	
+	def test_sync_member_permissions(self):
+		webkeeper = self.create_member(0, RankChoices.WEBKEEPER)
+		committee = self.create_member(1, RankChoices.COMMITTEE)
+		excluded = self.create_member(2, RankChoices.COMMITTEE, RankChoices.EXCLUDED)
+		regular = self.create_member(3)
+		self.assertEqual(sync_member_permissions([webkeeper.pk, committee.pk, excluded.pk, regular.pk]), 4)
+		
+		for member, is_staff, is_superuser in [
+			(webkeeper, True, True),
+			(committee, True, False),
+			(excluded, False, False),
+			(regular, False, False),
+		]:
+			member.user.refresh_from_db()
+			self.assertEqual(member.user.is_staff, is_staff)
+			self.assertEqual(member.user.is_superuser, is_superuser)
+			self.assertEqual(member.user.groups.filter(name=COMMITTEE_STAFF_GROUP_NAME).exists(), is_staff)
+			self.assertEqual(member.user.groups.filter(name=WEBKEEPER_GROUP_NAME).exists(), is_superuser)
+			self.assertFalse(member.user.user_permissions.exists())
+		
+		committee.user = UnigamesUser.objects.get(pk=committee.user.pk)
+		self.assertTrue(committee.user.has_perm("library.change_item"))
+		# Apps installed after members get their permissions created before the groups are synced.
+		self.assertTrue(committee.user.has_perm("blog.change_blogpost"))
+		self.assertTrue(committee.user.has_perm("auth.view_permission"))
+		self.assertFalse(committee.user.has_perm("auth.change_permission"))
+		
+		committee.remove_rank(RankChoices.COMMITTEE)
+		committee.user.refresh_from_db()
+		self.assertFalse(committee.user.is_staff)
+		self.assertFalse(committee.user.groups.exists())
+
+
+	def test_moving_staff_permissions_keeps_others(self):
+		move_staff_permissions_to_groups = import_module(
+			"members.migrations.0011_move_staff_permissions_to_groups"
+		).move_staff_permissions_to_groups
+		committee = self.create_member(0).user
+		committee.is_staff = True
+		committee.save()
+		regular = self.create_member(1).user
+		change_item = Permission.objects.get(codename="change_item")
+		change_group = Permission.objects.get(codename="change_group")
+		committee.user_permissions.add(change_item, change_group)
+		regular.user_permissions.add(change_item)
+		
+		move_staff_permissions_to_groups(global_apps, SimpleNamespace(connection=connection))
+		# The group covers change_item, but changing groups was granted by hand.
+		self.assertEqual(list(committee.user_permissions.all()), [change_group])
+		self.assertEqual(list(regular.user_permissions.all()), [change_item])
+		self.assertTrue(committee.groups.filter(name=COMMITTEE_STAFF_GROUP_NAME).exists())
+
+
+class CleanupPermissionsTests(TestCase):
+	def setUp(self):
+		self.members = [
+			Member.objects.create(
+				short_name=f"Member {n}",
+				long_name=f"Member Number {n}",
+				pronouns="they/them",
+				join_date=datetime.date.today(),
+				user=create_fresh_unigames_user(f"member{n}@example.com"),
+			)
+			for n in range(10)
+		]
+		self.committee = self.members[0]
+		Membership.objects.create(member=self.committee, guild_member=True, amount_paid=5)
+		self.committee.add_rank(RankChoices.COMMITTEE)
+	
+	def test_incremental_sync(self):
+		# With no record of a previous run, everyone is synced.
+		self.assertEqual(cleanup_permissions(), 10)
+		
+		# Nothing has changed, so only the staff user is checked, and nothing is written apart from the run itself.
+		with CaptureQueriesContext(connection) as queries:
+			self.assertEqual(cleanup_permissions(), 1)
+		writes = [query["sql"] for query in queries if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+		self.assertEqual(len(writes), 1)
+		self.assertIn("members_permissionsync", writes[0])
+		
+		# A rank that expired today gets picked up.
+		Rank.objects.filter(member=self.committee).update(expired_date=datetime.date.today())
+		self.assertEqual(cleanup_permissions(), 1)
+		self.committee.user.refresh_from_db()
+		self.assertFalse(self.committee.user.is_staff)
+		self.assertFalse(self.committee.user.groups.exists())
+		
+		self.assertEqual(cleanup_permissions(full_sync=True), 10)
+		self.assertEqual(
+			list(PermissionSync.objects.values_list("full_sync", "members_synced")),
+			[(True, 10), (False, 1), (False, 1), (True, 10)]
+		)
+
 
-# Create your tests here.
+class MemberSearchTests(TestCase):
+	def setUp(self):
+		names = ["Alice Anderson", "Alicia Keys", "Bob Brown", "Robert Alison", "Charlie Chaplin"]
+		self.members = {}
+		for n, long_name in enumerate(names):
+			self.members[long_name] = Member.objects.create(
+				short_name=long_name.split()[0],
+				long_name=long_name,
+				pronouns="they/them",
+				student_number=f"2100000{n}",
+				join_date=datetime.date.today(),
+				user=create_fresh_unigames_user(f"member{n}@example.com"),
+			)
+	
+	def test_exact_lookups(self):
+		self.assertEqual(list(search_members("21000002")), [self.members["Bob Brown"]])
+		self.assertEqual(list(search_members("MEMBER3@example.com")), [self.members["Robert Alison"]])
+		self.assertEqual(list(search_members("99999999")), [])
+	
+	def test_name_search_ranked(self):
+		results = list(search_members("alice").order_by("-match_rank", "long_name", "id"))
+		self.assertEqual(results[0], self.members["Alice Anderson"])
+		self.assertNotIn(self.members["Charlie Chaplin"], results)
+		self.assertTrue(all(0 < member.match_rank <= 1 for member in results))
+	
+	def test_name_fragments(self):
+		# Like the old icontains search, short fragments from the middle of a name still match.
+		self.assertEqual(
+			set(search_members("ob")), {self.members["Bob Brown"], self.members["Robert Alison"]}
+		)
+		self.assertEqual(
+			set(search_members("SON")), {self.members["Alice Anderson"], self.members["Robert Alison"]}
+		)
+	
+	def test_name_search_uses_trigram_index(self):
+		with connection.cursor() as cursor:
+			# There are too few members for the planner to pick an index by itself.
+			cursor.execute("SET LOCAL enable_seqscan = off")
+			cursor.execute("SET LOCAL enable_indexscan = off")
+			plan = search_members("alic").explain()
+		self.assertIn("member_long_name_trgm_idx", plan)
+		self.assertIn("member_short_name_trgm_idx", plan)
+	
+	def test_keyset_pagination(self):
+		paginator = KeysetPaginator(Member.objects.all(), per_page=2, ordering=["long_name", "id"])
+		pages = [paginator.get_page()]
+		while pages[-1].has_next():
+			pages.append(paginator.get_page(pages[-1].next_cursor))
+		self.assertEqual(len(pages), 3)
+		self.assertEqual([member for page in pages for member in page], list(Member.objects.order_by("long_name", "id")))
+		self.assertFalse(pages[0].has_previous())
+		
+		# Walking back from the last page gives the same pages in reverse.
+		previous_page = paginator.get_page(pages[-1].previous_cursor)
+		self.assertEqual(list(previous_page), list(pages[-2]))
+		
+		# Invalid cursors go back to the first page.
+		self.assertEqual(list(paginator.get_page("not a cursor")), list(pages[0]))
+		
+		# Cursors keep working when ordering by the match rank.
+		ordering = ["-match_rank", "long_name", "id"]
+		search_paginator = KeysetPaginator(search_members("ali"), per_page=1, ordering=ordering)
+		results = []
+		page = search_paginator.get_page()
+		results.extend(page)
+		while page.has_next():
+			page = search_paginator.get_page(page.next_cursor)
+			results.extend(page)
+		self.assertEqual(results, list(search_members("ali").order_by(*ordering)))
+		self.assertGreater(len(results), 1)
@@ -1,17 +1,19 @@
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
 from django.http.response import Http404
 from django.shortcuts import redirect
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, TemplateView, DetailView, FormView
+from phylactery.db_routing import ReplicaReadsMixin
+from phylactery.pagination import KeysetPaginationMixin
 from .models import Member
+from .search import search_members
 from .decorators import gatekeeper_required
 from .forms import ChangeEmailPreferencesForm
 
 
 @method_decorator(gatekeeper_required, name="dispatch")
-class MemberListView(ListView):
+class MemberListView(ReplicaReadsMixin, KeysetPaginationMixin, ListView):
 	model = Member
 	paginate_by = 50
 	template_name = "members/member_list.html"
@@ -23,10 +25,16 @@ class MemberListView(ListView):
 		
 		self.search_query = self.request.GET.get("search")
 		if self.search_query:
-			qs = qs.filter(Q(short_name__icontains=self.search_query) | Q(long_name__icontains=self.search_query))
+			qs = search_members(self.search_query, queryset=qs)
 		
 		return qs
 	
+	def get_keyset_ordering(self):
+		if self.search_query:
+			# Best matches first.
+			return ["-match_rank", "long_name", "id"]
+		return ["long_name", "id"]
+	
 	def get_context_data(self, *args, **kwargs):
 		context = super().get_context_data(*args, **kwargs)
 		context["search_query"] = self.search_query
@@ -0,0 +1,50 @@
+"""
+Reading dumps of the old website's database, for the migrate_data command and prepare_data_for_migration.py.
+Dumps can be a JSON array (as made by dumpdata), or JSON Lines (one entry per line), and either can be gzipped.
+Doesn't use Django, so the script can run without any settings.
+"""
+import gzip
+import json
+
+
+def open_dump(filename):
+	# Opens a dump for reading as text, decompressing it if it's gzipped.
+	if str(filename).endswith(".gz"):
+		return gzip.open(filename, "rt", encoding="utf-8")
+	return open(filename, "r", encoding="utf-8")
+
+
+def iter_json_entries(file, chunk_size=1 << 16):
+	"""
+	Yields the entries of a dump one at a time, reading the file a chunk at a time.
+	Accepts either a JSON array of entries (as made by dumpdata), or one entry per line (JSON Lines).
+	Raises ValueError if the dump isn't valid JSON.
+	"""
+	decoder = json.JSONDecoder()
+	buffer = ""
+	position = 0
+	at_end = False
+	while True:
+		# Skip anything between entries.
+		while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+			position += 1
+		if position < len(buffer):
+			try:
+				entry, position = decoder.raw_decode(buffer, position)
+			except json.JSONDecodeError:
+				if at_end:
+					raise ValueError(f"Invalid JSON in the dump, near: {buffer[position:position + 80]!r}")
+			else:
+				yield entry
+				continue
+		elif at_end:
+			return
+		# We've run out of complete entries, so read some more.
+		chunk = file.read(chunk_size)
+		at_end = not chunk
+		buffer = buffer[position:] + chunk
+		position = 0
+
+
+def get_model_filename(model_type, compress=False):
+	return f"{model_type}.jsonl.gz" if compress else f"{model_type}.jsonl"
@@ -1,17 +1,3 @@
-import json
-from accounts.models import UnigamesUser, create_fresh_unigames_user
-from blog.models import MailingList, BlogPost
-from library.models import Item, LibraryTag, BorrowerDetails, BorrowRecord, Reservation
-from members.models import Member, Membership, Rank, RankChoices
-from django.conf import settings
-from django.core.exceptions import ValidationError
-from django.core.management.base import BaseCommand
-from django.core.management.color import no_style
-from django.core.validators import validate_email
-from django.db import connection
-from collections import defaultdict
-from datetime import datetime
-
 """
 This program will be used to import data from the old website into the new one.
 
@@ -39,15 +25,15 @@ We will skip:
 		- sessions.session
 	- Sites (easier to add manually)
 		- sites.site
-	
-	
+
+
 We will import:
 	- Blog Posts
 		- blog.blogpost - Done!
 	- Library (almost everything)
-		- library.borrowrecord
-		- library.externalborrowingform
-		- library.externalborrowingitemrecord
+		- library.borrowrecord - Done!
+		- library.externalborrowingform - Done!
+		- library.externalborrowingitemrecord - Done!
 		- library.item - Done!
 		- library.itembasetags - Done!
 		- library.tagparent - Done!
@@ -61,12 +47,68 @@ We will import:
 	- Taggit Tags
 		- taggit.tag - Done!
 		- taggit.taggeditem - Done!
-	
 
+The dump is read a piece at a time, and only the entries of the models we import are kept.
+It can also be a directory of JSON Lines files, one per model, as made by prepare_data_for_migration.py -
+those are read one model at a time, as they're imported.
+Everything is inserted with bulk_create, inside a single transaction, so a failed import leaves nothing behind.
+Foreign keys are resolved from the ids we've already imported, rather than by querying for each row.
 """
+import json
+import sys
+import time
+from accounts.models import UnigamesUser
+from blog.models import MailingList, BlogPost
+from library.availability import rebuild_availability_calendars
+from library.models import (
+	Item, LibraryTag, BaseTaggedLibraryItem, ComputedTaggedLibraryItem, BorrowerDetails, BorrowRecord, Reservation
+)
+from members.models import Member, Membership, Rank, RankChoices, get_permission_groups, sync_member_permissions
+from pages.legacy_dump import get_model_filename, iter_json_entries, open_dump
+from phylactery.caching import invalidate_public_pages
+from phylactery.markdown_renderer import render_markdown_to_html
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
 
-BASE_PATH = settings.BASE_DIR / "pretty_models"
 
+IMPORTED_MODELS = {
+	"blog.blogpost",
+	"library.borrowrecord",
+	"library.externalborrowingform",
+	"library.externalborrowingitemrecord",
+	"library.item",
+	"library.itembasetags",
+	"library.tagparent",
+	"members.member",
+	"members.memberflag",
+	"members.membership",
+	"members.rankassignments",
+	"taggit.tag",
+	"taggit.taggeditem",
+}
+
+# The old site's rank pks, and the ranks they have become.
+RANKS = {
+	2: RankChoices.EXCLUDED,
+	3: RankChoices.GATEKEEPER,
+	4: RankChoices.WEBKEEPER,
+	5: RankChoices.COMMITTEE,
+	7: RankChoices.LIFEMEMBER,
+	8: RankChoices.PRESIDENT,
+	9: RankChoices.VICEPRESIDENT,
+	10: RankChoices.SECRETARY,
+	11: RankChoices.TREASURER,
+	12: RankChoices.LIBRARIAN,
+	13: RankChoices.FRESHERREP,
+	14: RankChoices.OCM,
+	15: RankChoices.IPP
+}
 
 APPROVAL_STATUS = {
 	"U": "?",
@@ -75,31 +117,136 @@ APPROVAL_STATUS = {
 	"C": "!",
 }
 
+MIGRATED_DATA = "<migrated data>"
+DELETED_MEMBER_NAME = "<Internal Member record deleted>"
+
+
 def convert_to_date(date_str):
 	if date_str is None:
 		return None
 	return datetime.strptime(date_str, "%Y-%m-%d")
 
 
+class LegacyDump:
+	"""
+	The entries of a dump, grouped by model. Only the models that we import are kept.
+	"""
+	def __init__(self, entries):
+		self.models = defaultdict(list)
+		self.skipped = 0
+		for entry in entries:
+			if entry["model"] in IMPORTED_MODELS:
+				self.models[entry["model"]].append(entry)
+			else:
+				self.skipped += 1
+
+	def get(self, model_type):
+		return self.models.get(model_type, [])
+
+
+class LegacyDumpDirectory:
+	"""
+	A dump that has been split into a JSON Lines file per model (<model>.jsonl, or <model>.jsonl.gz).
+	Each model's entries are streamed from its file as they're imported, rather than read all at once.
+	"""
+	def __init__(self, directory):
+		self.directory = Path(directory)
+
+	def get_path(self, model_type):
+		for compress in (True, False):
+			path = self.directory / get_model_filename(model_type, compress)
+			if path.exists():
+				return path
+		return None
+
+	def get(self, model_type):
+		path = self.get_path(model_type)
+		if path is None:
+			return
+		with open_dump(path) as file:
+			for line in file:
+				if line.strip():
+					yield json.loads(line)
+
+
 class Command(BaseCommand):
+	help = "Imports a dump of the old website's database."
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"path",
+			nargs="?",
+			default="-",
+			help="The dump to import, or a directory of files made by prepare_data_for_migration.py. "
+			"Reads from stdin if left out (or '-')."
+		)
+		parser.add_argument(
+			"--batch-size",
+			type=int,
+			default=1000,
+			help="How many rows to insert per query."
+		)
+
 	def handle(self, *args, **options):
-		self.import_model_data()
-		self.import_initial_library()
-		self.import_members()
-		self.import_blog()
-		self.import_final_library()
-	
-	def import_model_data(self):
-		old_db_data = input()
-		print(f"Received {len(old_db_data)} chars of input.")
-		old_db_data = json.loads(old_db_data)
-		
-		self.models = defaultdict(list)
-		for entry in old_db_data:
-			model_type = entry["model"]
-			self.models[model_type].append(entry)
-		
-	
+		self.batch_size = options["batch_size"]
+		started = time.perf_counter()
+		if options["path"] != "-" and Path(options["path"]).is_dir():
+			self.models = LegacyDumpDirectory(options["path"])
+		else:
+			self.models = self.run_step("Read dump", self.import_model_data, options["path"])
+		with transaction.atomic():
+			self.import_initial_library()
+			self.import_members()
+			self.import_blog()
+			self.import_final_library()
+		self.run_step("Availability calendars", lambda: len(rebuild_availability_calendars()))
+		invalidate_public_pages()
+		self.stdout.write(self.style.SUCCESS(f"Finished importing in {time.perf_counter() - started:.1f}s."))
+		self.stdout.write("Run generate_image_derivatives to make the resized copies of the item images.")
+
+	def run_step(self, label, step, *args):
+		"""
+		Runs one step of the import, and reports how many rows it handled, and how fast.
+		The step returns either the number of rows, or (result, number of rows).
+		"""
+		step_started = time.perf_counter()
+		result = step(*args)
+		count = result[1] if isinstance(result, tuple) else result
+		elapsed = time.perf_counter() - step_started
+		self.stdout.write(f"{label}: {count} rows in {elapsed:.2f}s ({count / max(elapsed, 1e-6):.0f} rows/s)")
+		return result[0] if isinstance(result, tuple) else result
+
+	def bulk_create(self, model, objects):
+		created = model.objects.bulk_create(objects, batch_size=self.batch_size)
+		return len(created)
+
+	def validate(self, objects, exclude=()):
+		"""
+		Checks each object's fields (and its clean()), as full_clean does, without running any queries.
+		Uniqueness, constraints and foreign keys are left to the database, which checks them as the rows are inserted.
+		"""
+		for obj in objects:
+			relations = [field.name for field in obj._meta.concrete_fields if field.is_relation]
+			try:
+				obj.full_clean(exclude=[*exclude, *relations], validate_unique=False, validate_constraints=False)
+			except ValidationError as e:
+				raise CommandError(f"Invalid {obj._meta.label_lower} {obj.pk}: {e}")
+
+	def import_model_data(self, path):
+		try:
+			if path == "-":
+				models = LegacyDump(iter_json_entries(sys.stdin))
+			else:
+				with open_dump(path) as file:
+					models = LegacyDump(iter_json_entries(file))
+		except OSError as e:
+			raise CommandError(f"Couldn't read {path}: {e}")
+		except ValueError as e:
+			raise CommandError(str(e))
+		if models.skipped:
+			self.stdout.write(f"Skipped {models.skipped} entries of models that aren't imported.")
+		return models, sum(len(entries) for entries in models.models.values())
+
 	def import_final_library(self):
 		"""
 		Continuing on from import_members
@@ -108,148 +255,18 @@ class Command(BaseCommand):
 			2) Convert external borrowing item record into borrowrecords.
 			3) Attempt to group borrow records into borrowerdetails, and import them
 		"""
-		json_objects = self.models["library.externalborrowingform"]
-		for external_borrowing_form in json_objects:
-			self.import_external_borrowing_form(external_borrowing_form["pk"], external_borrowing_form["fields"])
+		self.run_step("Reservations", self.import_external_borrowing_forms)
 		self.fix_pk_sequence(Reservation)
-		
-		external_item_records_by_form_pk = defaultdict(list)
-		json_objects = self.models["library.externalborrowingitemrecord"]
-		for external_item_record in json_objects:
-			external_item_records_by_form_pk[external_item_record["fields"]["form"]].append(external_item_record)
-		
-		for reservation_pk, external_borrowing_records in external_item_records_by_form_pk.items():
-			reservation = Reservation.objects.get(pk=reservation_pk)
-			borrower_detail_address = "<migrated data>"
-			borrower_detail_phone = reservation.requestor_phone
-			borrower_detail_borrowed_date = None
-			borrower_detail_authed_by_pk = None
-			current_borrower_details = None
-			self.stdout.write(f"Adding borrow records for reservation {reservation_pk}")
-			for record in external_borrowing_records:
-				item = Item.objects.get(pk=record["fields"]["item"])
-				reservation.reserved_items.add(item)
-				if (
-						record["fields"]["borrower_name"] == ""
-						or record["fields"]["auth_gatekeeper_borrow"] == ""
-						or record["fields"]["date_borrowed"] == ""
-				):
-					# Skip adding a record
-					self.stdout.write(f"- Skipped adding record for {item}")
-					continue
-				else:
-					if (
-							current_borrower_details is None
-							or current_borrower_details.borrower_name != record["fields"]["borrower_name"]
-							or borrower_detail_borrowed_date != record["fields"]["date_borrowed"]
-							or borrower_detail_authed_by_pk != record["fields"]["auth_gatekeeper_borrow"]
-					):
-						# Make a new borrower details object
-						borrower_detail_authed_by_pk = record["fields"]["auth_gatekeeper_borrow"]
-						borrow_authed_by_qs = Member.objects.filter(pk=borrower_detail_authed_by_pk)[0:1]
-						if borrow_authed_by_qs.exists():
-							borrow_authed_by = borrow_authed_by_qs.get().long_name
-						else:
-							borrow_authed_by = "<Internal Member record deleted>"
-						borrower_detail_borrowed_date = record["fields"]["date_borrowed"]
-						current_borrower_details = BorrowerDetails.objects.create(
-							is_external=True,
-							internal_member=None,
-							borrower_name=record["fields"]["borrower_name"],
-							borrower_address=borrower_detail_address,
-							borrower_phone=borrower_detail_phone,
-							borrowed_datetime=borrower_detail_borrowed_date + "T04:00:00Z",
-							borrow_authorised_by=borrow_authed_by,
-						)
-				# Add the Borrow Record
-				if record["fields"]["date_returned"]:
-					returned_datetime = record["fields"]["date_returned"] + "T04:00:00Z"
-					verified_returned = True
-				else:
-					returned_datetime = ""
-					verified_returned = False
-				if record["fields"]["auth_gatekeeper_return"]:
-					return_authed_by_qs = Member.objects.filter(pk=record["fields"]["auth_gatekeeper_return"])[0:1]
-					if return_authed_by_qs.exists():
-						return_authed_by = return_authed_by_qs.get().long_name
-					else:
-						return_authed_by = "<Internal Member record deleted>"
-				else:
-					return_authed_by = ""
-				
-				BorrowRecord.objects.create(
-					item=item,
-					borrower=current_borrower_details,
-					borrowed_datetime=current_borrower_details.borrowed_datetime,
-					borrow_authorised_by=current_borrower_details.borrow_authorised_by,
-					due_date=reservation.requested_date_to_return,
-					returned_datetime=returned_datetime,
-					return_authorised_by=return_authed_by,
-					comments="<migrated data>",
-					verified_returned=verified_returned,
-				)
-				self.stdout.write(f"- Added external borrow record for {item}")
-	
-			
-		
-		# Group borrow records into borrower details, and import them.
-		# For this, we assume that any borrow records that have the same:
-		# - borrowing member
-		# - address
-		# - phone number
-		# - borrow date
-		# - AND authorising gatekeeper
-		# are all part of the same borrowing instance
-		borrow_records_by_instance = defaultdict(list)
-		
-		json_objects = self.models["library.borrowrecord"]
-		for borrow_record in json_objects:
-			key = f"{borrow_record['fields']['borrowing_member']}-{borrow_record['fields']['member_address']}-{borrow_record['fields']['member_phone_number']}-{borrow_record['fields']['date_borrowed']}-{borrow_record['fields']['auth_gatekeeper_borrow']}"
-			borrow_record["key"] = key
-			borrow_records_by_instance[key].append(borrow_record)
-		for key, records in borrow_records_by_instance.items():
-			first_record_fields = records[0]["fields"]
-			borrowing_member_qs = Member.objects.filter(pk=first_record_fields["borrowing_member"])[0:1]
-			if borrowing_member_qs.exists():
-				internal_member = borrowing_member_qs.get()
-				borrower_name = internal_member.long_name
-			else:
-				internal_member = None
-				borrower_name = "<Internal Member record deleted>"
-			borrower_address = first_record_fields["member_address"]
-			borrower_phone = first_record_fields["member_phone_number"]
-			borrowed_datetime = first_record_fields["date_borrowed"]
-			if borrowed_datetime:
-				borrowed_datetime += "T04:00:00Z"
-			borrow_authorised_by_qs = Member.objects.filter(pk=first_record_fields["auth_gatekeeper_borrow"])[0:1]
-			if borrow_authorised_by_qs.exists():
-				borrow_authorised_by = borrow_authorised_by_qs.get().long_name
-			else:
-				borrow_authorised_by = "<Internal Member record deleted>"
-			borrower_details = BorrowerDetails.objects.create(
-				is_external=False,
-				internal_member=internal_member,
-				borrower_name=borrower_name,
-				borrower_address=borrower_address,
-				borrower_phone=borrower_phone,
-				borrowed_datetime=borrowed_datetime,
-				borrow_authorised_by=borrow_authorised_by,
-			)
-			for record in records:
-				self.import_borrow_record(borrower_details, record["fields"])
-				
-			
-			
-	
+		self.run_step("External borrow records", self.import_external_borrow_records)
+		self.run_step("Borrow records", self.import_borrow_records)
+
 	def import_blog(self):
 		"""
 		Just a simple one here, just importing the blogposts.
 		"""
-		json_objects = self.models["blog.blogpost"]
-		for blogpost in json_objects:
-			self.import_blog_post(pk=blogpost["pk"], fields=blogpost["fields"])
+		self.run_step("Blog posts", self.import_blog_posts)
 		self.fix_pk_sequence(BlogPost)
-	
+
 	def import_members(self):
 		"""
 		Continuing on from import_initial_library
@@ -264,306 +281,441 @@ class Command(BaseCommand):
 			4) Sync all member permissions
 			Then we can work on the rest of the Library stuff
 		"""
-		
-		# Step 1: Import Members
-		json_objects = self.models["members.member"]
-		for member in json_objects:
-			self.import_member(pk=member["pk"], fields=member["fields"])
+		self.run_step("Members", self.import_member_records)
 		self.fix_pk_sequence(Member)
-		
-		# Step 2: Import Memberships
-		json_objects = self.models["members.membership"]
-		for membership in json_objects:
-			self.import_membership(pk=membership["pk"], fields=membership["fields"])
+		self.run_step("Memberships", self.import_memberships)
 		self.fix_pk_sequence(Membership)
-		
-		# Step 3: Import Ranks
-		self.ranks = {
-			2: RankChoices.EXCLUDED,
-			3: RankChoices.GATEKEEPER,
-			4: RankChoices.WEBKEEPER,
-			5: RankChoices.COMMITTEE,
-			7: RankChoices.LIFEMEMBER,
-			8: RankChoices.PRESIDENT,
-			9: RankChoices.VICEPRESIDENT,
-			10: RankChoices.SECRETARY,
-			11: RankChoices.TREASURER,
-			12: RankChoices.LIBRARIAN,
-			13: RankChoices.FRESHERREP,
-			14: RankChoices.OCM,
-			15: RankChoices.IPP
-		}
-		
-		json_objects = self.models["members.rankassignments"]
-		for rank in json_objects:
-			self.import_ranks(pk=rank["pk"], fields=rank["fields"])
+		self.run_step("Ranks", self.import_ranks)
 		self.fix_pk_sequence(Rank)
-		
-		# Step 4: Import mailing lists
-		json_objects = self.models["members.memberflag"]
-		for mailing_list in json_objects:
-			self.import_mailing_list(pk=mailing_list["pk"], fields=mailing_list["fields"])
+		self.run_step("Mailing lists", self.import_mailing_lists)
 		self.fix_pk_sequence(MailingList)
-		
-		# Step 5: Sync member permissions.
-		self.stdout.write("Syncing user permissions: ", ending="")
-		for member in Member.objects.all():
-			member.sync_permissions()
-			self.stdout.write(".", ending="")
-			self.stdout.flush()
-		self.stdout.write(" Done!")
-	
+		self.run_step(
+			"Permissions",
+			lambda: sync_member_permissions(list(self.member_names), groups=get_permission_groups())
+		)
+
 	def import_initial_library(self):
 		"""
 		Steps:
 			1) Import all taggit tags into LibraryTags
 			2) Import the TagParents
 			3) Add the Item Type tags (afterward, so the PKs don't conflict)
-			4) Import the Items
+			4) Import the Items, and their "Item: <name>" tags
 			5) Add the appropriate tags onto Library Items (only base tags)
-			6) Save all Items.
+			6) Compute the tags of all Items.
 			At this point we will need to add Members, so that we can add BorrowRecords.
 		"""
-		
-		# Step 1:  Import all taggit tags into LibraryTags
-		json_objects = self.models["taggit.tag"]
-		for library_tag in json_objects:
-			self.import_library_tag(pk=library_tag["pk"], fields=library_tag["fields"])
+		self.run_step("Tags", self.import_library_tags)
+		self.run_step("Tag parents", self.import_tag_parents)
 		self.fix_pk_sequence(LibraryTag)
-		
-		# Step 2: Import the tag parents
-		json_objects = self.models["library.tagparent"]
-		for tag_parent in json_objects:
-			child_tag = LibraryTag.objects.get(pk=tag_parent["fields"]["child_tag"])
-			child_tag.parents.set(tag_parent["fields"]["parent_tag"])
-			self.stdout.write(f"Setting parents for {child_tag.name}")
-		
-		# Step 3: Add the Item-type tags.
+		self.run_step("Item type tags", self.import_item_types)
+		self.run_step("Items", self.import_library_items)
+		self.fix_pk_sequence(Item)
+		self.run_step("Item tags", self.import_item_base_tags)
+		self.run_step("Computed tags", self.compute_item_tags)
+
+	def import_library_tags(self):
+		self.tag_names = {}
+		self.used_tag_slugs = set()
+		tags = []
+		for library_tag in self.models.get("taggit.tag"):
+			fields = library_tag["fields"]
+			tags.append(LibraryTag(pk=library_tag["pk"], name=fields["name"], slug=fields["slug"]))
+			self.tag_names[fields["name"]] = library_tag["pk"]
+			self.used_tag_slugs.add(fields["slug"])
+		self.validate(tags)
+		return self.bulk_create(LibraryTag, tags)
+
+	def import_tag_parents(self):
+		# Parents of each tag, by tag pk. They're inserted in compute_item_tags,
+		# once the parents of the items' "Item: <>" tags are known.
+		self.tag_parents = defaultdict(set)
+		for tag_parent in self.models.get("library.tagparent"):
+			fields = tag_parent["fields"]
+			self.tag_parents[fields["child_tag"]].update(fields["parent_tag"])
+		return sum(len(parent_pks) for parent_pks in self.tag_parents.values())
+
+	def make_tag(self, name, **kwargs):
+		# Makes a new tag, with a slug that isn't taken yet - the same one that saving it would give it.
+		tag = LibraryTag(name=name, **kwargs)
+		tag.slug = tag.slugify(name)
+		i = 1
+		while tag.slug in self.used_tag_slugs:
+			tag.slug = tag.slugify(name, i)
+			i += 1
+		self.used_tag_slugs.add(tag.slug)
+		return tag
+
+	def import_item_types(self):
 		self.item_types = {
-			"BK": LibraryTag.objects.create(name="Item Type: Book", is_item_type=True),
-			"BG": LibraryTag.objects.create(name="Item Type: Board Game", is_item_type=True),
-			"CG": LibraryTag.objects.create(name="Item Type: Card Game", is_item_type=True),
-			"??": LibraryTag.objects.create(name="Item Type: Other", is_item_type=True),
+			"BK": self.make_tag("Item Type: Book", is_item_type=True),
+			"BG": self.make_tag("Item Type: Board Game", is_item_type=True),
+			"CG": self.make_tag("Item Type: Card Game", is_item_type=True),
+			"??": self.make_tag("Item Type: Other", is_item_type=True),
 		}
-		for item_type in self.item_types.values():
-			item_type.full_clean()
-		
-		# Step 4: Import the Items
-		json_objects = self.models["library.item"]
-		for library_item in json_objects:
-			self.import_library_item(pk=library_item["pk"], fields=library_item["fields"])
-		self.fix_pk_sequence(Item)
-		
-		# Step 5: Apply base tags to Items.
+		self.validate(self.item_types.values())
+		return self.bulk_create(LibraryTag, list(self.item_types.values()))
+
+	def import_library_items(self):
+		self.item_types_by_item = {}
+		items = []
+		new_item_tags = []
+		for library_item in self.models.get("library.item"):
+			fields = library_item["fields"]
+			item = Item(
+				pk=library_item["pk"],
+				name=fields["name"],
+				slug=fields["slug"],
+				description=fields["description"],
+				condition=fields["condition"],
+				notes=fields["notes"],
+				is_borrowable=fields["is_borrowable"],
+				is_high_demand=fields["high_demand"],
+				min_players=fields["min_players"],
+				max_players=fields["max_players"],
+				min_play_time=fields["min_play_time"],
+				max_play_time=fields["max_play_time"],
+				average_play_time=fields["average_play_time"],
+				image=fields["image"],
+			)
+			item.compute_play_time()
+			item_tag_name = f"Item: {item.name}"
+			if item_tag_name in self.tag_names:
+				item.item_tag_id = self.tag_names[item_tag_name]
+			else:
+				item.item_tag = self.make_tag(item_tag_name)
+				new_item_tags.append(item.item_tag)
+			items.append(item)
+			self.item_types_by_item[item.pk] = self.item_types[fields["type"]].pk
+		self.validate(new_item_tags)
+		# The tags get their pks here, so the items pick them up when they're inserted.
+		self.bulk_create(LibraryTag, new_item_tags)
+		self.validate(items)
+		count = self.bulk_create(Item, items)
+		self.item_tags = {item.pk: item.item_tag_id for item in items}
+		return count
+
+	def import_item_base_tags(self):
 		# Because of the previous implementation, we have to look
-		# at two files simultaneously to figure out which tags should go where.
-		json_objects = self.models["library.itembasetags"]
-		
-		# Construct a dictionary, mapping the pk of the "item_base_tags" object to the Item itself.
+		# at two models simultaneously to figure out which tags should go where.
+		# Map the pk of the "item_base_tags" object to the pk of the Item itself.
 		# (Yes, this system was stupid. In my defense, so was I.)
-		item_lookup = {}
-		for item_base_tags in json_objects:
-			item_lookup[item_base_tags["pk"]] = item_base_tags["fields"]["item"]
-		# Now we can continue.
-		json_objects = self.models["taggit.taggeditem"]
+		item_lookup = {
+			item_base_tags["pk"]: item_base_tags["fields"]["item"]
+			for item_base_tags in self.models.get("library.itembasetags")
+		}
+		self.base_tags = defaultdict(set)
+		for item_pk, item_type_pk in self.item_types_by_item.items():
+			self.base_tags[item_pk].add(item_type_pk)
 		invalid_content_types = defaultdict(list)
-		for tagged_item in json_objects:
+		for tagged_item in self.models.get("taggit.taggeditem"):
 			tag_pk = tagged_item["fields"]["tag"]
 			content_type = tagged_item["fields"]["content_type"]
 			object_id = tagged_item["fields"]["object_id"]
 			# The content_type is what matters here. We're looking for 12, and we ignore 13.
 			# A tag shouldn't have been tagged to anything else.
 			if content_type == 12:
-				item = Item.objects.get(pk=item_lookup[object_id])
-				tag = LibraryTag.objects.get(pk=tag_pk)
-				item.base_tags.add(tag)
-				self.stdout.write(f"Tagged {item.name} with {tag.name}")
-			elif content_type == 13:
-				pass
-			else:
+				self.base_tags[item_lookup[object_id]].add(tag_pk)
+			elif content_type != 13:
 				invalid_content_types[content_type].append((tag_pk, content_type, object_id))
 		if invalid_content_types:
 			self.stdout.write(f"Warning: {invalid_content_types=}")
+		return self.bulk_create(BaseTaggedLibraryItem, [
+			BaseTaggedLibraryItem(content_object_id=item_pk, tag_id=tag_pk)
+			for item_pk, tag_pks in self.base_tags.items()
+			for tag_pk in tag_pks
+		])
+
+	def compute_item_tags(self):
+		"""
+		Does what saving every Item does, for every item at once, without any queries.
+		Each Item's "Item: <>" tag gets the item's base tags as its parents, replacing any it had in the dump
+		(as Item.compute_tags does), so an item tagged with another item's tag inherits that item's tags.
+		Then the items' tags are computed, following every tag apart from the item types up to its parents.
+		None of the imported tags are categories, and the item types don't have parents.
+		"""
+		for item_pk, item_tag_pk in self.item_tags.items():
+			self.tag_parents[item_tag_pk] = set(self.base_tags[item_pk])
+		self.bulk_create(LibraryTag.parents.through, [
+			LibraryTag.parents.through(from_librarytag_id=child_pk, to_librarytag_id=parent_pk)
+			for child_pk, parent_pks in self.tag_parents.items()
+			for parent_pk in parent_pks
+		])
 		
-		# Step 6: Save all Items to regenerate all Tag data properly.
-		self.stdout.write("Re-saving all items: ", ending="")
-		for item in Item.objects.all():
-			item.save()
-			self.stdout.write(".", ending="")
-			self.stdout.flush()
-		self.stdout.write(" Done!")
-	
-	def import_library_tag(self, pk, fields):
-		tag_data = {
-			"pk": pk,
-			"name": fields["name"],
-			"slug": fields["slug"],
-		}
-		new_tag = LibraryTag.objects.create(**tag_data)
-		new_tag.full_clean()
-		self.stdout.write(f"Added library.librarytag: {new_tag.name}")
-	
-	def import_library_item(self, pk, fields):
-		item_data = {
-			"pk": pk,
-			"name": fields["name"],
-			"slug": fields["slug"],
-			"description": fields["description"],
-			"condition": fields["condition"],
-			"notes": fields["notes"],
-			"is_borrowable": fields["is_borrowable"],
-			"is_high_demand": fields["high_demand"],
-			"min_players": fields["min_players"],
-			"max_players": fields["max_players"],
-			"min_play_time": fields["min_play_time"],
-			"max_play_time": fields["max_play_time"],
-			"average_play_time": fields["average_play_time"],
-			"image": fields["image"],
-		}
-		new_item = Item.objects.create(**item_data)
-		new_item.full_clean()
-		new_item.base_tags.add(self.item_types[fields["type"]])
-		self.stdout.write(f"Added library.item: {new_item.name}")
-	
-	def import_member(self, pk, fields):
-		member_data = {
-			"pk": pk,
-			"short_name": fields["preferred_name"],
-			"long_name": f'{fields["preferred_name"]} {fields["last_name"]}',
-			"pronouns": fields["pronouns"],
-			"student_number": fields["student_number"],
-			"join_date": fields["join_date"],
-			"notes": fields["notes"],
-			"optional_emails": fields["receive_emails"]
-		}
-		email_address = fields["email_address"]
-		make_user = True
-		try:
-			validate_email(email_address)
-		except ValidationError:
-			make_user = False
-		if "@student" in email_address:
-			make_user = False
-		if UnigamesUser.objects.filter(email=email_address).exists():
-			make_user = False
-		
-		if make_user:
-			
-			member_data["user"] = create_fresh_unigames_user(email_address)
-		else:
-			member_data["user"] = None
-		
-		new_member = Member.objects.create(**member_data)
-		new_member.full_clean(exclude=["pronouns"])
-		self.stdout.write(f"Added members.member: {new_member.long_name}{' - skipped creating user' if make_user is False else ''}")
-	
-	def import_membership(self, pk, fields):
-		member = Member.objects.filter(pk=fields["member"]).first()
-		auth_by = Member.objects.filter(pk=fields["authorising_gatekeeper"]).first()
-		membership_data = {
-			"pk": pk,
-			"member": member,
-			"date_purchased": convert_to_date(fields["date"]),
-			"guild_member": fields["guild_member"],
-			"amount_paid": fields["amount_paid"],
-			"expired": fields["expired"],
-			"authorised_by": auth_by
-		}
-		new_membership = Membership.objects.create(**membership_data)
-		new_membership.full_clean(exclude=["authorised_by"])
-		self.stdout.write(f"Added members.membership: {new_membership}")
-	
-	def import_ranks(self, pk, fields):
-		rank_data = {
-			"pk": pk,
-			"member": Member.objects.get(pk=fields["member"]),
-			"rank_name": self.ranks[fields["rank"]],
-			"assigned_date": convert_to_date(fields["assignment_date"]),
-			"expired_date": convert_to_date(fields["expired_date"]),
-		}
-		new_rank = Rank.objects.create(**rank_data)
-		new_rank.full_clean()
-		self.stdout.write(f"Added {new_rank}")
-		
-	def import_mailing_list(self, pk, fields):
-		mailing_list_data = {
-			"pk": pk,
-			"name": fields["name"],
-			"description": "",
-			"verbose_description": fields["description"],
-			"is_active": fields["active"],
-		}
-		new_mailing_list = MailingList.objects.create(**mailing_list_data)
-		self.stdout.write(f"Added blog.mailinglist: {new_mailing_list.name}")
-		new_mailing_list.members.set(fields["member"])
-		self.stdout.write(f"  - set {len(fields['member'])} members for {new_mailing_list.name}")
-		
-	def import_blog_post(self, pk, fields):
-		blogpost_data = {
-			"pk": pk,
-			"title": fields["title"],
-			"slug_title": fields["slug_title"],
-			"short_description": fields["short_description"],
-			"author": fields["author"],
-			"publish_on": fields["publish_on"],
-			"body": fields["body"]
-		}
-		new_blogpost = BlogPost.objects.create(**blogpost_data)
-		self.stdout.write(f"Added blog.blogpost: {new_blogpost.slug_title}")
-	
-	def import_borrow_record(self, borrower_details, fields):
-		return_authorised_by_qs = Member.objects.filter(pk=fields["auth_gatekeeper_return"])[0:1]
-		if return_authorised_by_qs.exists():
-			return_authorised_by = return_authorised_by_qs.get().long_name
-		else:
-			return_authorised_by = "<Internal Member record deleted>"
-		
-		borrow_record_data = {
-			"item": Item.objects.get(pk=fields["item"]),
-			"borrower": borrower_details,
-			"borrowed_datetime": borrower_details.borrowed_datetime,
-			"borrow_authorised_by": borrower_details.borrow_authorised_by,
-			"due_date": fields["due_date"],
-			"returned_datetime": fields["date_returned"],
-			"comments": "<migrated data>",
-			"verified_returned": fields["verified_returned"],
-			"return_authorised_by": return_authorised_by,
-		}
-		if borrow_record_data["returned_datetime"]:
-			borrow_record_data["returned_datetime"] += "T04:00:00Z"
-		new_borrow_record = BorrowRecord.objects.create(**borrow_record_data)
-		self.stdout.write(f"Added library.borrowrecord: {new_borrow_record.pk}")
-	
-	def import_external_borrowing_form(self, pk, fields):
+		item_type_pks = {item_type.pk for item_type in self.item_types.values()}
+		computed_tags = []
+		for item_pk, base_tag_pks in self.base_tags.items():
+			tags_to_search = base_tag_pks - item_type_pks
+			already_searched = set()
+			while tags_to_search:
+				already_searched |= tags_to_search
+				tags_to_search = {
+					parent_pk for tag_pk in tags_to_search for parent_pk in self.tag_parents[tag_pk]
+				} - already_searched - item_type_pks
+			computed_tags.extend(
+				ComputedTaggedLibraryItem(content_object_id=item_pk, tag_id=tag_pk) for tag_pk in already_searched
+			)
+		return self.bulk_create(ComputedTaggedLibraryItem, computed_tags)
+
+	def import_member_records(self):
+		existing_emails = set(UnigamesUser.objects.values_list("email", flat=True))
+		users = {}
+		members = []
+		skipped_users = 0
+		for member in self.models.get("members.member"):
+			fields = member["fields"]
+			new_member = Member(
+				pk=member["pk"],
+				short_name=fields["preferred_name"],
+				long_name=f'{fields["preferred_name"]} {fields["last_name"]}',
+				pronouns=fields["pronouns"],
+				student_number=fields["student_number"],
+				join_date=fields["join_date"],
+				notes=fields["notes"],
+				optional_emails=fields["receive_emails"],
+			)
+			email_address = fields["email_address"]
+			make_user = email_address not in existing_emails and "@student" not in email_address
+			if make_user:
+				try:
+					validate_email(email_address)
+				except ValidationError:
+					make_user = False
+			if make_user:
+				user = UnigamesUser(username=email_address, email=email_address)
+				user.set_unusable_password()
+				users[new_member.pk] = user
+				existing_emails.add(email_address)
+			else:
+				skipped_users += 1
+			members.append(new_member)
+		self.bulk_create(UnigamesUser, list(users.values()))
+		for new_member in members:
+			if new_member.pk in users:
+				new_member.user = users[new_member.pk]
+		if skipped_users:
+			self.stdout.write(f"Skipped creating users for {skipped_users} members.")
+		self.member_names = {new_member.pk: new_member.long_name for new_member in members}
+		self.validate(members, exclude=["pronouns"])
+		return self.bulk_create(Member, members)
+
+	def get_member_pk(self, pk):
+		return pk if pk in self.member_names else None
+
+	def get_member_name(self, pk):
+		return self.member_names.get(pk, DELETED_MEMBER_NAME)
+
+	def import_memberships(self):
+		memberships = [
+			Membership(
+				pk=membership["pk"],
+				member_id=self.get_member_pk(membership["fields"]["member"]),
+				date_purchased=convert_to_date(membership["fields"]["date"]),
+				guild_member=membership["fields"]["guild_member"],
+				amount_paid=membership["fields"]["amount_paid"],
+				expired=membership["fields"]["expired"],
+				authorised_by_id=self.get_member_pk(membership["fields"]["authorising_gatekeeper"]),
+			)
+			for membership in self.models.get("members.membership")
+		]
+		self.validate(memberships)
+		return self.bulk_create(Membership, memberships)
+
+	def import_ranks(self):
+		ranks = []
+		for rank in self.models.get("members.rankassignments"):
+			fields = rank["fields"]
+			if fields["member"] not in self.member_names:
+				self.stdout.write(f"Warning: skipped rank assignment {rank['pk']}, for a member that doesn't exist.")
+				continue
+			ranks.append(Rank(
+				pk=rank["pk"],
+				member_id=fields["member"],
+				rank_name=RANKS[fields["rank"]],
+				assigned_date=convert_to_date(fields["assignment_date"]),
+				expired_date=convert_to_date(fields["expired_date"]),
+			))
+		self.validate(ranks)
+		return self.bulk_create(Rank, ranks)
+
+	def import_mailing_lists(self):
+		mailing_lists = []
+		mailing_list_members = []
+		for mailing_list in self.models.get("members.memberflag"):
+			fields = mailing_list["fields"]
+			mailing_lists.append(MailingList(
+				pk=mailing_list["pk"],
+				name=fields["name"],
+				description="",
+				verbose_description=fields["description"],
+				is_active=fields["active"],
+			))
+			mailing_list_members.extend(
+				MailingList.members.through(mailinglist_id=mailing_list["pk"], member_id=member_pk)
+				for member_pk in fields["member"]
+				if member_pk in self.member_names
+			)
+		count = self.bulk_create(MailingList, mailing_lists)
+		self.bulk_create(MailingList.members.through, mailing_list_members)
+		return count
+
+	def import_blog_posts(self):
+		return self.bulk_create(BlogPost, [
+			BlogPost(
+				pk=blogpost["pk"],
+				title=blogpost["fields"]["title"],
+				slug_title=blogpost["fields"]["slug_title"],
+				short_description=blogpost["fields"]["short_description"],
+				author=blogpost["fields"]["author"],
+				publish_on=blogpost["fields"]["publish_on"],
+				body=blogpost["fields"]["body"],
+				# bulk_create doesn't call save(), so render the body here instead.
+				body_html=render_markdown_to_html(blogpost["fields"]["body"]),
+			)
+			for blogpost in self.models.get("blog.blogpost")
+		])
+
+	def import_external_borrowing_forms(self):
 		# Convert external borrowing forms into reservations
-		reservation_data = {
-			"pk": pk,
-			"is_external": True,
-			"internal_member": None,
-			"requestor_name": fields["applicant_name"],
-			"requestor_email": fields["contact_email"],
-			"requestor_phone": fields["contact_phone"],
-			"requested_date_to_borrow": fields["requested_borrow_date"],
-			"requested_date_to_return": fields["requested_borrow_date"],
-			"submitted_datetime": fields["form_submitted_date"],
-			"approval_status": APPROVAL_STATUS[fields["form_status"]],
-			"additional_details": "<migrated data>\n",
-			"status_update_datetime": fields["form_submitted_date"],
-			"librarian_comments": fields["librarian_comments"],
-			"is_active": False,
-			"borrower": None,
-		}
-		if fields["applicant_org"]:
-			reservation_data["additional_details"] += f"Organisation: {fields['applicant_org']}\n"
-		reservation_data["additional_details"] += f"------\n{fields['event_details']}\n"
-		Reservation.objects.create(**reservation_data)
-		self.stdout.write(f"Added library.reservation from external borrowing form {pk}")
-	
+		self.reservations = {}
+		for external_borrowing_form in self.models.get("library.externalborrowingform"):
+			fields = external_borrowing_form["fields"]
+			additional_details = f"{MIGRATED_DATA}\n"
+			if fields["applicant_org"]:
+				additional_details += f"Organisation: {fields['applicant_org']}\n"
+			additional_details += f"------\n{fields['event_details']}\n"
+			self.reservations[external_borrowing_form["pk"]] = Reservation(
+				pk=external_borrowing_form["pk"],
+				is_external=True,
+				internal_member=None,
+				requestor_name=fields["applicant_name"],
+				requestor_email=fields["contact_email"],
+				requestor_phone=fields["contact_phone"],
+				requested_date_to_borrow=fields["requested_borrow_date"],
+				requested_date_to_return=fields["requested_borrow_date"],
+				submitted_datetime=fields["form_submitted_date"],
+				approval_status=APPROVAL_STATUS[fields["form_status"]],
+				additional_details=additional_details,
+				status_update_datetime=fields["form_submitted_date"],
+				librarian_comments=fields["librarian_comments"],
+				is_active=False,
+				borrower=None,
+			)
+		return self.bulk_create(Reservation, list(self.reservations.values()))
+
+	def import_external_borrow_records(self):
+		external_item_records_by_form_pk = defaultdict(list)
+		for external_item_record in self.models.get("library.externalborrowingitemrecord"):
+			external_item_records_by_form_pk[external_item_record["fields"]["form"]].append(external_item_record["fields"])
+
+		reserved_items = set()
+		# Pairs of (borrower details, borrow record), so the records can be pointed at their details once they're saved.
+		borrow_records = []
+		for reservation_pk, records in external_item_records_by_form_pk.items():
+			reservation = self.reservations[reservation_pk]
+			current_borrower_details = None
+			for fields in records:
+				reserved_items.add((reservation_pk, fields["item"]))
+				if fields["borrower_name"] == "" or fields["auth_gatekeeper_borrow"] == "" or fields["date_borrowed"] == "":
+					# Skip adding a record
+					continue
+				borrowed_datetime = fields["date_borrowed"] + "T04:00:00Z"
+				if (
+						current_borrower_details is None
+						or current_borrower_details.borrower_name != fields["borrower_name"]
+						or current_borrower_details.borrowed_datetime != borrowed_datetime
+						or borrow_authed_by_pk != fields["auth_gatekeeper_borrow"]
+				):
+					# Make a new borrower details object
+					borrow_authed_by_pk = fields["auth_gatekeeper_borrow"]
+					current_borrower_details = BorrowerDetails(
+						is_external=True,
+						internal_member=None,
+						borrower_name=fields["borrower_name"],
+						borrower_address=MIGRATED_DATA,
+						borrower_phone=reservation.requestor_phone,
+						borrowed_datetime=borrowed_datetime,
+						borrow_authorised_by=self.get_member_name(borrow_authed_by_pk),
+					)
+				borrow_records.append((current_borrower_details, BorrowRecord(
+					item_id=fields["item"],
+					borrowed_datetime=current_borrower_details.borrowed_datetime,
+					borrow_authorised_by=current_borrower_details.borrow_authorised_by,
+					due_date=reservation.requested_date_to_return,
+					returned_datetime=fields["date_returned"] + "T04:00:00Z" if fields["date_returned"] else None,
+					return_authorised_by=(
+						self.get_member_name(fields["auth_gatekeeper_return"]) if fields["auth_gatekeeper_return"] else ""
+					),
+					comments=MIGRATED_DATA,
+					verified_returned=bool(fields["date_returned"]),
+				)))
+		self.bulk_create(Reservation.reserved_items.through, [
+			Reservation.reserved_items.through(reservation_id=reservation_pk, item_id=item_pk)
+			for reservation_pk, item_pk in reserved_items
+		])
+		return self.create_borrow_records(borrow_records)
+
+	def import_borrow_records(self):
+		# Group borrow records into borrower details, and import them.
+		# For this, we assume that any borrow records that have the same:
+		# - borrowing member
+		# - address
+		# - phone number
+		# - borrow date
+		# - AND authorising gatekeeper
+		# are all part of the same borrowing instance
+		borrow_records_by_instance = defaultdict(list)
+		for borrow_record in self.models.get("library.borrowrecord"):
+			fields = borrow_record["fields"]
+			key = (
+				fields["borrowing_member"],
+				fields["member_address"],
+				fields["member_phone_number"],
+				fields["date_borrowed"],
+				fields["auth_gatekeeper_borrow"],
+			)
+			borrow_records_by_instance[key].append(fields)
+
+		borrow_records = []
+		for (member_pk, address, phone, date_borrowed, authed_by_pk), records in borrow_records_by_instance.items():
+			borrower_details = BorrowerDetails(
+				is_external=False,
+				internal_member_id=self.get_member_pk(member_pk),
+				borrower_name=self.get_member_name(member_pk),
+				borrower_address=address,
+				borrower_phone=phone,
+				borrow_authorised_by=self.get_member_name(authed_by_pk),
+			)
+			if date_borrowed:
+				borrower_details.borrowed_datetime = date_borrowed + "T04:00:00Z"
+			for fields in records:
+				borrow_records.append((borrower_details, BorrowRecord(
+					item_id=fields["item"],
+					borrowed_datetime=borrower_details.borrowed_datetime,
+					borrow_authorised_by=borrower_details.borrow_authorised_by,
+					due_date=fields["due_date"],
+					returned_datetime=fields["date_returned"] + "T04:00:00Z" if fields["date_returned"] else None,
+					return_authorised_by=(
+						self.get_member_name(fields["auth_gatekeeper_return"]) if fields["auth_gatekeeper_return"] else ""
+					),
+					comments=MIGRATED_DATA,
+					verified_returned=fields["verified_returned"],
+				)))
+		return self.create_borrow_records(borrow_records)
+
+	def create_borrow_records(self, borrow_records):
+		# Saves the borrower details first, so that the records can refer to them.
+		borrower_details = list({id(details): details for details, _ in borrow_records}.values())
+		self.bulk_create(BorrowerDetails, borrower_details)
+		for details, record in borrow_records:
+			record.borrower = details
+		return self.bulk_create(BorrowRecord, [record for _, record in borrow_records])
+
 	def fix_pk_sequence(self, app):
 		"""
 		When creating rows in Postgres, if you specify what their primary key is,
 		the sequence that auto-generates new primary keys gets out of sync.
-		
+
 		Using this function after manually adding rows will reset the sequence
 		for a given app and allow automatic PKs to work without conflicts again.
 		"""
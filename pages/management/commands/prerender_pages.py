@@ -0,0 +1,56 @@
+"""
+Renders the static pages to plain HTML files, as an anonymous user would see them.
+
+Each page is written to PRERENDERED_PAGES_ROOT/<path>/index.html, so that nginx
+(or WhiteNoise, with SERVE_PRERENDERED_PAGES) can serve them without running any Python.
+Logged in users get the same HTML, and their navbar is fetched separately by JavaScript.
+
+This needs to be re-run after the templates or static files change, after collectstatic.
+"""
+import shutil
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import reverse, resolve
+
+from pages.views import PRERENDERED_PAGE_NAMES
+
+
+class Command(BaseCommand):
+	help = "Pre-renders the static pages to HTML files."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"page_names", nargs="*", default=PRERENDERED_PAGE_NAMES,
+			help="URL names of the pages to render. Defaults to all the static pages."
+		)
+		parser.add_argument(
+			"--clear", action="store_true",
+			help="Delete all existing pre-rendered pages first."
+		)
+	
+	def handle(self, *args, **options):
+		output_root = settings.PRERENDERED_PAGES_ROOT
+		if options["clear"] and output_root.exists():
+			shutil.rmtree(output_root)
+		
+		request_factory = RequestFactory()
+		for page_name in options["page_names"]:
+			path = reverse(page_name)
+			request = request_factory.get(path)
+			# Pretend to have gone through the middleware, as a logged out user.
+			request.user = AnonymousUser()
+			request.is_unigames_member = False
+			request.unigames_member = None
+			request.is_prerendering = True
+			
+			response = resolve(path).func(request)
+			response.render()
+			
+			output_file = output_root / path.strip("/") / "index.html"
+			output_file.parent.mkdir(parents=True, exist_ok=True)
+			output_file.write_bytes(response.content)
+			self.stdout.write(f"Rendered {path} to {output_file}")
+		self.stdout.write(self.style.SUCCESS(f"Pre-rendered {len(options['page_names'])} pages."))
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from blog.models import BlogPost
+from library.models import Item, LibraryTag
+from members.models import Rank, COMMITTEE_POSITIONS
+from phylactery.caching import invalidate_public_pages
+
+
+def invalidate_public_pages_for_committee_rank(sender, instance, **kwargs):
+	# Only committee positions are shown on the public pages.
+	if instance.rank_name in COMMITTEE_POSITIONS:
+		invalidate_public_pages()
+
+
+def connect_signals():
+	"""
+	Invalidates the cached public pages whenever anything they show changes.
+	"""
+	for model in (BlogPost, Item, LibraryTag):
+		post_save.connect(invalidate_public_pages, sender=model, dispatch_uid=f"invalidate_public_pages_{model.__name__}_save")
+		post_delete.connect(invalidate_public_pages, sender=model, dispatch_uid=f"invalidate_public_pages_{model.__name__}_delete")
+	# The featured items on the home page are chosen by their tags.
+	m2m_changed.connect(invalidate_public_pages, sender=Item.base_tags.through, dispatch_uid="invalidate_public_pages_item_tags")
+	# The committee page shows who holds each committee position.
+	post_save.connect(invalidate_public_pages_for_committee_rank, sender=Rank, dispatch_uid="invalidate_public_pages_rank_save")
+	post_delete.connect(invalidate_public_pages_for_committee_rank, sender=Rank, dispatch_uid="invalidate_public_pages_rank_delete")
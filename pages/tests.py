@@ -1,3 +1,276 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from blog.models import BlogPost, MailingList
+from blog.views import AllBlogPostsView
+from library.models import BorrowRecord, Item, LibraryTag, Reservation
+from members.models import Member, Rank, RankChoices
+from pages.legacy_dump import iter_json_entries
+from phylactery.markdown_renderer import render_markdown_to_html
+from prepare_data_for_migration import split_json
+
+
+class PublicPageCacheTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		BlogPost.objects.create(
+			title="First Post",
+			slug_title="first-post",
+			author="Unigames Committee",
+			publish_on=timezone.now() - timedelta(hours=1),
+			body="Hello!",
+		)
+	
+	def test_home_page_cached_for_anonymous_users(self):
+		self.client.get(reverse("home"))
+		with self.assertNumQueries(0):
+			response = self.client.get(reverse("home"))
+		self.assertContains(response, "First Post")
+	
+	def test_cache_invalidated_on_save(self):
+		self.client.get(reverse("home"))
+		BlogPost.objects.create(
+			title="Second Post",
+			slug_title="second-post",
+			author="Unigames Committee",
+			publish_on=timezone.now() - timedelta(minutes=1),
+			body="Hello again!",
+		)
+		self.assertContains(self.client.get(reverse("home")), "Second Post")
+	
+	def test_cache_expires_at_next_publish(self):
+		publish_on = timezone.now() + timedelta(minutes=5)
+		BlogPost.objects.create(
+			title="Scheduled Post",
+			slug_title="scheduled-post",
+			author="Unigames Committee",
+			publish_on=publish_on,
+			body="Soon!",
+		)
+		self.assertNotContains(self.client.get(reverse("blog:all_posts")), "Scheduled Post")
+		self.assertLessEqual(AllBlogPostsView().get_cache_timeout(), 5 * 60 + 1)
+	
+	def test_pages_served_while_redis_is_down(self):
+		redis_down = RedisConnectionError("Connection refused")
+		with patch.object(LocMemCache, "get", side_effect=redis_down), \
+			patch.object(LocMemCache, "set", side_effect=redis_down), \
+			patch.object(LocMemCache, "add", side_effect=redis_down), \
+			self.assertLogs("phylactery", level="WARNING"):
+			self.assertContains(self.client.get(reverse("home")), "First Post")
+			self.assertEqual(render_markdown_to_html("**Bold**"), "<p><strong>Bold</strong></p>\n")
+
+
+class PrerenderPagesTests(TestCase):
+	def setUp(self):
+		self.output_root = Path(tempfile.mkdtemp())
+		self.addCleanup(shutil.rmtree, self.output_root)
+	
+	def test_prerender_pages(self):
+		with override_settings(PRERENDERED_PAGES_ROOT=self.output_root):
+			call_command("prerender_pages", "about", "constitution", stdout=StringIO())
+		about_html = (self.output_root / "about" / "index.html").read_text()
+		self.assertIn("You are not currently logged in.", about_html)
+		self.assertIn("prerendered_navbar.js", about_html)
+		self.assertTrue((self.output_root / "constitution" / "index.html").exists())
+		self.assertFalse((self.output_root / "events").exists())
+	
+	def test_navbar_fragment(self):
+		response = self.client.get(reverse("navbar_user"))
+		self.assertContains(response, 'id="navbar-user-menu"')
+		self.assertNotContains(response, "<html")
+		self.assertIn("no-cache", response["Cache-Control"])
+
+
+class CommitteePageTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.members = []
+		for n, position in enumerate([RankChoices.PRESIDENT, RankChoices.OCM, RankChoices.OCM, RankChoices.TREASURER]):
+			member = Member.objects.create(
+				short_name=f"Member {n}",
+				long_name=f"Member Number {n}",
+				pronouns="they/them",
+				join_date=timezone.now().date(),
+			)
+			member.add_rank(position)
+			self.members.append(member)
+	
+	def test_get_committee_single_query(self):
+		with self.assertNumQueries(1):
+			committee = Rank.objects.get_committee()
+			ocm_names = [rank.member.long_name for rank in committee[RankChoices.OCM]]
+		self.assertEqual(ocm_names, ["Member Number 1", "Member Number 2"])
+		self.assertEqual(committee[RankChoices.SECRETARY], [])
+	
+	def test_committee_page_invalidated_when_rank_expires(self):
+		self.assertContains(self.client.get(reverse("committee")), "Member Number 3")
+		with self.assertNumQueries(0):
+			self.client.get(reverse("committee"))
+		self.members[3].remove_rank(RankChoices.TREASURER)
+		self.assertNotContains(self.client.get(reverse("committee")), "Member Number 3")
+
+
+LEGACY_DUMP = [
+	{"model": "sessions.session", "pk": "abc", "fields": {"session_data": "", "expire_date": "2020-01-01T00:00:00Z"}},
+	{"model": "taggit.tag", "pk": 1, "fields": {"name": "Strategy", "slug": "strategy"}},
+	{"model": "taggit.tag", "pk": 2, "fields": {"name": "Area Control", "slug": "area-control"}},
+	{"model": "library.tagparent", "pk": 1, "fields": {"child_tag": 2, "parent_tag": [1]}},
+	{"model": "library.item", "pk": 5, "fields": {
+		"name": "Small World", "slug": "small-world", "type": "BG", "description": "", "condition": "", "notes": "",
+		"is_borrowable": True, "high_demand": False, "min_players": 2, "max_players": 5,
+		"min_play_time": 40, "max_play_time": 80, "average_play_time": None,
+		"image": "library/item_images/small-world.jpg",
+	}},
+	{"model": "library.itembasetags", "pk": 9, "fields": {"item": 5}},
+	{"model": "taggit.taggeditem", "pk": 1, "fields": {"tag": 2, "content_type": 12, "object_id": 9}},
+	{"model": "members.member", "pk": 3, "fields": {
+		"preferred_name": "Alex", "last_name": "Smith", "pronouns": "they/them", "student_number": "",
+		"join_date": "2019-02-01", "notes": "", "receive_emails": True, "email_address": "alex@example.com",
+	}},
+	{"model": "members.member", "pk": 4, "fields": {
+		"preferred_name": "Sam", "last_name": "Jones", "pronouns": "", "student_number": "12345678",
+		"join_date": "2019-02-01", "notes": "", "receive_emails": False,
+		"email_address": "12345678@student.example.com",
+	}},
+	{"model": "members.membership", "pk": 1, "fields": {
+		"member": 3, "date": "2019-02-01", "guild_member": True, "amount_paid": 5, "expired": False,
+		"authorising_gatekeeper": 99,
+	}},
+	{"model": "members.rankassignments", "pk": 1, "fields": {
+		"member": 3, "rank": 3, "assignment_date": "2019-02-01", "expired_date": None,
+	}},
+	{"model": "members.memberflag", "pk": 1, "fields": {
+		"name": "Events", "description": "Event news", "active": True, "member": [3, 4],
+	}},
+	{"model": "blog.blogpost", "pk": 1, "fields": {
+		"title": "Welcome", "slug_title": "welcome", "short_description": "", "author": "Committee",
+		"publish_on": "2019-02-01T00:00:00Z", "body": "**Hello**",
+	}},
+	{"model": "library.externalborrowingform", "pk": 2, "fields": {
+		"applicant_name": "Jo", "applicant_org": "Games Club", "contact_email": "jo@example.com",
+		"contact_phone": "0400 000 000", "requested_borrow_date": "2019-03-01", "form_submitted_date": "2019-02-20",
+		"form_status": "C", "librarian_comments": "", "event_details": "Games night",
+	}},
+	{"model": "library.externalborrowingitemrecord", "pk": 1, "fields": {
+		"form": 2, "item": 5, "borrower_name": "Jo", "auth_gatekeeper_borrow": 3, "date_borrowed": "2019-03-01",
+		"date_returned": "2019-03-02", "auth_gatekeeper_return": 3,
+	}},
+	{"model": "library.borrowrecord", "pk": 1, "fields": {
+		"borrowing_member": 4, "member_address": "1 Street", "member_phone_number": "0400 111 111",
+		"date_borrowed": "2019-04-01", "auth_gatekeeper_borrow": 3, "item": 5, "due_date": "2019-04-08",
+		"date_returned": None, "verified_returned": False, "auth_gatekeeper_return": None,
+	}},
+]
+
+
+class MigrateDataTests(TestCase):
+	def setUp(self):
+		directory = Path(tempfile.mkdtemp())
+		self.addCleanup(shutil.rmtree, directory)
+		self.split_directory = directory / "split"
+		self.dump_path = directory / "dump.json"
+		self.dump_path.write_text(json.dumps(LEGACY_DUMP, indent=2))
+	
+	def test_iter_json_entries(self):
+		# Entries split across chunks, as an array or one per line, all come out the same.
+		for text in (json.dumps(LEGACY_DUMP), "\n".join(json.dumps(entry) for entry in LEGACY_DUMP)):
+			self.assertEqual(list(iter_json_entries(StringIO(text), chunk_size=7)), LEGACY_DUMP)
+	
+	def test_migrate_data(self):
+		output = StringIO()
+		call_command("migrate_data", str(self.dump_path), "--batch-size", "2", stdout=output)
+		self.assertIn("Skipped 1 entries", output.getvalue())
+		self.assertIn("rows/s", output.getvalue())
+		
+		item = Item.objects.get(pk=5)
+		self.assertEqual(item.average_play_time, 60)
+		self.assertEqual(item.get_type_display(), "Board Game")
+		self.assertEqual(set(item.base_tags.values_list("name", flat=True)), {"Item Type: Board Game", "Area Control"})
+		self.assertEqual(set(item.computed_tags.values_list("name", flat=True)), {"Area Control", "Strategy"})
+		self.assertEqual(item.item_tag.name, "Item: Small World")
+		self.assertEqual(item.item_tag.slug, "item-small-world")
+		self.assertEqual(item.item_tag.parents.count(), 2)
+		# New tags carry on from the imported pks.
+		self.assertGreater(LibraryTag.objects.create(name="New Tag").pk, 2)
+		
+		alex = Member.objects.get(pk=3)
+		self.assertEqual(alex.user.email, "alex@example.com")
+		self.assertFalse(alex.user.has_usable_password())
+		self.assertIsNone(Member.objects.get(pk=4).user)
+		self.assertIsNone(alex.memberships.get().authorised_by)
+		self.assertTrue(alex.is_gatekeeper())
+		self.assertEqual(MailingList.objects.get(pk=1).members.count(), 2)
+		self.assertIn("<strong>Hello</strong>", BlogPost.objects.get(pk=1).body_html)
+		
+		reservation = Reservation.objects.get(pk=2)
+		self.assertEqual(list(reservation.reserved_items.all()), [item])
+		self.assertIn("Organisation: Games Club", reservation.additional_details)
+		external_record = BorrowRecord.objects.get(borrower__is_external=True)
+		self.assertEqual(external_record.borrower.borrow_authorised_by, "Alex Smith")
+		self.assertEqual(external_record.return_authorised_by, "Alex Smith")
+		self.assertTrue(external_record.returned)
+		internal_record = BorrowRecord.objects.get(borrower__is_external=False)
+		self.assertEqual(internal_record.borrower.internal_member_id, 4)
+		self.assertEqual(internal_record.borrower.borrower_name, "Sam Jones")
+		self.assertFalse(internal_record.returned)
+		self.assertEqual(internal_record.return_authorised_by, "")
+		self.assertIsNotNone(Item.objects.get(pk=5).availability_calendar_start)
+	
+	def test_item_tags_from_the_dump(self):
+		# The old site had its own "Item: <>" tags, with parents of their own, and used them to tag other items.
+		dump = LEGACY_DUMP + [
+			{"model": "taggit.tag", "pk": 3, "fields": {"name": "Item: Small World", "slug": "item-small-world"}},
+			{"model": "library.tagparent", "pk": 2, "fields": {"child_tag": 3, "parent_tag": [1]}},
+			{"model": "library.item", "pk": 6, "fields": {
+				**LEGACY_DUMP[4]["fields"], "name": "Small World Underground", "slug": "small-world-underground",
+			}},
+			{"model": "library.itembasetags", "pk": 10, "fields": {"item": 6}},
+			{"model": "taggit.taggeditem", "pk": 2, "fields": {"tag": 3, "content_type": 12, "object_id": 10}},
+		]
+		self.dump_path.write_text(json.dumps(dump))
+		call_command("migrate_data", str(self.dump_path), stdout=StringIO())
+		
+		item_tag = Item.objects.get(pk=5).item_tag
+		self.assertEqual(item_tag.pk, 3)
+		# Like saving the item would, its base tags replace the parents the tag had in the dump.
+		self.assertEqual(
+			set(item_tag.parents.values_list("name", flat=True)), {"Item Type: Board Game", "Area Control"}
+		)
+		# So the item tagged with it inherits the other item's tags.
+		self.assertEqual(
+			set(Item.objects.get(pk=6).computed_tags.values_list("name", flat=True)),
+			{"Item: Small World", "Area Control", "Strategy"}
+		)
+	
+	def test_invalid_rows_stop_the_import(self):
+		dump = [
+			{**entry, "fields": {**entry["fields"], "slug": "not a slug"}} if entry["model"] == "library.item" else entry
+			for entry in LEGACY_DUMP
+		]
+		self.dump_path.write_text(json.dumps(dump))
+		with self.assertRaisesMessage(CommandError, "Invalid library.item 5"):
+			call_command("migrate_data", str(self.dump_path), stdout=StringIO())
+		self.assertFalse(LibraryTag.objects.exists())
+	
+	def test_split_and_migrate_data(self):
+		counts = split_json(self.dump_path, self.split_directory, compress=True, processes=2, chunk_size=1)
+		self.assertEqual(counts["taggit.tag"], 2)
+		self.assertTrue((self.split_directory / "taggit.tag.jsonl.gz").exists())
+		call_command("migrate_data", str(self.split_directory), stdout=StringIO())
+		self.assertEqual(
+			set(Item.objects.get(pk=5).computed_tags.values_list("name", flat=True)), {"Area Control", "Strategy"}
+		)
+		self.assertEqual(BorrowRecord.objects.count(), 2)
@@ -2,7 +2,8 @@ from django.urls import path
 
 from .views import (
 	HomePageView, AboutPageView, EventsPageView, RolePlayingPageView,
-	CommitteeView, LifeMemberView, ContactView, ConstitutionView, WebcamsView, APIView, RegulationsView, MinutesView
+	CommitteeView, LifeMemberView, ContactView, ConstitutionView, WebcamsView, APIView, RegulationsView, MinutesView,
+	NavbarUserView
 )
 
 urlpatterns = [
@@ -18,4 +19,5 @@ urlpatterns = [
 	path("api/", APIView.as_view(), name="api"),
 	path("regulations/", RegulationsView.as_view(), name="regulations"),
 	path("minutes/", MinutesView.as_view(), name="minutes"),
+	path("navbar/", NavbarUserView.as_view(), name="navbar_user"),
 ]
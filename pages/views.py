@@ -1,11 +1,20 @@
 from members.models import Rank
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
 from django.views.generic import TemplateView
 from django.utils import timezone
 from blog.models import BlogPost
 from library.models import Item
+from blog.views import ExpireAtNextBlogPostMixin
+from phylactery.caching import AnonymousCachedViewMixin
 
+# These pages don't depend on the database, so "manage.py prerender_pages" renders them to static HTML.
+PRERENDERED_PAGE_NAMES = [
+	"about", "events", "rpgs", "life_members", "contact", "constitution", "webcams", "api", "regulations", "minutes"
+]
 
-class HomePageView(TemplateView):
+
+class HomePageView(ExpireAtNextBlogPostMixin, AnonymousCachedViewMixin, TemplateView):
 	template_name = "pages/home.html"
 	featured_tag_slug = "featured"
 	featured_item_limit = 5
@@ -18,9 +27,10 @@ class HomePageView(TemplateView):
 			base_tags__slug__in=[self.featured_tag_slug]
 		).distinct().order_by("name")
 		
+		# The bodies aren't shown on the home page, so don't fetch them.
 		context["recent_blogposts"] = BlogPost.objects.filter(
 			publish_on__lte=timezone.now()
-		).distinct().order_by("-publish_on")[:self.recent_blog_post_limit]
+		).defer("body", "body_html").order_by("-publish_on")[:self.recent_blog_post_limit]
 		
 		return context
 
@@ -51,7 +61,7 @@ class WebcamsView(TemplateView):
 	template_name = "pages/webcams.html"
 
 class APIView(TemplateView):
-	template_name = "coming_soon.html"
+	template_name = "pages/api.html"
 	
 class RegulationsView(TemplateView):
 	template_name = "pages/regulations.html"
@@ -59,10 +69,19 @@ class RegulationsView(TemplateView):
 class MinutesView(TemplateView):
 	template_name = "pages/minutes.html"
 
-class CommitteeView(TemplateView):
+class CommitteeView(AnonymousCachedViewMixin, TemplateView):
 	template_name = "pages/committee.html"
 	
 	def get_context_data(self, **kwargs):
 		context = super().get_context_data(**kwargs)
 		context["committee"] = Rank.objects.get_committee()
 		return context
+
+
+@method_decorator(never_cache, name="dispatch")
+class NavbarUserView(TemplateView):
+	"""
+	Renders just the user's section of the navbar.
+	Pre-rendered pages fetch this to replace their logged out navbar.
+	"""
+	template_name = "phylactery/snippets/navbar_user_snippet.html"
@@ -0,0 +1,220 @@
+import datetime
+import hashlib
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views import View
+from django.views.decorators.http import condition
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_PAGE_GENERATION_KEY = "public_pages:generation"
+
+
+def get_public_page_generation():
+	"""
+	Returns the current generation of cached public pages.
+	Cached pages are keyed by generation, so changing it invalidates all of them at once.
+	"""
+	generation = cache.get(PUBLIC_PAGE_GENERATION_KEY)
+	if generation is None:
+		# A timestamp is used, so that if the generation gets evicted from the cache,
+		# we won't ever go back to an old generation that still has pages cached.
+		cache.add(PUBLIC_PAGE_GENERATION_KEY, time.time_ns(), None)
+		generation = cache.get(PUBLIC_PAGE_GENERATION_KEY)
+	return generation
+
+
+def invalidate_public_pages(*args, **kwargs):
+	"""
+	Invalidates every cached public page.
+	Accepts and ignores any arguments, so that it can be connected directly to signals.
+	"""
+	cache.set(PUBLIC_PAGE_GENERATION_KEY, time.time_ns(), None)
+
+
+def seconds_until(moment: datetime.datetime) -> int:
+	# Returns the number of whole seconds until the given moment, rounded up. Never less than 1.
+	return max(1, int((moment - timezone.now()).total_seconds()) + 1)
+
+
+def seconds_until_midnight() -> int:
+	# Returns the number of seconds until the next local midnight.
+	tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+	midnight = timezone.make_aware(datetime.datetime.combine(tomorrow, datetime.time.min))
+	return seconds_until(midnight)
+
+
+class AnonymousCachedViewMixin:
+	"""
+	Mixin for TemplateResponse-based views.
+	Caches the rendered page for anonymous users, and serves it from the cache on later hits.
+	Logged in users, requests with pending messages, and non-GET requests skip the cache entirely.
+	
+	Pages expire after get_cache_timeout() seconds, which defaults to PUBLIC_PAGE_CACHE_TIMEOUT,
+	or at midnight, or at get_cache_expires_at(), whichever is sooner (pages often show relative dates like "Today").
+	They can also all be invalidated early with invalidate_public_pages().
+	If Redis can't be reached, pages are rendered as normal, without the cache.
+	"""
+	
+	def get_cache_expires_at(self) -> datetime.datetime | None:
+		# Views can override this to expire the page at a known moment (e.g. when the next blog post goes up).
+		return None
+	
+	def get_cache_timeout(self) -> int:
+		timeout = min(settings.PUBLIC_PAGE_CACHE_TIMEOUT, seconds_until_midnight())
+		expires_at = self.get_cache_expires_at()
+		if expires_at is not None:
+			timeout = min(timeout, seconds_until(expires_at))
+		return timeout
+	
+	def get_cache_key(self) -> str:
+		path_hash = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+		return f"public_pages:{get_public_page_generation()}:{path_hash}"
+	
+	def should_use_cache(self, request) -> bool:
+		return (
+			request.method in ("GET", "HEAD")
+			and not request.user.is_authenticated
+			and len(messages.get_messages(request)) == 0
+		)
+	
+	def dispatch(self, request, *args, **kwargs):
+		if not self.should_use_cache(request):
+			return super().dispatch(request, *args, **kwargs)
+		
+		try:
+			cache_key = self.get_cache_key()
+			cached_page = cache.get(cache_key)
+		except RedisError:
+			logger.warning(f"Couldn't read {request.path} from the cache, rendering it without the cache.")
+			return super().dispatch(request, *args, **kwargs)
+		if cached_page is not None:
+			content, content_type = cached_page
+			return HttpResponse(content, content_type=content_type)
+		
+		response = super().dispatch(request, *args, **kwargs)
+		if response.status_code == 200 and hasattr(response, "add_post_render_callback"):
+			timeout = self.get_cache_timeout()
+			response.add_post_render_callback(lambda rendered: self.cache_page(cache_key, rendered, timeout))
+		return response
+	
+	def cache_page(self, cache_key, response, timeout):
+		try:
+			cache.set(cache_key, (response.content, response["Content-Type"]), timeout)
+		except RedisError:
+			logger.warning(f"Couldn't cache {self.request.path}.")
+
+
+def start_of_today() -> datetime.datetime:
+	return timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time.min))
+
+
+class ConditionalGetMixin:
+	"""
+	Mixin for detail views, to answer conditional GETs (If-None-Match / If-Modified-Since) with a 304,
+	without running the view or rendering the template.
+	
+	Views must implement get_last_modified(), which should be a cheap query (a single row) for when
+	anything shown on the page last changed. This is checked when the view class is defined.
+	It returns None if the object doesn't exist, in which case the view runs as normal (and 404s).
+	The ETag is worked out from that and who is looking at the page (see get_viewer_key()),
+	since logged in users see a different page.
+	
+	If pages_change_daily is True, the page is treated as changing at midnight too, for pages that
+	show relative dates like "Today", or things that depend on today's date (like an item's availability).
+	
+	Works with async views too - get_last_modified() is then run in a thread.
+	"""
+	pages_change_daily = False
+	
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		# Fail when the view is defined, rather than on its first request.
+		if issubclass(cls, View) and cls.get_last_modified is ConditionalGetMixin.get_last_modified:
+			raise ImproperlyConfigured(
+				f"{cls.__qualname__} uses ConditionalGetMixin, so must implement get_last_modified()."
+			)
+	
+	def get_last_modified(self) -> datetime.datetime | None:
+		# Abstract - see the class docstring.
+		raise NotImplementedError(f"{type(self).__qualname__} must implement get_last_modified().")
+	
+	def get_page_last_modified(self) -> datetime.datetime | None:
+		last_modified = self.get_last_modified()
+		if last_modified is not None and self.pages_change_daily:
+			last_modified = max(last_modified, start_of_today())
+		return last_modified
+	
+	def get_viewer_key(self) -> str:
+		"""
+		Returns what the page depends on about who is looking at it.
+		Every page shows a logged in member's name in the navbar, and menus that depend on their ranks and
+		membership (see navbar_user_snippet.html), so a change to any of those has to change the ETag.
+		"""
+		user = self.request.user
+		if not user.is_authenticated:
+			return ""
+		member = user.get_member
+		if member is None:
+			return str(user.pk)
+		rank_names = sorted(set(member.ranks.filter(expired=False).values_list("rank_name", flat=True)))
+		return f"{user.pk}:{member.short_name}:{','.join(rank_names)}:{member.has_active_membership()}"
+	
+	def get_etag(self, last_modified: datetime.datetime) -> str:
+		key = f"{self.request.get_full_path()}:{self.get_viewer_key()}:{last_modified.isoformat()}"
+		return hashlib.md5(key.encode()).hexdigest()
+	
+	def should_use_conditional_get(self, request) -> bool:
+		# Pending messages need the page to be rendered, to show them.
+		return request.method in ("GET", "HEAD") and len(messages.get_messages(request)) == 0
+	
+	def get_validators(self) -> tuple[datetime.datetime | None, str | None]:
+		# Returns the page's last modified time and ETag, or (None, None) if the object doesn't exist.
+		last_modified = self.get_page_last_modified()
+		if last_modified is None:
+			return None, None
+		return last_modified, self.get_etag(last_modified)
+	
+	def dispatch(self, request, *args, **kwargs):
+		if getattr(self, "view_is_async", False):
+			return self.dispatch_conditional_async(request, *args, **kwargs)
+		if not self.should_use_conditional_get(request):
+			return super().dispatch(request, *args, **kwargs)
+		
+		last_modified, etag = self.get_validators()
+		
+		@condition(etag_func=lambda *args, **kwargs: etag, last_modified_func=lambda *args, **kwargs: last_modified)
+		def view(request, *args, **kwargs):
+			return super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+		
+		return self.patch_conditional_response(view(request, *args, **kwargs), last_modified)
+	
+	async def dispatch_conditional_async(self, request, *args, **kwargs):
+		# Checking for messages (the session) and the user (for the ETag) can run queries too.
+		if not await sync_to_async(self.should_use_conditional_get)(request):
+			return await super().dispatch(request, *args, **kwargs)
+		
+		last_modified, etag = await sync_to_async(self.get_validators)()
+		
+		@condition(etag_func=lambda *args, **kwargs: etag, last_modified_func=lambda *args, **kwargs: last_modified)
+		async def view(request, *args, **kwargs):
+			return await super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+		
+		return self.patch_conditional_response(await view(request, *args, **kwargs), last_modified)
+	
+	@staticmethod
+	def patch_conditional_response(response, last_modified):
+		if last_modified is not None:
+			# Browsers should always check that their copy is current, rather than guessing how long it lasts.
+			patch_cache_control(response, no_cache=True)
+		return response
@@ -1,6 +1,7 @@
 import os
 from django.conf import settings
 from celery import Celery
+from celery.signals import worker_process_init
 
 # https://docs.celeryq.dev/en/main/django/first-steps-with-django.html#django-first-steps
 
@@ -16,6 +17,22 @@ app.config_from_object(
 # Load all tasks from registered django apps
 app.autodiscover_tasks()
 
+
+@worker_process_init.connect
+def resize_database_pool(**kwargs):
+	"""
+	Each worker process gets its own connection pool, sized with CELERY_DATABASE_POOL_MAX_SIZE.
+	Any pool inherited from the parent process is thrown away first.
+	"""
+	from django.db import connections
+	for connection in connections.all():
+		pool_options = connection.settings_dict["OPTIONS"].get("pool")
+		if pool_options:
+			connection.close_pool()
+			max_size = settings.CELERY_DATABASE_POOL_MAX_SIZE
+			pool_options.update(min_size=min(pool_options.get("min_size", 1), max_size), max_size=max_size)
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
 	print(f"Request: {self.request!r}")
@@ -1,4 +1,5 @@
-from redis import Redis
+from redis import ConnectionPool, Redis
+from redis.exceptions import RedisError
 
 from celery import shared_task
 from celery.utils.log import get_task_logger
@@ -6,6 +7,48 @@ from django.conf import settings
 
 logger = get_task_logger(__name__)
 
+# Each process (web worker or Celery worker) keeps its own pool of connections to Redis,
+# created the first time it's needed. redis-py resets the pool itself if the process forks.
+redis_connection_pool = None
+
+
+def get_redis():
+	"""
+		Returns a Redis client that borrows its connections from this process' pool,
+		rather than opening a new connection every time.
+	"""
+	global redis_connection_pool
+	if redis_connection_pool is None:
+		redis_connection_pool = ConnectionPool(
+			host=settings.REDIS_HOST,
+			port=6379,
+			decode_responses=True,
+			max_connections=settings.REDIS_MAX_CONNECTIONS,
+			# Without these, publishing straight from a web request would hang if Redis can't be reached,
+			# rather than failing and falling back to Celery.
+			socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+			socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+		)
+	return Redis(connection_pool=redis_connection_pool)
+
+
+def publish_to_discord(redis_channel_name: str, message: str):
+	"""
+		Publishes a single message to one of the Redis-channels that the Discord bot listens to.
+	"""
+	get_redis().publish(redis_channel_name, message)
+
+
+def publish_many_to_discord(messages: list[tuple[str, str]]):
+	"""
+		Publishes many (redis_channel_name, message) pairs at once.
+		They are pipelined, so they all go to Redis in a single round trip.
+	"""
+	pipeline = get_redis().pipeline(transaction=False)
+	for redis_channel_name, message in messages:
+		pipeline.publish(redis_channel_name, message)
+	pipeline.execute()
+
 
 @shared_task(name="send_to_discord")
 def send_to_discord(redis_channel_name: str, message: str):
@@ -15,24 +58,64 @@ def send_to_discord(redis_channel_name: str, message: str):
 		Publishing a message to one of these Redis-channels will cause the
 		Discord bot to relay that message to any linked Discord channels.
 	"""
-	r = Redis(host=settings.REDIS_HOST, port=6379, decode_responses=True)
-	r.publish(redis_channel_name, message)
-	r.close()
+	publish_to_discord(redis_channel_name, message)
+
+
+@shared_task(name="send_many_to_discord")
+def send_many_to_discord(messages: list[tuple[str, str]]):
+	"""
+		Same as send_to_discord, but for a batch of (redis_channel_name, message) pairs.
+	"""
+	publish_many_to_discord(messages)
+
+
+def send(redis_channel_name: str, message: str, direct: bool | None = None):
+	"""
+		Sends a message to the Discord bot.
+		Publishing to Redis is usually cheaper than queueing a Celery task to do it, so if
+		direct is True (or DISCORD_PUBLISH_DIRECTLY is set), the message is published right here.
+		If Redis can't be reached, it falls back to queueing the task.
+	"""
+	if direct is None:
+		direct = settings.DISCORD_PUBLISH_DIRECTLY
+	if direct:
+		try:
+			publish_to_discord(redis_channel_name, message)
+			return
+		except RedisError:
+			logger.warning(f"Couldn't publish to {redis_channel_name} directly, queueing it instead.")
+	send_to_discord.delay(redis_channel_name=redis_channel_name, message=message)
+
+
+def send_many(messages: list[tuple[str, str]], direct: bool | None = None):
+	"""
+		Sends many (redis_channel_name, message) pairs to the Discord bot at once.
+		See send() for what direct does.
+	"""
+	if not messages:
+		return
+	if direct is None:
+		direct = settings.DISCORD_PUBLISH_DIRECTLY
+	if direct:
+		try:
+			publish_many_to_discord(messages)
+			return
+		except RedisError:
+			logger.warning(f"Couldn't publish {len(messages)} messages directly, queueing them instead.")
+	send_many_to_discord.delay(messages=messages)
 
 
 def send_to_minutes(message: str):
-	send_to_discord.delay(redis_channel_name="discord:minutes:ping", message=message)
+	send(redis_channel_name="discord:minutes:ping", message=message)
 
 
 def send_to_news(message: str):
-	send_to_discord.delay(redis_channel_name="discord:news:ping", message=message)
+	send(redis_channel_name="discord:news:ping", message=message)
 
 
 def send_to_library(message: str):
-	send_to_discord.delay(redis_channel_name="discord:library:ping", message=message)
+	send(redis_channel_name="discord:library:ping", message=message)
 
 
 def send_to_door(message: str):
-	send_to_discord.delay(redis_channel_name="discord:door:ping", message=message)
-
-
+	send(redis_channel_name="discord:door:ping", message=message)
@@ -1,11 +1,12 @@
 import re
+from smtplib import SMTPException
 
 import css_inline
 from celery import shared_task
 from celery.utils.log import get_task_logger
 from django.contrib.sites.models import Site
-from django.core.mail import get_connection, send_mail
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.template.loader import get_template
 from django.utils.html import strip_tags
 
 multiple_newline = re.compile(r"\n{2,}")
@@ -22,16 +23,20 @@ def render_html_email(template_name, context, request=None):
 		However, that isn't passable with Celery.
 		So we only render the email bodies and return those.
 	"""
+	# The current Site is cached by django.contrib.sites after the first lookup,
+	# so this doesn't hit the database every time.
 	context["protocol"] = "https://"
 	context["domain"] = Site.objects.get_current().domain
 	
-	html_message = render_to_string(template_name, context, request=request)
+	# Both versions are rendered from the same compiled template.
+	template = get_template(template_name)
+	html_message = template.render(context, request=request)
 	# For best HTML email results, CSS has to be put on elements inline.
 	html_message = inliner.inline(html_message)
 	
 	# Process the plaintext version
 	context["override_base"] = "email/email_base.txt"
-	plaintext_message = render_to_string(template_name, context, request=request)
+	plaintext_message = template.render(context, request=request)
 	# Remove excess whitespace
 	plaintext_message = "\n".join(line.strip() for line in plaintext_message.splitlines())
 	# Remove leftover HTML tags from the plaintext message
@@ -40,45 +45,70 @@ def render_html_email(template_name, context, request=None):
 	return plaintext_message, html_message
 
 
-@shared_task(name="send_single_mail_task", rate_limit="1/s")
-def send_single_email_task(email_address, subject, message, html_message=None, connection=None, log=True):
+@shared_task(
+	name="send_single_mail_task",
+	rate_limit="1/s",
+	autoretry_for=(SMTPException, OSError),
+	retry_backoff=True,
+	max_retries=5,
+)
+def send_single_email_task(email_address, subject, message, html_message=None, log=True):
 	"""
 		Sends a single email to a single email address asynchronously.
+		Opens its own connection, so it is best kept for one-off emails,
+		and for retrying recipients that failed in a batch.
 	"""
-	if connection is None:
-		connection = get_connection()
-		connection.open()
-
 	send_mail(
 		subject=subject,
 		message=message,
 		from_email=None,
 		recipient_list=[email_address],
 		html_message=html_message,
-		connection=connection
 	)
 	if log:
 		logger.info(f"Sent email to {email_address}.")
 
 
-@shared_task(name="send_mass_email_task")
-def send_mass_email_task(email_address_list, subject, message, html_message=None):
+def build_email_message(email_address, subject, message, html_message=None, connection=None):
+	"""
+		Builds (but doesn't send) an email to a single email address.
+		Each recipient gets their own message, so that mailing list
+		members can't see each other's email addresses.
+	"""
+	email_message = EmailMultiAlternatives(
+		subject=subject,
+		body=message,
+		to=[email_address],
+		connection=connection,
+	)
+	if html_message is not None:
+		email_message.attach_alternative(html_message, "text/html")
+	return email_message
+
+
+def send_email_batch(email_address_batch, subject, message, html_message=None):
+	"""
+		Sends the same email to a batch of email addresses, over a single connection.
+		Returns a list of the email addresses that could not be sent to.
+	"""
+	return send_personalised_email_batch([
+		(email_address, subject, message, html_message) for email_address in email_address_batch
+	])
+
+
+def send_personalised_email_batch(emails):
 	"""
-		Sends a single email to many email addresses.
-		Intended for mailing list purposes.
-		It calls the send_single_email_task a bunch of times,
-		so that everything goes through its rate limit.
+		Sends a batch of different emails, over a single connection.
+		emails is a list of (email address, subject, message, html message) tuples.
+		Returns a list of the email addresses that could not be sent to.
 	"""
-	connection = get_connection()
-	connection.open()
-	for email_address in email_address_list:
-		send_single_email_task.delay(
-			email_address=email_address,
-			subject=subject,
-			message=message,
-			html_message=html_message,
-			connection=connection,
-			log=False
-		)
-	connection.close()
-	logger.info(f"Sent emails to {len(email_address_list)} recipients.")
+	failed_email_addresses = []
+	with get_connection(fail_silently=False) as connection:
+		for email_address, subject, message, html_message in emails:
+			email_message = build_email_message(email_address, subject, message, html_message, connection)
+			try:
+				connection.send_messages([email_message])
+			except (SMTPException, OSError) as exception:
+				logger.warning(f"Failed to send email to {email_address}: {exception!r}")
+				failed_email_addresses.append(email_address)
+	return failed_email_addresses
@@ -0,0 +1,203 @@
+"""
+Sends read-only catalogue and reporting queries to a read replica of the database.
+
+Everything reads from the primary database by default. Code that is happy to read slightly
+stale data opts in with read_from_replica(), either as a context manager or a decorator:
+	with read_from_replica():
+		items = list(Item.objects.all())
+
+Views can use ReplicaReadsMixin instead. Querysets that are evaluated later can
+use .using(get_replica_database()).
+
+To avoid showing someone stale data straight after they've changed something (replication lag),
+once a request writes anything, the rest of it reads from the primary, and so does everything
+in the same session for the next REPLICA_PIN_SECONDS - see PrimaryPinningMiddleware.
+
+If there is no "replica" database configured, everything uses the primary.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB_ALIAS = "replica"
+PRIMARY_PINNED_COOKIE_NAME = "pin_primary"
+
+_use_replica = ContextVar("use_replica", default=False)
+_pinned_to_primary = ContextVar("pinned_to_primary", default=False)
+# A mutable WriteTracker, shared by everything in the same request (or read_from_replica block),
+# so that nested blocks see each other's writes.
+_write_tracker = ContextVar("write_tracker", default=None)
+
+
+class WriteTracker:
+	def __init__(self):
+		self.has_written = False
+
+
+@contextmanager
+def track_writes():
+	"""
+	Keeps track of whether anything inside this block writes to the database.
+	Nested blocks share the outermost block's tracker.
+	"""
+	tracker = _write_tracker.get()
+	if tracker is not None:
+		yield tracker
+		return
+	tracker = WriteTracker()
+	token = _write_tracker.set(tracker)
+	try:
+		yield tracker
+	finally:
+		_write_tracker.reset(token)
+
+
+def has_written():
+	tracker = _write_tracker.get()
+	return tracker is not None and tracker.has_written
+
+
+def replica_configured():
+	return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def get_read_database():
+	"""
+	Returns the alias of the database that reads should go to right now.
+	"""
+	if _use_replica.get():
+		return get_replica_database()
+	return DEFAULT_DB_ALIAS
+
+
+def get_replica_database():
+	"""
+	Returns the alias of the replica, unless there isn't one or it isn't safe to read from it right now.
+	Useful with QuerySet.using(), for querysets that are evaluated later (e.g. in a streaming response).
+	"""
+	if (
+		replica_configured()
+		and not _pinned_to_primary.get()
+		and not has_written()
+		# Reads in the middle of a transaction need to see what it has written.
+		and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+	):
+		return REPLICA_DB_ALIAS
+	return DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def read_from_replica():
+	"""
+	Reads inside this block go to the replica, if there is one and it's safe to.
+	"""
+	with track_writes():
+		token = _use_replica.set(True)
+		try:
+			yield
+		finally:
+			_use_replica.reset(token)
+
+
+@contextmanager
+def pin_to_primary(pinned=True):
+	"""
+	All reads inside this block go to the primary, even inside read_from_replica().
+	"""
+	token = _pinned_to_primary.set(pinned)
+	try:
+		yield
+	finally:
+		_pinned_to_primary.reset(token)
+
+
+class ReplicaReadsMixin:
+	"""
+	Mixin for read-only views, so that their queries (including any the template makes) read from the replica.
+	"""
+	
+	def dispatch(self, request, *args, **kwargs):
+		if getattr(self, "view_is_async", False):
+			return self.dispatch_async(request, *args, **kwargs)
+		with read_from_replica():
+			response = super().dispatch(request, *args, **kwargs)
+			if hasattr(response, "render") and not response.is_rendered:
+				response.render()
+		return response
+	
+	async def dispatch_async(self, request, *args, **kwargs):
+		with read_from_replica():
+			return await super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+	"""
+	Database router for the read replica. Writes and migrations always go to the primary.
+	"""
+
+	def db_for_read(self, model, **hints):
+		return get_read_database()
+
+	def db_for_write(self, model, **hints):
+		# From now on, this request reads its own writes from the primary.
+		tracker = _write_tracker.get()
+		if tracker is not None:
+			tracker.has_written = True
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# The replica is a copy of the primary, so objects from either can be related.
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryPinningMiddleware(object):
+	"""
+	This middleware pins a session to the primary database for REPLICA_PIN_SECONDS after it writes anything,
+	using a short-lived cookie, so the replica has time to catch up before they read from it again.
+	Works with both sync and async requests - the context variables follow the request into any threads it uses.
+	"""
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		self.async_mode = iscoroutinefunction(get_response)
+		if self.async_mode:
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if self.async_mode:
+			return self.__acall__(request)
+		with track_writes() as tracker, pin_to_primary(self.is_pinned(request)):
+			response = self.get_response(request)
+			self.pin_if_written(tracker, response)
+		return response
+
+	async def __acall__(self, request):
+		with track_writes() as tracker, pin_to_primary(self.is_pinned(request)):
+			response = await self.get_response(request)
+			self.pin_if_written(tracker, response)
+		return response
+
+	@staticmethod
+	def pin_if_written(tracker, response):
+		if tracker.has_written and replica_configured():
+			response.set_cookie(
+				PRIMARY_PINNED_COOKIE_NAME, str(int(time.time()) + settings.REPLICA_PIN_SECONDS),
+				max_age=settings.REPLICA_PIN_SECONDS, samesite="Lax", secure=settings.SESSION_COOKIE_SECURE
+			)
+
+	@staticmethod
+	def is_pinned(request):
+		try:
+			return int(request.COOKIES.get(PRIMARY_PINNED_COOKIE_NAME, 0)) > time.time()
+		except ValueError:
+			return False
@@ -0,0 +1,69 @@
+"""
+Measures how much of a request's database time is spent just connecting.
+
+Simulates a run of cheap requests (like an item page) against the default database,
+once opening a new connection for each request (as without DATABASE_POOL), and once
+taking a connection from a pool, and compares the latency of the two.
+"""
+import copy
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+	help = "Compares request database latency with and without the connection pool."
+	
+	def add_arguments(self, parser):
+		parser.add_argument("--requests", type=int, default=200, help="How many requests to simulate for each.")
+		parser.add_argument(
+			"--query", default="SELECT 1",
+			help="The query each request runs. Defaults to a trivial one, so that connecting dominates."
+		)
+	
+	def handle(self, *args, **options):
+		default_connection = connections["default"]
+		unpooled_settings = copy.deepcopy(default_connection.settings_dict)
+		unpooled_settings["OPTIONS"].pop("pool", None)
+		unpooled_settings["CONN_MAX_AGE"] = 0
+		pooled_settings = copy.deepcopy(unpooled_settings)
+		pooled_settings["OPTIONS"]["pool"] = (
+			default_connection.settings_dict["OPTIONS"].get("pool") or {"min_size": 1, "max_size": 1}
+		)
+		
+		for name, alias, settings_dict in [
+			("New connection per request", "benchmark_unpooled", unpooled_settings),
+			("Pooled", "benchmark_pooled", pooled_settings),
+		]:
+			connections.settings[alias] = settings_dict
+			connection = connections[alias]
+			try:
+				latencies = self.simulate_requests(connection, options["requests"], options["query"])
+			finally:
+				connection.close()
+				if connection.pool:
+					connection.close_pool()
+			self.stdout.write(
+				f"{name}: mean {statistics.mean(latencies) * 1000:.2f}ms, "
+				f"p50 {statistics.median(latencies) * 1000:.2f}ms, "
+				f"p95 {statistics.quantiles(latencies, n=20)[18] * 1000:.2f}ms"
+			)
+	
+	@staticmethod
+	def simulate_requests(connection, count, query):
+		latencies = []
+		# Warm up, so the pool is already open, like it would be for all but the first request.
+		connection.ensure_connection()
+		connection.close()
+		for _ in range(count):
+			start = time.perf_counter()
+			with connection.cursor() as cursor:
+				cursor.execute(query)
+				cursor.fetchall()
+			# Django closes the connection at the end of every request (CONN_MAX_AGE = 0).
+			# With a pool, this just hands it back.
+			connection.close()
+			latencies.append(time.perf_counter() - start)
+		return latencies
@@ -0,0 +1,53 @@
+import hashlib
+import logging
+import threading
+
+from markdown2 import Markdown
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# markdown2's Markdown objects can be reused, but hold state while converting,
+# so each thread gets its own.
+local_renderers = threading.local()
+
+# Rendered HTML only depends on the text, so it can be cached for a long time.
+MARKDOWN_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def get_markdown_renderer() -> Markdown:
+	"""
+	Returns this thread's Markdown renderer, creating it if needed.
+	"""
+	renderer = getattr(local_renderers, "renderer", None)
+	if renderer is None:
+		renderer = Markdown(
+			safe_mode="escape"
+		)
+		local_renderers.renderer = renderer
+	return renderer
+
+
+def render_markdown_to_html(raw_text: str) -> str:
+	"""
+	Converts markdown formatted text into html.
+	The result is cached, keyed by a hash of the text,
+	so the same text is only ever parsed once per cache lifetime.
+	If Redis can't be reached, the text is just parsed every time.
+	"""
+	if not raw_text:
+		return ""
+	cache_key = f"markdown:{hashlib.sha256(raw_text.encode()).hexdigest()}"
+	try:
+		output_html = cache.get(cache_key)
+	except RedisError:
+		logger.warning("Couldn't read rendered Markdown from the cache.")
+		return str(get_markdown_renderer().convert(raw_text))
+	if output_html is None:
+		output_html = str(get_markdown_renderer().convert(raw_text))
+		try:
+			cache.set(cache_key, output_html, MARKDOWN_CACHE_TIMEOUT)
+		except RedisError:
+			logger.warning("Couldn't cache rendered Markdown.")
+	return output_html
@@ -0,0 +1,268 @@
+import base64
+import datetime
+import hashlib
+import json
+import logging
+from functools import cached_property, reduce
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# How long a cached count for approximate_count lasts, in seconds.
+APPROXIMATE_COUNT_CACHE_TIMEOUT = 60 * 10
+
+
+class KeysetPage:
+	"""
+	A single page of results from a KeysetPaginator.
+	Rather than page numbers, pages link to each other with cursors, which encode the
+	ordering values of the first or last object on the page.
+	"""
+
+	def __init__(self, object_list, paginator, has_next, has_previous):
+		self.object_list = object_list
+		self.paginator = paginator
+		self._has_next = has_next
+		self._has_previous = has_previous
+
+	def __iter__(self):
+		return iter(self.object_list)
+
+	def __len__(self):
+		return len(self.object_list)
+
+	def has_next(self):
+		return self._has_next
+
+	def has_previous(self):
+		return self._has_previous
+
+	def has_other_pages(self):
+		return self._has_next or self._has_previous
+
+	@property
+	def next_cursor(self):
+		if not self._has_next:
+			return None
+		return self.paginator.encode_cursor(self.object_list[-1], "next")
+
+	@property
+	def previous_cursor(self):
+		if not self._has_previous:
+			return None
+		return self.paginator.encode_cursor(self.object_list[0], "previous")
+
+
+class KeysetPaginator:
+	"""
+	Paginates a queryset with keyset (seek) pagination.
+
+	Each page is fetched by filtering on the ordering values of the last object of the previous page,
+	so the database can seek straight to it using an index, rather than counting and skipping
+	every row before it with OFFSET. There is no total count or page numbers, just next and previous.
+
+	ordering is a list of field names (or annotations), with a "-" prefix for descending order.
+	It must end in a unique field (like "pk") so that the order is total.
+	
+	If approximate_count is True, the approximate_count property gives a rough number of results,
+	cheaply - either the planner's estimate of the table size, or a count that is cached for a while.
+	"""
+	
+	keyset = True
+
+	def __init__(self, queryset, per_page, ordering, approximate_count=False):
+		self.queryset = queryset
+		self.per_page = int(per_page)
+		self.ordering = list(ordering)
+		self.use_approximate_count = approximate_count
+
+	@cached_property
+	def approximate_count(self):
+		"""
+		Returns roughly how many results there are, or None if approximate counts are turned off.
+		An unfiltered queryset uses the table size estimate that Postgres keeps (pg_class.reltuples).
+		Anything else is counted, and the count is cached for APPROXIMATE_COUNT_CACHE_TIMEOUT seconds
+		(or counted every time, if Redis can't be reached).
+		"""
+		if not self.use_approximate_count:
+			return None
+		if self.queryset.query.is_empty():
+			return 0
+		estimate = self.get_table_estimate()
+		if estimate is not None:
+			return estimate
+		count = None
+		try:
+			count = cache.get(self.get_count_cache_key())
+			if count is None:
+				count = self.queryset.count()
+				cache.set(self.get_count_cache_key(), count, APPROXIMATE_COUNT_CACHE_TIMEOUT)
+		except RedisError:
+			logger.warning("Couldn't use the cache for an approximate count.")
+			if count is None:
+				count = self.queryset.count()
+		return count
+	
+	async def aget_approximate_count(self):
+		"""
+		Async version of approximate_count. The result is stored, so approximate_count won't query again.
+		"""
+		if "approximate_count" in self.__dict__:
+			return self.approximate_count
+		if not self.use_approximate_count or self.queryset.query.is_empty():
+			count = self.approximate_count
+		else:
+			count = await sync_to_async(self.get_table_estimate)()
+			if count is None:
+				count = await cache.aget(self.get_count_cache_key())
+			if count is None:
+				count = await self.queryset.acount()
+				await cache.aset(self.get_count_cache_key(), count, APPROXIMATE_COUNT_CACHE_TIMEOUT)
+		self.__dict__["approximate_count"] = count
+		return count
+	
+	def get_table_estimate(self):
+		"""
+		Returns Postgres' estimate of the number of rows in the table, if the queryset is unfiltered.
+		Returns None otherwise, or if there is no estimate.
+		"""
+		query = self.queryset.query
+		if query.where or query.distinct:
+			return None
+		with connections[self.queryset.db].cursor() as cursor:
+			cursor.execute(
+				"SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+				[self.queryset.model._meta.db_table]
+			)
+			row = cursor.fetchone()
+		# reltuples is -1 if the table has never been analyzed.
+		if row is not None and row[0] >= 0:
+			return row[0]
+		return None
+	
+	def get_count_cache_key(self):
+		return f"pagination_count:{hashlib.md5(str(self.queryset.query).encode()).hexdigest()}"
+
+	def get_page(self, cursor=None):
+		"""
+		Returns the page that the cursor points to.
+		Returns the first page if the cursor is missing or invalid.
+		"""
+		queryset, direction = self.get_page_queryset(cursor)
+		return self.build_page(list(queryset), direction)
+	
+	async def aget_page(self, cursor=None):
+		"""
+		Async version of get_page.
+		"""
+		queryset, direction = self.get_page_queryset(cursor)
+		return self.build_page([obj async for obj in queryset], direction)
+	
+	def get_page_queryset(self, cursor):
+		"""
+		Returns the (unevaluated) queryset for the page that the cursor points to, and the direction of the cursor.
+		One more object than needed is fetched, to tell whether there is another page after it.
+		"""
+		values, direction = self.decode_cursor(cursor)
+		if values is not None:
+			if direction == "previous":
+				ordering = [self.reverse_field(field) for field in self.ordering]
+			else:
+				ordering = self.ordering
+			try:
+				queryset = self.queryset.filter(self.get_seek_filter(ordering, values))
+			except (ValueError, TypeError, ValidationError):
+				# The cursor has been tampered with.
+				values = None
+		
+		if values is None:
+			return self.queryset.order_by(*self.ordering)[:self.per_page + 1], None
+		return queryset.order_by(*ordering)[:self.per_page + 1], direction
+	
+	def build_page(self, objects, direction):
+		has_more = len(objects) > self.per_page
+		objects = objects[:self.per_page]
+		if direction is None:
+			# The first page.
+			return KeysetPage(objects, self, has_next=has_more, has_previous=False)
+		if direction == "previous":
+			# We walked backwards from the cursor, so flip the results back around.
+			objects.reverse()
+			return KeysetPage(objects, self, has_next=True, has_previous=has_more)
+		return KeysetPage(objects, self, has_next=has_more, has_previous=True)
+
+	@staticmethod
+	def reverse_field(field):
+		return field[1:] if field.startswith("-") else f"-{field}"
+
+	@staticmethod
+	def get_seek_filter(ordering, values):
+		"""
+		Returns a Q object matching everything after the given values, in the given ordering.
+		For an ordering of (a, b, c), that is:
+			a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+		"""
+		clauses = []
+		for index, field in enumerate(ordering):
+			field_name = field.lstrip("-")
+			lookup = "lt" if field.startswith("-") else "gt"
+			equal_fields = {
+				previous_field.lstrip("-"): previous_value
+				for previous_field, previous_value in zip(ordering[:index], values[:index])
+			}
+			clauses.append(Q(**equal_fields, **{f"{field_name}__{lookup}": values[index]}))
+		return reduce(lambda left, right: left | right, clauses)
+
+	def get_values(self, obj):
+		values = []
+		for field in self.ordering:
+			value = getattr(obj, field.lstrip("-"))
+			if isinstance(value, (datetime.date, datetime.datetime)):
+				value = value.isoformat()
+			values.append(value)
+		return values
+
+	def encode_cursor(self, obj, direction):
+		data = json.dumps({"v": self.get_values(obj), "d": direction}, separators=(",", ":"))
+		return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+	def decode_cursor(self, cursor):
+		"""
+		Returns the values and direction stored in the cursor, or (None, None) if it isn't valid.
+		"""
+		if not cursor:
+			return None, None
+		try:
+			data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+			values, direction = data["v"], data["d"]
+		except (ValueError, TypeError, KeyError):
+			return None, None
+		if not isinstance(values, list) or len(values) != len(self.ordering) or direction not in ("next", "previous"):
+			return None, None
+		return values, direction
+
+
+class KeysetPaginationMixin:
+	"""
+	Mixin for ListViews, to paginate with a KeysetPaginator instead of page numbers.
+	The page's cursor is read from the "cursor" GET parameter.
+	"""
+	keyset_ordering = None
+	keyset_approximate_count = False
+	cursor_kwarg = "cursor"
+
+	def get_keyset_ordering(self):
+		return self.keyset_ordering
+
+	def paginate_queryset(self, queryset, page_size):
+		paginator = KeysetPaginator(
+			queryset, page_size, self.get_keyset_ordering(), approximate_count=self.keyset_approximate_count
+		)
+		page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+		return paginator, page, page.object_list, page.has_other_pages()
@@ -1,3 +1,5 @@
+import sys
+from copy import deepcopy
 from pathlib import Path
 from environs import Env
 from django.contrib.messages import constants as messages
@@ -47,6 +49,7 @@ INSTALLED_APPS = [
 	"library",
 	"members",
 	"blog",
+	"api",
 	"phylactery",
 ]
 
@@ -54,6 +57,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
 	"django.middleware.security.SecurityMiddleware",
 	"whitenoise.middleware.WhiteNoiseMiddleware",  # WhiteNoise
+	"phylactery.db_routing.PrimaryPinningMiddleware",
 	"django.contrib.sessions.middleware.SessionMiddleware",
 	"django.middleware.common.CommonMiddleware",
 	"debug_toolbar.middleware.DebugToolbarMiddleware",  # Django Debug Toolbar
@@ -63,6 +67,7 @@ MIDDLEWARE = [
 	"django.middleware.clickjacking.XFrameOptionsMiddleware",
 	"allauth.account.middleware.AccountMiddleware",  # django-allauth
 	"accounts.middleware.UserToMemberMiddleware",
+	"accounts.middleware.LoggedInCookieMiddleware",
 ]
 
 # https://docs.djangoproject.com/en/dev/ref/settings/#root-urlconf
@@ -97,9 +102,47 @@ DATABASES = {
 		"PASSWORD": "djangoiscool",
 		"HOST": "127.0.0.1",  # set in docker-compose.yml
 		"PORT": 5432,  # default postgres port
+		# Check that connections are still alive before using them (with the pool, before handing them out).
+		"CONN_HEALTH_CHECKS": True,
+		"OPTIONS": {},
 	}
 }
 
+# Rather than opening a new connection (and going through the whole handshake) for every request or task,
+# each process keeps a pool of open connections to Postgres. Pools aren't shared between processes,
+# so the total is (number of uWSGI workers + Celery worker processes) * max size, which has to stay under
+# Postgres' max_connections. uWSGI workers handle one request at a time, so they don't need many.
+# https://docs.djangoproject.com/en/5.1/ref/databases/#connection-pool
+if env.bool("DATABASE_POOL", True):
+	DATABASES["default"]["OPTIONS"]["pool"] = {
+		"min_size": env.int("DATABASE_POOL_MIN_SIZE", 1),
+		"max_size": env.int("DATABASE_POOL_MAX_SIZE", 2),
+		# How long to wait for a free connection before giving up, in seconds.
+		"timeout": env.float("DATABASE_POOL_TIMEOUT", 10),
+		# Connections are replaced after this many seconds, and closed after being idle for max_idle.
+		"max_lifetime": env.float("DATABASE_POOL_MAX_LIFETIME", 60 * 30),
+		"max_idle": env.float("DATABASE_POOL_MAX_IDLE", 60 * 5),
+	}
+# Read-only catalogue and reporting queries can go to a read replica of the database, if there is one.
+# See phylactery/db_routing.py.
+if env.str("DATABASE_REPLICA_HOST", ""):
+	DATABASES["replica"] = {
+		**DATABASES["default"],
+		"HOST": env.str("DATABASE_REPLICA_HOST"),
+		"PORT": env.int("DATABASE_REPLICA_PORT", DATABASES["default"]["PORT"]),
+		"NAME": env.str("DATABASE_REPLICA_NAME", DATABASES["default"]["NAME"]),
+		"OPTIONS": deepcopy(DATABASES["default"]["OPTIONS"]),
+		# Tests read the replica's data from the test database, rather than a separate test replica.
+		"TEST": {"MIRROR": "default"},
+	}
+DATABASE_ROUTERS = ["phylactery.db_routing.ReplicaRouter"]
+# After a session writes anything, it reads from the primary for this many seconds, to allow for replication lag.
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", 5)
+
+# Celery worker processes run one task at a time, so they get their own (smaller) pool size.
+# See phylactery/celery.py.
+CELERY_DATABASE_POOL_MAX_SIZE = env.int("CELERY_DATABASE_POOL_MAX_SIZE", 1)
+
 # https://docs.djangoproject.com/en/dev/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
 	{
@@ -141,19 +184,36 @@ STATIC_URL = "/static/"
 # https://docs.djangoproject.com/en/dev/ref/contrib/staticfiles/#std:setting-STATICFILES_DIRS
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
+# Static pages are pre-rendered into this directory by "manage.py prerender_pages".
+PRERENDERED_PAGES_ROOT = env.path("PRERENDERED_PAGES_ROOT", BASE_DIR / "prerendered")
+# If enabled, WhiteNoise serves the pre-rendered pages directly, without touching Django.
+# (In production, nginx serves them instead, so this is only needed without it.)
+if env.bool("SERVE_PRERENDERED_PAGES", False):
+	WHITENOISE_ROOT = PRERENDERED_PAGES_ROOT
+	WHITENOISE_INDEX_FILE = True
+
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
 
 # https://whitenoise.readthedocs.io/en/latest/django.html
 STORAGES = {
 	"default": {
-		"BACKEND": "django.core.files.storage.FileSystemStorage",
+		# Names uploads by their content, so they can be cached forever. See phylactery/storage.py.
+		"BACKEND": "phylactery.storage.ContentHashStorage",
 	},
 	"staticfiles": {
 		"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
 	},
 }
 
+# Pages shown to anonymous users (e.g. the home page) are cached for at most this many seconds.
+# They are also invalidated whenever the content they show changes.
+PUBLIC_PAGE_CACHE_TIMEOUT = env.int("PUBLIC_PAGE_CACHE_TIMEOUT", 60 * 60)
+
+# If enabled, the read-only library catalogue pages use async views (see library/async_views.py).
+# Only worth turning on when the site is served over ASGI - see the README.
+ASYNC_CATALOGUE_VIEWS = env.bool("ASYNC_CATALOGUE_VIEWS", False)
+
 # Messages
 MESSAGE_TAGS = {
 	messages.INFO: 'alert-info',
@@ -171,6 +231,19 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = {"bootstrap5"}
 # https://docs.djangoproject.com/en/dev/ref/settings/#email-backend
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
+# Mass emails (e.g. blog posts to mailing lists) are sent in batches,
+# each batch over a single connection, with a pause in between batches.
+EMAIL_BATCH_SIZE = env.int("EMAIL_BATCH_SIZE", 50)
+EMAIL_BATCH_DELAY = env.float("EMAIL_BATCH_DELAY", 5.0)
+# Emails to mailing lists that fail are retried individually (see send_single_email_task).
+# Emails that are still marked as sending after this many seconds are assumed to belong to a worker
+# that died part-way, and are sent again, until they have been tried EMAIL_DELIVERY_MAX_ATTEMPTS times.
+# This should be longer than send_single_email_task takes to run out of retries.
+EMAIL_DELIVERY_CLAIM_TIMEOUT = env.int("EMAIL_DELIVERY_CLAIM_TIMEOUT", 60 * 60)
+EMAIL_DELIVERY_MAX_ATTEMPTS = env.int("EMAIL_DELIVERY_MAX_ATTEMPTS", 3)
+# Borrowers with overdue library items are reminded about them at most this often.
+OVERDUE_REMINDER_INTERVAL_DAYS = env.int("OVERDUE_REMINDER_INTERVAL_DAYS", 7)
+
 # django-debug-toolbar
 # https://django-debug-toolbar.readthedocs.io/en/latest/installation.html
 # https://docs.djangoproject.com/en/dev/ref/settings/#internal-ips
@@ -224,6 +297,31 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Australia/Perth'
 
 REDIS_HOST = "localhost"
+# The most connections each process will open to Redis at once.
+REDIS_MAX_CONNECTIONS = env.int("REDIS_MAX_CONNECTIONS", 10)
+# How long to wait for Redis to connect or answer, in seconds, before giving up.
+REDIS_SOCKET_TIMEOUT = env.float("REDIS_SOCKET_TIMEOUT", 1.0)
+# The cache is shared by every web worker, Celery worker and management command, through Redis,
+# so that invalidating a cached page (see phylactery/caching.py) invalidates it everywhere.
+# A per-process cache would leave the other processes serving stale pages.
+CACHES = {
+	"default": {
+		"BACKEND": "django.core.cache.backends.redis.RedisCache",
+		# Database 1, to keep it apart from Celery's queues.
+		"LOCATION": env.str("CACHE_URL", f"redis://{REDIS_HOST}:6379/1"),
+	}
+}
+if len(sys.argv) > 1 and sys.argv[1] == "test":
+	# The tests get a cache of their own, in memory, so they don't need Redis,
+	# and clearing it between tests never clears a cache that's in use.
+	CACHES = {
+		"default": {
+			"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+		}
+	}
+# If True, messages for the Discord bot are published to Redis straight from the web process,
+# instead of queueing a Celery task to publish them.
+DISCORD_PUBLISH_DIRECTLY = env.bool("DISCORD_PUBLISH_DIRECTLY", False)
 
 # Import settings from Docker
 from .settings_override import *
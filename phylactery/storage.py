@@ -0,0 +1,52 @@
+import hashlib
+import os
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentHashStorage(FileSystemStorage):
+	"""
+	File storage that names files by a hash of their contents, e.g. library/item_images/catan.3f2a9c1e5b7d8a10.jpg.
+
+	A URL only ever points at one version of a file, so browsers can cache media forever (see entrypoint.sh).
+	Uploading new contents gives a new name, and saving the same contents again reuses the existing file.
+	Files are never overwritten or deleted when they're replaced - the delete_orphaned_media command
+	cleans them up once nothing refers to them any more.
+	"""
+	hash_length = 16
+
+	def get_content_hash(self, content):
+		hasher = hashlib.sha256()
+		for chunk in content.chunks():
+			hasher.update(chunk)
+		content.seek(0)
+		return hasher.hexdigest()[:self.hash_length]
+
+	def get_hashed_name(self, name, content, max_length=None):
+		root, extension = os.path.splitext(name)
+		suffix = f".{self.get_content_hash(content)}{extension}"
+		if max_length is not None and len(root) + len(suffix) > max_length:
+			# Shorten the name before adding the hash. Otherwise Storage would shorten it
+			# by cutting into the hash and adding a random suffix, so it wouldn't be named by its contents any more.
+			directory, file_root = os.path.split(root)
+			file_root = file_root[:max_length - len(suffix) - len(root) + len(file_root)]
+			if not file_root:
+				raise SuspiciousFileOperation(
+					f'Storage can not find an available filename for "{name}". '
+					"Please make sure that the corresponding file field allows sufficient \"max_length\"."
+				)
+			root = os.path.join(directory, file_root)
+		return f"{root}{suffix}"
+
+	def save(self, name, content, max_length=None):
+		if name is None:
+			name = content.name
+		if not hasattr(content, "chunks"):
+			content = File(content, name)
+		name = self.get_hashed_name(name, content, max_length)
+		if self.exists(name):
+			# We already have this exact file.
+			return name
+		return super().save(name, content, max_length=max_length)
@@ -1,9 +1,9 @@
-from markdown2 import Markdown
-
 from django import template
 from django.template.defaultfilters import stringfilter
 from django.utils.safestring import mark_safe
 
+from phylactery.markdown_renderer import render_markdown_to_html
+
 register = template.Library()
 
 
@@ -13,13 +13,11 @@ def render_markdown(raw_text: str):
 	"""
 	A template tag.
 	Uses the markdown2 library to convert markdown formatted text into html.
+	Rendered html is cached, so repeated renders of the same text are cheap.
 	
 	Usage in a template:
 	{% load markdown_extras %}
 	{{ text_to_render|render_markdown }}
 	"""
-	markdown_renderer = Markdown(
-		safe_mode="escape"
-	)
-	output_html = markdown_renderer.convert(raw_text)
+	output_html = render_markdown_to_html(raw_text)
 	return mark_safe(output_html)
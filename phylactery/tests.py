@@ -0,0 +1,246 @@
+import shutil
+import tempfile
+import time
+from smtplib import SMTPRecipientsRefused
+from unittest.mock import patch
+
+import fakeredis
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from redis.exceptions import TimeoutError as RedisTimeoutError
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connections
+from django.http import HttpResponse
+from django.test import TestCase, SimpleTestCase, AsyncRequestFactory, RequestFactory, override_settings
+from django.views import View
+
+from phylactery.caching import ConditionalGetMixin
+from phylactery.celery import resize_database_pool
+from phylactery.communication import discord
+from phylactery.storage import ContentHashStorage
+from phylactery.db_routing import (
+	ReplicaRouter, PrimaryPinningMiddleware, PRIMARY_PINNED_COOKIE_NAME, read_from_replica, get_replica_database
+)
+from phylactery.communication.email import send_email_batch
+
+
+class EmailBatchTests(TestCase):
+	def setUp(self):
+		self.email_address_list = [f"member{n}@example.com" for n in range(5)]
+
+	def test_sends_one_message_per_recipient(self):
+		failed = send_email_batch(self.email_address_list, subject="Test", message="Hello", html_message="<p>Hello</p>")
+		self.assertEqual(failed, [])
+		self.assertEqual(len(mail.outbox), 5)
+		self.assertEqual([message.to for message in mail.outbox], [[address] for address in self.email_address_list])
+
+	def test_failed_recipients_are_returned(self):
+		refused_address = self.email_address_list[1]
+		original_send_messages = EmailBackend.send_messages
+
+		def refusing_send_messages(backend, messages):
+			if messages[0].to == [refused_address]:
+				raise SMTPRecipientsRefused({refused_address: (550, b"No such user")})
+			return original_send_messages(backend, messages)
+
+		with patch.object(EmailBackend, "send_messages", refusing_send_messages):
+			failed = send_email_batch(self.email_address_list, subject="Test", message="Hello")
+		self.assertEqual(failed, [refused_address])
+		self.assertEqual(len(mail.outbox), 4)
+
+
+class DiscordPublishTests(TestCase):
+	def setUp(self):
+		self.fake_redis = fakeredis.FakeRedis(decode_responses=True)
+		self.pubsub = self.fake_redis.pubsub()
+		self.pubsub.subscribe("discord:library:ping", "discord:door:ping")
+		patcher = patch("phylactery.communication.discord.get_redis", return_value=self.fake_redis)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def get_published_messages(self):
+		published = []
+		while (message := self.pubsub.get_message()) is not None:
+			if message["type"] == "message":
+				published.append((message["channel"], message["data"]))
+		return published
+
+	def test_send_directly(self):
+		with patch.object(discord.send_to_discord, "delay") as send_to_discord_delay:
+			discord.send("discord:door:ping", "The door is open!", direct=True)
+		send_to_discord_delay.assert_not_called()
+		self.assertEqual(self.get_published_messages(), [("discord:door:ping", "The door is open!")])
+
+	def test_falls_back_to_celery_when_redis_times_out(self):
+		with (
+			patch.object(self.fake_redis, "publish", side_effect=RedisTimeoutError("Timeout connecting to server")),
+			patch.object(discord.send_to_discord, "delay") as send_to_discord_delay,
+		):
+			discord.send("discord:door:ping", "The door is open!", direct=True)
+		send_to_discord_delay.assert_called_once_with(
+			redis_channel_name="discord:door:ping", message="The door is open!"
+		)
+
+	def test_send_many_throughput(self):
+		# fakeredis answers instantly, so add a round trip's worth of latency to every request sent to it,
+		# like a real Redis over the network.
+		round_trip = 0.002
+		connection_class = self.fake_redis.connection_pool.connection_class
+		original_send_packed_command = connection_class.send_packed_command
+		round_trips = []
+		# Connect first, so the connection's handshake isn't counted.
+		self.fake_redis.ping()
+
+		def send_packed_command(connection, *args, **kwargs):
+			round_trips.append(1)
+			time.sleep(round_trip)
+			return original_send_packed_command(connection, *args, **kwargs)
+
+		messages = [
+			("discord:library:ping" if n % 2 else "discord:door:ping", f"Message {n}")
+			for n in range(200)
+		]
+		with patch.object(connection_class, "send_packed_command", send_packed_command):
+			start = time.perf_counter()
+			discord.send_many(messages, direct=True)
+			pipelined_time = time.perf_counter() - start
+			pipelined_round_trips = len(round_trips)
+
+			start = time.perf_counter()
+			for redis_channel_name, message in messages:
+				discord.send(redis_channel_name, message, direct=True)
+			individual_time = time.perf_counter() - start
+
+		self.assertEqual(self.get_published_messages(), messages + messages)
+		self.assertEqual(pipelined_round_trips, 1)
+		self.assertEqual(len(round_trips), 1 + len(messages))
+		# With a round trip per message, publishing one at a time can't get anywhere near the pipeline's throughput.
+		pipelined_throughput = len(messages) / pipelined_time
+		individual_throughput = len(messages) / individual_time
+		self.assertGreater(pipelined_throughput, 10 * individual_throughput)
+
+
+class RedisPoolTests(SimpleTestCase):
+	@override_settings(REDIS_SOCKET_TIMEOUT=0.5)
+	def test_pool_has_timeouts(self):
+		with patch.object(discord, "redis_connection_pool", None):
+			connection_kwargs = discord.get_redis().connection_pool.connection_kwargs
+		self.assertEqual(connection_kwargs["socket_connect_timeout"], 0.5)
+		self.assertEqual(connection_kwargs["socket_timeout"], 0.5)
+
+
+class DatabasePoolTests(TestCase):
+	@override_settings(CELERY_DATABASE_POOL_MAX_SIZE=1)
+	def test_celery_worker_pool_resized(self):
+		connection = connections["default"]
+		pool_options = {"min_size": 2, "max_size": 4, "timeout": 10}
+		with (
+			patch.dict(connection.settings_dict["OPTIONS"], {"pool": pool_options}),
+			patch.object(connection, "close_pool") as close_pool,
+		):
+			resize_database_pool()
+		close_pool.assert_called_once()
+		self.assertEqual(pool_options, {"min_size": 1, "max_size": 1, "timeout": 10})
+
+
+@override_settings(REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+	def setUp(self):
+		patcher = patch("phylactery.db_routing.replica_configured", return_value=True)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.router = ReplicaRouter()
+	
+	def test_reads_from_replica_only_when_asked(self):
+		self.assertEqual(self.router.db_for_read(None), "default")
+		with read_from_replica():
+			self.assertEqual(self.router.db_for_read(None), "replica")
+		self.assertEqual(self.router.db_for_write(None), "default")
+	
+	def test_no_replica_configured(self):
+		with patch("phylactery.db_routing.replica_configured", return_value=False), read_from_replica():
+			self.assertEqual(self.router.db_for_read(None), "default")
+	
+	def test_reads_own_writes(self):
+		with read_from_replica():
+			self.router.db_for_write(None)
+			self.assertEqual(self.router.db_for_read(None), "default")
+			# Nested blocks still know about the write.
+			with read_from_replica():
+				self.assertEqual(self.router.db_for_read(None), "default")
+		# Writes outside a request or replica block aren't remembered.
+		self.router.db_for_write(None)
+		with read_from_replica():
+			self.assertEqual(self.router.db_for_read(None), "replica")
+	
+	def test_session_pinned_after_write(self):
+		request_factory = RequestFactory()
+		
+		def write_then_read(request):
+			self.router.db_for_write(None)
+			return HttpResponse(get_replica_database())
+		
+		response = PrimaryPinningMiddleware(write_then_read)(request_factory.post("/"))
+		self.assertEqual(response.content, b"default")
+		self.assertIn(PRIMARY_PINNED_COOKIE_NAME, response.cookies)
+		
+		def read(request):
+			return HttpResponse(get_replica_database())
+		
+		# The next request, with the cookie, is pinned to the primary.
+		request = request_factory.get("/")
+		request.COOKIES[PRIMARY_PINNED_COOKIE_NAME] = response.cookies[PRIMARY_PINNED_COOKIE_NAME].value
+		response = PrimaryPinningMiddleware(read)(request)
+		self.assertEqual(response.content, b"default")
+		self.assertNotIn(PRIMARY_PINNED_COOKIE_NAME, response.cookies)
+		
+		# Without it, it reads from the replica.
+		response = PrimaryPinningMiddleware(read)(request_factory.get("/"))
+		self.assertEqual(response.content, b"replica")
+	
+	async def test_session_pinned_after_write_async(self):
+		async def write_then_read(request):
+			# The async ORM runs queries in a thread, which still counts as a write by this request.
+			await sync_to_async(self.router.db_for_write)(None)
+			return HttpResponse(get_replica_database())
+		
+		middleware = PrimaryPinningMiddleware(write_then_read)
+		self.assertTrue(iscoroutinefunction(middleware))
+		response = await middleware(AsyncRequestFactory().post("/"))
+		self.assertEqual(response.content, b"default")
+		self.assertIn(PRIMARY_PINNED_COOKIE_NAME, response.cookies)
+
+
+class ContentHashStorageTests(SimpleTestCase):
+	def setUp(self):
+		location = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, location)
+		self.storage = ContentHashStorage(location=location)
+	
+	def test_names_by_content(self):
+		first = self.storage.save("images/catan.jpg", ContentFile(b"first"))
+		self.assertRegex(first, r"^images/catan\.[0-9a-f]{16}\.jpg$")
+		# The same contents reuse the same file, and different contents get a new one.
+		self.assertEqual(self.storage.save("images/catan.jpg", ContentFile(b"first")), first)
+		second = self.storage.save("images/catan.jpg", ContentFile(b"second"))
+		self.assertNotEqual(second, first)
+		with self.storage.open(first) as file:
+			self.assertEqual(file.read(), b"first")
+	
+	def test_long_names_keep_their_hash(self):
+		name = self.storage.save(f"images/{'x' * 120}.jpg", ContentFile(b"first"), max_length=100)
+		self.assertEqual(len(name), 100)
+		self.assertRegex(name, r"^images/x+\.[0-9a-f]{16}\.jpg$")
+		# Saving it again still finds the same file.
+		self.assertEqual(self.storage.save(f"images/{'x' * 120}.jpg", ContentFile(b"first"), max_length=100), name)
+		with self.assertRaises(SuspiciousFileOperation):
+			self.storage.save(f"{'d' * 90}/catan.jpg", ContentFile(b"first"), max_length=100)
+
+
+class ConditionalGetMixinTests(SimpleTestCase):
+	def test_missing_last_modified_fails_at_definition(self):
+		with self.assertRaisesMessage(ImproperlyConfigured, "must implement get_last_modified()"):
+			class NoLastModifiedView(ConditionalGetMixin, View):
+				pass
@@ -17,6 +17,7 @@ urlpatterns = [
 	path("library/", include("library.urls")),
 	path("blog/", include("blog.urls")),
 	path("controlpanel/", include("control_panel.urls")),
+	path("api/v1/", include("api.urls")),
 	path("", include("pages.urls")),
 ]
 
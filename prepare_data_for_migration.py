@@ -1,32 +1,101 @@
+import argparse
+import gzip
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from collections import defaultdict
-from datetime import datetime
+
+from pages.legacy_dump import get_model_filename, iter_json_entries, open_dump
 
 base_directory = Path()
 
 
-# Helper utility - takes the old phylactery database, and converts it into a few json files so data can be migrated.
-def split_json(db_json_filename, output_directory):
-	models = defaultdict(list)
+# Helper utility - takes the old phylactery database, and splits it into a file per model so data can be migrated.
+# Each file is JSON Lines (one entry per line), named <model>.jsonl, or <model>.jsonl.gz if compressed.
+# The dump is read a piece at a time, so it never has to fit in memory. Writing (and compressing) the
+# files can be handed off to a pool of processes, while this one carries on reading.
+
+
+def write_entries(filename, entries, append, compress):
+	"""
+	Writes entries to the end of a JSON Lines file (or starts a new one).
+	Gzip files can be appended to - each write just adds another member to the file, which gzip reads straight through.
+	"""
+	mode = "ab" if append else "wb"
+	data = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries).encode("utf-8")
+	if compress:
+		with gzip.open(filename, mode, compresslevel=6) as outfile:
+			outfile.write(data)
+	else:
+		with open(filename, mode) as outfile:
+			outfile.write(data)
+	return len(entries)
+
+
+def split_json(db_json_filename, output_directory, compress=False, processes=None, chunk_size=5000):
+	"""
+	Splits the dump into a JSON Lines file per model, in output_directory.
+	Entries are written chunk_size at a time. If processes is given, chunks are written by a pool of that many
+	processes - only one chunk per model is written at a time, so each file keeps the order of the dump.
+	Returns the number of entries of each model.
+	"""
+	output_directory = Path(output_directory)
 	output_directory.mkdir(parents=True, exist_ok=True)
-	
-	with open(db_json_filename, "r") as json_infile:
-		json_data = json.load(json_infile)
-		
-	for entry in json_data:
-		model_type = entry["model"]
-		models[model_type].append(entry)
-	
-	for model_type in models.keys():
-		with open(output_directory / f"{model_type}.json", "w") as json_outfile:
-			json_outfile.write(f"// {datetime.today()} \n")
-			json.dump(
-				models[model_type],
-				json_outfile,
-				indent=2,
-			)
+	pool = ProcessPoolExecutor(processes) if processes else None
+	pending = {}
+	counts = {}
+	buffers = {}
+
+	def flush(model_type):
+		entries = buffers.pop(model_type)
+		append = model_type in counts
+		counts[model_type] = counts.get(model_type, 0) + len(entries)
+		filename = output_directory / get_model_filename(model_type, compress)
+		if pool is None:
+			write_entries(filename, entries, append, compress)
+			return
+		if model_type in pending:
+			# Wait for the last chunk of this model, so the chunks are written in order.
+			# This also stops us reading too far ahead of the writers.
+			pending[model_type].result()
+		pending[model_type] = pool.submit(write_entries, filename, entries, append, compress)
+
+	try:
+		with open_dump(db_json_filename) as json_infile:
+			for entry in iter_json_entries(json_infile):
+				model_type = entry["model"]
+				buffers.setdefault(model_type, []).append(entry)
+				if len(buffers[model_type]) >= chunk_size:
+					flush(model_type)
+		for model_type in list(buffers):
+			flush(model_type)
+		for future in pending.values():
+			future.result()
+	finally:
+		if pool is not None:
+			pool.shutdown(cancel_futures=True)
+	return counts
 
 
 if __name__ == "__main__":
-	split_json("dbcopy20240906.json", base_directory / "pretty_models")
+	parser = argparse.ArgumentParser(description="Splits a dump of the old database into a JSON Lines file per model.")
+	parser.add_argument("dump", nargs="?", default="dbcopy20240906.json", help="The dump to split (may be gzipped).")
+	parser.add_argument("output_directory", nargs="?", default=base_directory / "pretty_models", type=Path)
+	parser.add_argument("--gzip", action="store_true", help="Compress the output files.")
+	parser.add_argument("--processes", type=int, default=None, help="Write the files with a pool of this many processes.")
+	parser.add_argument("--chunk-size", type=int, default=5000, help="How many entries to write at a time.")
+	arguments = parser.parse_args()
+
+	started = time.perf_counter()
+	model_counts = split_json(
+		arguments.dump,
+		arguments.output_directory,
+		compress=arguments.gzip,
+		processes=arguments.processes,
+		chunk_size=arguments.chunk_size,
+	)
+	elapsed = time.perf_counter() - started
+	for model, count in sorted(model_counts.items()):
+		print(f"{model}: {count}")
+	total = sum(model_counts.values())
+	print(f"Split {total} entries into {len(model_counts)} files in {elapsed:.1f}s ({total / max(elapsed, 1e-6):.0f} entries/s).")
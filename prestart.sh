@@ -1,3 +1,4 @@
 #!/usr/bin/env sh
 python manage.py collectstatic --noinput
-python manage.py migrate --noinput
\ No newline at end of file
+python manage.py migrate --noinput
+python manage.py prerender_pages --clear
\ No newline at end of file
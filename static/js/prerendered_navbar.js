@@ -0,0 +1,15 @@
+// Pre-rendered pages always show the logged out navbar.
+// If the user is logged in, swap in their own navbar instead.
+(() => {
+	const navbarUrl = document.currentScript.dataset.navbarUrl;
+	const isLoggedIn = document.cookie.split("; ").some((cookie) => cookie.startsWith("logged_in="));
+	if (!isLoggedIn) {
+		return;
+	}
+	fetch(navbarUrl, {credentials: "same-origin"})
+		.then((response) => response.ok ? response.text() : Promise.reject(response.status))
+		.then((html) => {
+			document.getElementById("navbar-user-menu").outerHTML = html;
+		})
+		.catch(() => {});
+})();